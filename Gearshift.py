@@ -19,19 +19,25 @@ credits = "Reads the clutch and shifter from rF2 using\n" \
  "Inspired by http://www.richardjackett.com/grindingtranny\n" \
  "I borrowed Grind_default.wav from there to make the noise of the grinding gears.\n\n"
 
-from threading import Timer
-from winsound import PlaySound, SND_FILENAME, SND_LOOP, SND_ASYNC
-from tkinter import messagebox
+import threading
+import time
 
 try:
     from configIni import Config, configFileName
 except: # It's a rFactory component
     from gearshift.configIni import Config, configFileName
 import pyDirectInputKeySend.directInputKeySend as directInputKeySend
-from readJSONfile import Json
 from pyDirectInputKeySend.directInputKeySend import DirectInputKeyCodeTable, rfKeycodeToDIK
-from mockMemoryMap import gui
 from memoryMapInputs import Controls
+from timerWheel import TimerService
+import stateMachine
+# blackBox, damage, gearRatios, readJSONfile and the GUI are imported
+# where they're used, only if they're used, to get to the first tick sooner
+import eventQueue
+import latency
+import scheduler
+import keySender
+import sound
 
 # Main config variables, loaded from gearshift.ini
 mockInput      =    False   # If True then use mock input
@@ -50,37 +56,50 @@ reshift =           True    # If True then neutral has to be selected before
 global debug
 debug           =   0       # 0, 1, 2 or 3
 neutralButton   =   None  # The key used to force neutral, whatever the shifter says
-graunchWav = None
+graunchWav = None   # the decoded 'wav file', a sound.Sound
 controller_file = None
+neutralOutput   =   'keys'  # or 'shared memory', the plugin's HWControl buffer
 
 # Gear change events
-clutchDisengage         = 'clutchDisengage'
-clutchEngage            = 'clutchEngage'
-gearSelect              = 'gearSelect'
-gearDeselect            = 'gearDeselect'
-graunchTimeout          = 'graunchTimeout'  # Memory-mapped mode
-smStop                  = 'stop'  # Stop the state machine
+clutchDisengage         = stateMachine.CLUTCH_DISENGAGE
+clutchEngage            = stateMachine.CLUTCH_ENGAGE
+gearSelect              = stateMachine.GEAR_SELECT
+gearDeselect            = stateMachine.GEAR_DESELECT
+graunchTimeout          = stateMachine.GRAUNCH_TIMEOUT  # Memory-mapped mode
+smStop                  = stateMachine.STOP  # Stop the state machine
 
 #globals
-gearState = 'neutral' # TBD
-
 ClutchPrev = 2  # Active states are 0 and 1 so 2 is "unknown"
 graunch_o = None
+gearSM = None   # the GearStateMachine
+blackBox_o = None
+recorder_o = None   # SessionRecorder
+damage_o = None
+ratios_o = None    # GearRatios
+clutchSampler_o = None  # ClutchSampler, if [clutch] sample rate is set
+latency_o = latency.LatencyTracker()   # read to Neutral key times
+timerService = TimerService()  # One thread for all the SetTimer() timers
+runtime_o = None    # AsyncRuntime when [scheduler] runtime = asyncio
+watcher_o = None    # lifecycle.RF2Watcher, if [scheduler] watch rf2 is set
+# Sends the keys, main() gives it a thread of its own
+keys_o = keySender.KeySender(keySender.DirectInputKeys(directInputKeySend),
+                             synchronous=True)
+sound_o = sound.NullSound()    # set by main() from gearshift.ini
 
 #################################################################################
 # AHK replacement fns
 def SetTimer(callback, mS):
+  """ Call callback after mS, returns a handle that can cancel() it """
   if mS > 0:
-    timer = Timer(mS / 1000, callback)
-    timer.start()
-  else:
-    pass # TBD delete timer?
+    return timerService.schedule(mS / 1000, callback)
+  return None
 
-def SoundPlay(soundfile):
-  PlaySound(soundfile, SND_FILENAME|SND_LOOP|SND_ASYNC)
+def SoundPlay(sound_):
+  if sound_: # None when replaying
+    sound_o.play(sound_)
 
 def SoundStop():
-  PlaySound(None, SND_FILENAME)
+  sound_o.stop()
 
 def msgBox(str):
   print(str)
@@ -96,39 +115,72 @@ def quit(errorCode):
 class graunch:
   def __init__(self):
         self.graunching = False
+        self.timers = []  # handles of pending graunch1/2/3 timers
+        # graunchStart/Stop run on the event queue's thread, the pulses on
+        # the timer thread: graunching and timers only change under the lock
+        # so a pulse can't outlive graunchStop()
+        self.lock = threading.RLock()
+        self.blackBox = None  # BlackBox to dump when graunching starts
+        self.controls = None  # Controls, for the revs when graunching starts
+        self.synth = None     # GraunchSynth, noise to match the revs
+
+  def setTimer(self, callback, mS):
+        # Keep the handle so graunchStop() can cancel it
+        self.timers = [t for t in self.timers if t.pending()]
+        self.timers.append(SetTimer(callback, mS))
+
+  def cancelTimers(self):
+        for timer in self.timers:
+          timer.cancel()
+        self.timers = []
+
   def graunchStart(self):
         # Start the graunch noise and sending "Neutral"
+        latency_o.mark(latency.GRAUNCH_START)
         # Start the noise
         global graunchWav
-        SoundPlay(graunchWav)
-        self.graunching = True
-        self.graunch2()
+        sound_ = graunchWav
+        if self.synth and self.controls:
+          snapshot = self.controls.snapshot
+          sound_ = self.synth.sound(snapshot.engineRPM - snapshot.clutchRPM)
+        SoundPlay(sound_)
+        if self.blackBox:
+          self.blackBox.trigger()
+        with self.lock:
+          self.graunching = True
+          self.graunch2()
         if debug >= 2:
             msgBox('GRAUNCH!')
 
 
   def graunchStop(self):
-        if self.graunching:
-          SoundStop()  # stop the noise
-        self.graunching = False
-        self.graunch1()
+        with self.lock:
+          if self.graunching:
+            SoundStop()  # stop the noise
+          self.graunching = False
+          self.cancelTimers()
+          self.graunch1()
 
 
   def graunch1(self):
         # Send the "Neutral" key release
-        directInputKeySend.ReleaseKey(neutralButton)
-        if self.graunching:
-          SetTimer(self.graunch2, 20)
+        with self.lock:
+          keys_o.release(neutralButton)
+          if self.graunching:
+            self.setTimer(self.graunch2, 20)
 
 
   def graunch2(self):
-      if self.graunching:
-        # Send the "Neutral" key press
-        directInputKeySend.PressKey(neutralButton)
-        SetTimer(self.graunch3, 3000)
-        SetTimer(self.graunch1, 20) # Ensure neutralButton is released
-        if debug >= 1:
-            directInputKeySend.PressReleaseKey('DIK_G')
+      with self.lock:
+        if self.graunching:
+          # Send the "Neutral" key press
+          keys_o.press(neutralButton)
+          latency_o.mark(latency.NEUTRAL_KEY)
+          self.setTimer(self.graunch3,
+                       int(stateMachine.GRAUNCH_TIMEOUT_SECONDS * 1000))
+          self.setTimer(self.graunch1, 20) # Ensure neutralButton is released
+          if debug >= 1:
+              keys_o.pressRelease('DIK_G')
 
   def graunch3(self):
       """ Shared memory.
@@ -138,7 +190,10 @@ class graunch:
       If SM is still in neutral (gearSelect hasn't happened) when this timer
       expires then player has moved shifter to neutral
       """
-      gearStateMachine(graunchTimeout)
+      with self.lock:
+        if not self.graunching:   # stopped as the timer fired
+          return
+      gearStateMachine(graunchTimeout, eventQueue.TIMEOUT)
 
   def isGraunching(self):
     return self.graunching
@@ -146,136 +201,66 @@ class graunch:
 
 ######################################################################
 
-def gearStateMachine(event):
-    global gearState
-    global graunch_o
-    global debug
-
-    # Gear change states
-    neutral                = 'neutral'
-    clutchDown             = 'clutchDown'
-    waitForDoubleDeclutchUp= 'waitForDoubleDeclutchUp'
-    clutchDownGearSelected = 'clutchDownGearSelected'
-    inGear                 = 'inGear'
-    graunching             = 'graunching'
-    graunchingClutchDown   = 'graunchingClutchDown'
-    neutralKeySent         = 'neutralKeySent'
-
-    if debug >= 3:
-        msgBox('gearState %s event %s' % (gearState, event))
-    # event check (debug)
-    if   event == clutchDisengage:
-      pass
-    elif event == clutchEngage:
-      pass
-    elif event == gearSelect:
-      pass
-    elif event == gearDeselect:
-      pass
-    elif event == graunchTimeout:
-      pass
-    elif event == smStop:
-      graunch_o.graunchStop()
-      gearState = neutral
-    else:
-            msgBox('gearStateMachine() invalid event %s' % event)
-
-    if    gearState == neutral:
-        if event == clutchDisengage:
-                gearState = clutchDown
-                if debug >= 1:
-                    directInputKeySend.PressKey('DIK_D')
-        elif event == gearSelect:
-                graunch_o.graunchStart()
-                gearState = graunching
-        elif event == graunchTimeout:
-                graunch_o.graunchStop()
-
-    elif gearState == clutchDown:
-        if event == gearSelect:
-                gearState = clutchDownGearSelected
-        elif event == clutchEngage:
-                gearState = neutral
-                if debug >= 1:
-                    directInputKeySend.PressKey('DIK_U')
-
-    elif gearState == waitForDoubleDeclutchUp:
-        if event == clutchEngage:
-                gearState = neutral
-                if debug >= 2:
-                    msgBox('Double declutch spin up the box')
-        elif event == gearSelect:
-                graunch_o.graunchStart()
-                gearState = graunching
-
-    elif gearState == clutchDownGearSelected:
-        if event == clutchEngage:
-                gearState = inGear
-                if debug >= 2:
-                    msgBox('In gear')
-        elif event == gearDeselect:
-                if doubleDeclutch:
-                    gearState = waitForDoubleDeclutchUp
-                else:
-                    gearState = clutchDown
-
-    elif gearState == inGear:
-        if event == gearDeselect:
-                gearState = neutral
-                if debug >= 2:
-                    msgBox('Knocked out of gear')
-        elif event == clutchDisengage:
-                gearState = clutchDownGearSelected
-        elif event == gearSelect: # smashed straight through without neutral.
-                # I don't think this can happen if rF2, only with mock inputs...
-                graunch_o.graunchStart()
-                gearState = graunching
-
-    elif gearState == graunching:
-        if event == clutchDisengage:
-                if reshift == False:
-                        if debug >= 1:
-                            directInputKeySend.PressKey('DIK_R')
-                        gearState = clutchDownGearSelected
-                else:
-                        gearState = graunchingClutchDown
-                graunch_o.graunchStop()
-                if debug >= 1:
-                    directInputKeySend.PressKey('DIK_G')
-        elif event == clutchEngage:
-                graunch_o.graunchStart()   # graunch again
-        elif event == gearDeselect:
-                gearState = neutralKeySent
-        elif event == gearSelect:
-                graunch_o.graunchStop()
-                graunch_o.graunchStart()   # graunch again
-                pass
-
-    elif gearState == neutralKeySent:
-        # rF2 will have put it into neutral but if shifter
-        # still in gear it will have put it back in gear again
-        if event == gearSelect:
-                gearState = graunching
-        elif event == graunchTimeout:
-                # timed out and still not in gear, player has
-                # shifted to neutral
-                gearState = neutral
-                graunch_o.graunchStop()
-
-    elif gearState == graunchingClutchDown:
-        if event == clutchEngage:
-                graunch_o.graunchStart()   # graunch again
-                gearState = graunching
-        elif event == gearDeselect:
-                gearState = clutchDown
-                graunch_o.graunchStop()
-
-    else:
-           msgBox('Bad gearStateMachine() state gearState')
-
-    if gearState != graunching and gearState != neutralKeySent:
-        graunch_o.graunchStop()   # belt and braces - sometimes it gets stuck. REALLY????
+def overRevWarning(gear, predictedRPM):
+    """
+    Damage predicts the engine will over-rev when the clutch comes up:
+    knock it back out of gear before it does
+    """
+    msgBox('Over-rev: %d RPM in gear %d, sending Neutral' % (predictedRPM, gear))
+    keys_o.pressRelease(neutralButton)
+    if blackBox_o:
+      blackBox_o.trigger('over-rev')
 
+def newDamage(controls_o, ignitionButton, gearRatioFile=None):
+    """
+    The damage model fed by controls_o, and the gear ratios it predicts
+    over-revs with (so there's no over-rev warning without damage = 1).
+    ignitionButton is sent when the engine is blown.
+    """
+    global ratios_o
+    global damage_o
+    from damage import Damage
+    from gearRatios import GearRatios
+    ratios_o = GearRatios(gearRatioFile)
+    controls_o.addListener(ratios_o.update)
+    damage_o = Damage(bitePoint=ClutchEngaged,
+                      # Blown engine: switch the ignition off
+                      blown=lambda: keys_o.pressRelease(ignitionButton),
+                      ratios=ratios_o,
+                      overRev=overRevWarning)
+    controls_o.addListener(damage_o.update)
+    return damage_o
+
+def newGearStateMachine(graunch_o):
+    # Using the module's reshift, doubleDeclutch and debug settings
+    return stateMachine.GearStateMachine(graunch_o,
+                                         reshift=reshift,
+                                         doubleDeclutch=doubleDeclutch,
+                                         debug=debug,
+                                         # Press and release, the key sender
+                                         # drops a press of a key already down
+                                         pressKey=lambda key: keys_o.pressRelease(key),
+                                         msgBox=msgBox)
+
+def gearStateMachine(event, source=eventQueue.GEAR):
+    # Events come from Controls, the graunch timers and the clutch sampler,
+    # the event queue hands them to dispatchEvent() one at a time.
+    # False if it was dropped (the queue logs it)
+    return eventQueue_o.put(event, source)
+
+def dispatchEvent(event, source, timestamp):
+    latency_o.mark(latency.DISPATCH)
+    gearSM.dispatch(event)
+
+# Every event goes through it, main() gives it a thread of its own
+eventQueue_o = eventQueue.EventQueue(dispatchEvent, synchronous=True)
+
+def clutchEdge(event, edgeTime):
+    # From the ClutchSampler, already de-bounced
+    if debug >= 2:
+        msgBox('Clutch %s %.1f mS ago' % (stateMachine.eventNames[event],
+                                          (time.perf_counter() - edgeTime) * 1000))
+    gearStateMachine(event, eventQueue.CLUTCH_SAMPLER)
 
 
 def WatchClutch(Clutch):
@@ -288,9 +273,9 @@ def WatchClutch(Clutch):
 
     if ClutchState != ClutchPrev:
         if ClutchState == 0:
-            gearStateMachine(clutchDisengage)
+            gearStateMachine(clutchDisengage, eventQueue.CLUTCH)
         else:
-            gearStateMachine(clutchEngage)
+            gearStateMachine(clutchEngage, eventQueue.CLUTCH)
 
     ClutchPrev = ClutchState
 
@@ -305,25 +290,54 @@ def memoryMapCallback(clutchEvent=None, gearEvent=None, stopEvent=False):
     else:
             gearStateMachine(gearSelect)
   if stopEvent:
-    gearStateMachine(smStop)
+    gearStateMachine(smStop, eventQueue.STOP)
+
+def rF2Started(controls_o):
+  """ RF2Watcher found rF2, start polling again """
+  controls_o.resume()
+  if clutchSampler_o:
+    clutchSampler_o.run(runtime=runtime_o)
+
+def rF2Stopped(controls_o):
+  """ RF2Watcher found rF2 has gone, stop polling until it's back """
+  if clutchSampler_o:
+    clutchSampler_o.stop()
+  controls_o.pause()
 
 def ShowButtons():
   pass
 
 global neutralButtonKeycode
 
-def main():
+def main(soundBackend=None, runtime=None, watchRF2=None):
+  # soundBackend overrides gearshift.ini's sound, e.g. sound.NONE
+  # runtime overrides gearshift.ini's runtime, scheduler.THREADS or ASYNCIO
   global graunch_o
+  global gearSM
+  global blackBox_o
+  global recorder_o
+  global clutchSampler_o
+  global runtime_o
+  global watcher_o
+  global timerService
+  global eventQueue_o
   global debug
   global graunchWav
   global ClutchEngaged
   global controller_file
   global neutralButton
+  global sound_o
+  global keys_o
+  global neutralOutput
 
   config_o = Config()
   debug = config_o.get('miscellaneous', 'debug')
   if not debug: debug = 0
-  graunchWav = config_o.get('miscellaneous', 'wav file')
+  sound_o = sound.newSound(soundBackend or config_o.get('miscellaneous', 'sound'))
+  if isinstance(sound_o, sound.NullSound):
+    graunchWav = None
+  else: # decoded once, not every time it's played
+    graunchWav = sound.loadWav(config_o.get('miscellaneous', 'wav file'))
   mockInput = config_o.get('miscellaneous', 'mock input')
   reshift = config_o.get('miscellaneous', 'reshift') == 1
 
@@ -347,27 +361,119 @@ def main():
       print(_keyCode, end=', ')
     quit(99)
 
+  neutralOutput = config_o.get('miscellaneous', 'neutral output')
+  keys = keySender.DirectInputKeys(directInputKeySend)
+  if neutralOutput == 'shared memory':
+    import hwControl
+    try:
+      keys = hwControl.HWControlKeys(hwControl.HWControl(),
+                                     neutralButton,
+                                     config_o.get('miscellaneous', 'neutral control'),
+                                     fallback=keys)
+    except (OSError, ValueError) as e:
+      print('rF2 Shared Memory hardware control buffer not available (%s), '
+            'sending "%s" instead' % (e, neutralButton))
+      neutralOutput = 'keys'
+  if (runtime or config_o.get('scheduler', 'runtime')) == scheduler.ASYNCIO:
+    from asyncRuntime import AsyncRuntime
+    runtime_o = AsyncRuntime()
+    timerService = runtime_o.timers
+  # On the asyncio runtime keys are sent on the loop, not a thread
+  keys_o = keySender.KeySender(keys, latency=latency_o,
+                               synchronous=runtime_o is not None)
+  eventQueue_o = eventQueue.EventQueue(dispatchEvent, latency=latency_o,
+                                       synchronous=runtime_o is not None)
   graunch_o = graunch()
-
-
-  controls_o = Controls(debug=debug,mocking=mockInput)
-  controls_o.run(memoryMapCallback)
+  gearSM = newGearStateMachine(graunch_o)
+
+  tickRate = config_o.get('scheduler', 'tick rate')
+  overrunPolicy = config_o.get('scheduler', 'overrun policy')
+
+  controls_o = Controls(debug=debug,mocking=mockInput,
+                        rate=tickRate,
+                        overrunPolicy=overrunPolicy,
+                        latency=latency_o,
+                        pollMode=config_o.get('scheduler', 'poll mode') or 'timer',
+                        channelRates={channel: config_o.get('scheduler', channel + ' rate')
+                                      for channel in ('scoring', 'session', 'liveness')})
+
+  graunch_o.controls = controls_o
+  soundBuckets = config_o.get('miscellaneous', 'sound buckets')
+  if graunchWav and soundBuckets and soundBuckets > 1:
+    from graunchSynth import GraunchSynth
+    graunch_o.synth = GraunchSynth(graunchWav,
+                                   buckets=soundBuckets,
+                                   cacheSize=config_o.get('miscellaneous', 'sound cache') or None)
+
+  blackBoxSeconds = config_o.get('black box', 'seconds')
+  if blackBoxSeconds:
+    from blackBox import BlackBox
+    blackBox_o = BlackBox(seconds=blackBoxSeconds,
+                          rate=controls_o.maxRate(),
+                          after=config_o.get('black box', 'after graunch') or 0,
+                          folder=config_o.get('black box', 'folder') or '.',
+                          keep=config_o.get('black box', 'files kept'))
+    controls_o.addListener(blackBox_o.record)
+    gearSM.transitionListeners.append(blackBox_o.recordTransition)
+    graunch_o.blackBox = blackBox_o
+  if config_o.get('miscellaneous', 'damage'):
+    newDamage(controls_o, ignitionButton,
+              config_o.get('miscellaneous', 'gear ratio file'))
+  if config_o.get('black box', 'record sessions'):
+    from blackBox import SessionRecorder
+    recorder_o = SessionRecorder(folder=config_o.get('black box', 'folder') or '.')
+    controls_o.addListener(recorder_o.record)
+    gearSM.transitionListeners.append(recorder_o.recordTransition)
+  clutchRate = config_o.get('clutch', 'sample rate')
+  if clutchRate:
+    from clutchSampler import ClutchSampler
+    clutchSampler_o = ClutchSampler(controls_o.info, clutchEdge,
+                                    rate=clutchRate,
+                                    bitePoint=ClutchEngaged,
+                                    hysteresis=config_o.get('clutch', 'hysteresis') or 0,
+                                    filterTime=(config_o.get('clutch', 'filter mS') or 0) / 1000,
+                                    active=controls_o.SMactive)
+    controls_o.clutchEvents = False
+  controls_o.run(memoryMapCallback, runtime=runtime_o)
+  if clutchSampler_o:
+    clutchSampler_o.run(runtime=runtime_o)
+  if watchRF2 is None:
+    watchRF2 = config_o.get('scheduler', 'watch rf2')
+  if watchRF2 and not mockInput:
+    from lifecycle import RF2Watcher
+    watcher_o = RF2Watcher(timerService,
+                           onStart=lambda: rF2Started(controls_o),
+                           onStop=lambda: rF2Stopped(controls_o))
+    watcher_o.start()
 
   return controls_o, graunch_o, neutralButtonKeycode
 
 #############################################################
 
-def get_neutral_control(_controller_file_test=None):
+def configError(err):
+    """ Show a config error to the player """
+    from tkinter import messagebox
+    messagebox.showinfo('Config error', err)
+
+def logConfigError(err):
+    """ Headless: config errors go to the log """
+    import logging
+    logging.getLogger('gearshift').error('Config error: %s', err.replace('\n', ' '))
+
+def get_neutral_control(_controller_file_test=None, report=configError):
     """
     Get the keycode specified in controller.json
     """
     global controller_file
     global neutralButton
 
+    if neutralOutput == 'shared memory' and not _controller_file_test:
+        return  # Neutral doesn't go through controller.json
     if _controller_file_test:
         _controller_file = _controller_file_test
     else:
         _controller_file = controller_file
+    from readJSONfile import Json
     _JSON_O = Json(_controller_file)
     neutral_control = _JSON_O.get_item("Control - Neutral")
     if neutral_control:
@@ -375,14 +481,41 @@ def get_neutral_control(_controller_file_test=None):
         if not keycode == neutralButton:
             err = F'"Control - Neutral" in {_controller_file}\n'\
                 F'does not match {configFileName} "neutral button" entry'.format()
-            messagebox.showinfo('Config error', err)
+            report(err)
         return
 
     err = F'"Control - Neutral" not in {_controller_file}\n'\
         F'See {configFileName} "controller_file" entry'.format()
-    messagebox.showinfo('Config error', err)
+    report(err)
+
+def shutdown(controls_o):
+  """ Stop monitoring and write out anything still in memory """
+  if watcher_o:
+    watcher_o.stop()    # mustn't resume what's being stopped
+  if clutchSampler_o:
+    clutchSampler_o.stop()
+  controls_o.stop()
+  eventQueue_o.close()    # handle what's been queued
+  if graunch_o:
+    graunch_o.graunchStop()   # Neutral mustn't be left pressed
+    if graunch_o.synth:
+      graunch_o.synth.close()
+  timerService.stop()
+  sound_o.close()
+  keys_o.close()
+  if hasattr(keys_o.backend, 'hwControl'):
+    keys_o.backend.hwControl.close()
+  if blackBox_o:
+    blackBox_o.close()
+  if recorder_o:
+    recorder_o.close()
+  if ratios_o:
+    ratios_o.save()
+  if runtime_o:
+    runtime_o.close()
 
 if __name__ == "__main__":
+  from mockMemoryMap import gui
   controls_o, graunch_o, neutralButtonKeycode = main()
   instructions = 'If gear selection fails this program will send %s ' \
     'to the active window until you reselect a gear.\n\n' \
@@ -399,7 +532,12 @@ if __name__ == "__main__":
               controls_o=controls_o
               )
 
-  get_neutral_control()
   if root != 'OK':
-    root.mainloop()
-    controls_o.stop()
+    # Check controller.json once the window is up rather than before
+    root.after_idle(get_neutral_control)
+    if runtime_o:
+      runtime_o.attachTk(root)
+      runtime_o.run()
+    else:
+      root.mainloop()
+    shutdown(controls_o)
@@ -0,0 +1,154 @@
+# Everything on one thread: an asyncio event loop.
+#
+# With [scheduler] runtime = asyncio the Controls poll, the clutch sampler,
+# the graunch timers (graunch1/2 pulses and the 3 second graunch3 timeout)
+# and the Tk window all run as callbacks on one loop, instead of a
+# PeriodicThread each, the TimerService thread, the key sender thread and
+# Tk's mainloop().  Events reach the state machine in the order they
+# happen, one at a time, and when nothing is due the loop sleeps in a
+# single wait rather than several threads waking each other.
+#
+# The periodic callbacks are scheduled with loop.call_at() on a deadline
+# grid, the same as scheduler.PeriodicThread (and with its statistics).
+# Tk is serviced by calling root.update() every TK_INTERVAL, its own
+# after() callbacks (the GUI tick) run inside that.
+#
+# The loop's clock is only as fine as the OS's: on Windows timers are
+# about 15 mS apart unless something has raised the timer resolution, so
+# rates above about 60 Hz stay on the 'threads' runtime.  WinSound's
+# thread (PlaySound() blocks) and GraunchSynth's resampling thread are
+# still threads.
+
+import asyncio
+import threading
+
+from scheduler import SchedulerStats, SKIP, MAX_CATCH_UP
+from scheduler import THREADS, ASYNCIO, RUNTIMES  # re-exported
+from timerWheel import TimerHandle
+
+TK_INTERVAL = 0.02   # seconds between servicing the window
+
+class PeriodicCall:
+  """ callback every period seconds on the loop, until stop() """
+  def __init__(self, loop, period, callback, policy=SKIP):
+    self.loop = loop
+    self.period = period
+    self.callback = callback
+    self.policy = policy
+    self.stats = SchedulerStats()
+    self._deadline = loop.time()    # first tick straight away
+    self._handle = loop.call_at(self._deadline, self._tick)
+
+  def _tick(self):
+    loop = self.loop
+    stats = self.stats
+    start = loop.time()
+    jitter = start - self._deadline
+    stats.ticks += 1
+    stats.totalJitter += jitter
+    if jitter > stats.maxJitter:
+      stats.maxJitter = jitter
+    try:
+      self.callback()
+    finally:
+      end = loop.time()
+      if end - start > stats.maxCallbackTime:
+        stats.maxCallbackTime = end - start
+      period = self.period
+      deadline = self._deadline + period
+      if end > deadline:
+        if start < deadline:
+          stats.overruns += 1
+        behind = int((end - deadline) / period) + 1
+        if self.policy == SKIP or behind > MAX_CATCH_UP:
+          stats.skipped += behind
+          deadline += behind * period
+      self._deadline = deadline
+      if self._handle is not None:   # not stop()ped by the callback
+        self._handle = loop.call_at(deadline, self._tick)
+
+  def stop(self):
+    if self._handle is not None:
+      self._handle.cancel()
+      self._handle = None
+
+class AsyncTimerService:
+  """
+  timerWheel.TimerService's interface, the timers are loop.call_later()s.
+  schedule() can be called from other threads.
+  """
+  def __init__(self, loop):
+    self.loop = loop
+    self.threadId = None    # the loop's, set by AsyncRuntime.run()
+    self._handles = set()
+
+  def now(self):
+    return self.loop.time()
+
+  def schedule(self, delay, callback):
+    handle = TimerHandle(callback)
+    self._handles.add(handle)
+    if threading.get_ident() == self.threadId:
+      self.loop.call_later(delay, self._fire, handle)
+    else:
+      self.loop.call_soon_threadsafe(self.loop.call_later, delay, self._fire, handle)
+    return handle
+
+  def _fire(self, handle):
+    self._handles.discard(handle)
+    if not handle.cancelled:
+      handle.fired = True
+      try:
+        handle.callback()
+      except Exception as e:
+        print('Timer callback %s failed: %s' % (handle.callback, e))
+
+  def pending(self):
+    return sum(handle.pending() for handle in list(self._handles))
+
+  def stop(self):
+    """ Pending timers are dropped """
+    for handle in self._handles:
+      handle.cancel()
+    self._handles = set()
+
+class AsyncRuntime:
+  """ The loop, its timer service and the periodic callbacks on it """
+  def __init__(self):
+    self.loop = asyncio.new_event_loop()
+    self.timers = AsyncTimerService(self.loop)
+    self.root = None
+
+  def every(self, period, callback, policy=SKIP):
+    """ Call callback every period seconds, returns a PeriodicCall """
+    return PeriodicCall(self.loop, period, callback, policy)
+
+  def attachTk(self, root, interval=TK_INTERVAL):
+    """ Service the Tk window root on the loop, stop when it's closed """
+    import tkinter
+    self.root = root
+    def update():
+      try:
+        root.update()
+      except tkinter.TclError:  # the window has been destroyed
+        poll.stop()
+        self.loop.stop()
+    poll = self.every(interval, update)
+    return poll
+
+  def run(self):
+    """ Run the loop until stop() (or Ctrl+C, or the window is closed) """
+    asyncio.set_event_loop(self.loop)
+    self.timers.threadId = threading.get_ident()
+    try:
+      self.loop.run_forever()
+    finally:
+      asyncio.set_event_loop(None)
+
+  def stop(self):
+    """ Can be called from any thread """
+    self.loop.call_soon_threadsafe(self.loop.stop)
+
+  def close(self):
+    self.timers.stop()
+    self.loop.close()
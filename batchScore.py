@@ -0,0 +1,271 @@
+# Score a race weekend's recorded sessions on every core.
+#
+# Each recording (see blackBox.py) is scored by a worker process: it's
+# memory-mapped and its shifts found by shiftAnalysis, then the gear
+# changes are run through a stateMachine.GearStateMachine of the worker's
+# own to count the graunches - nothing of Gearshift's is used, so the
+# workers share nothing and it scales with the number of cores.  Only the
+# small per-session summary comes back to be written out.  Only the time
+# the player is driving is scored, not the garage, menus or the AI.
+#
+# Folders are searched for SessionRecorder's session-*.gsbb recordings,
+# the black box's excerpts of the same graunches are left out.
+#
+# The summaries are appended to a JSON lines file as each session is
+# finished.  Run it again with the same output file and the sessions
+# already in it (same path, size and modification time) are skipped, so an
+# interrupted run carries on where it stopped.  The report at the end
+# covers everything in the file.
+#
+# python batchScore.py [--output scores.jsonl] [--workers N] [--bite-point 90]
+#                      [--no-reshift] [--double-declutch] [--quiet]
+#                      session.gsbb|folder [...]
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from blackBox import FILE_EXTENSION, SESSION_PREFIX
+import shiftAnalysis
+import stateMachine
+
+DEFAULT_OUTPUT = 'scores.jsonl'
+TIMEOUT_REPEAT = 0.04       # graunch2() sets it again every 40 mS or so
+
+def activeSamples(columns):
+  """
+  True for the samples where the player is driving: in control and on
+  track.  Recordings from before onTrack was recorded count as on track.
+  """
+  gear = columns.get('gear', ())
+  control = columns.get('control')
+  if control is None or len(control) != len(gear):
+    return np.ones(len(gear), np.bool_)
+  active = control == 0
+  onTrack = columns.get('onTrack')
+  if onTrack is not None and len(onTrack) == len(active):
+    active &= onTrack != 0
+  return active
+
+def activeRuns(active):
+  """ (start, stop) of each run of True in active """
+  edges = np.diff(np.concatenate(([False], active, [False])).astype(np.int8))
+  return zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist())
+
+def countGraunches(t, gear, clutch, bitePoint=shiftAnalysis.DEFAULT_BITE_POINT,
+                   reshift=True, doubleDeclutch=False, active=None):
+  """
+  Graunches in one car's samples, only those where active (default: all).
+  Each run of active samples starts a state machine afresh, as Controls
+  does when the player starts driving.
+  """
+  if active is None:
+    return _countRun(t, gear, clutch, bitePoint, reshift, doubleDeclutch)
+  return sum(_countRun(t[start:stop], gear[start:stop], clutch[start:stop],
+                       bitePoint, reshift, doubleDeclutch)
+             for start, stop in activeRuns(active))
+
+def _countRun(t, gear, clutch, bitePoint, reshift, doubleDeclutch):
+  """
+  Only the samples where the gear or the clutch changes go through the
+  state machine, as Controls would send them; the graunch timeout is
+  dispatched before the first change after it.
+  """
+  if len(gear) < 2:
+    return 0
+  counter = stateMachine.GraunchCounter()
+  sm = stateMachine.GearStateMachine(counter, reshift=reshift,
+                                     doubleDeclutch=doubleDeclutch,
+                                     msgBox=lambda text: None)
+  down = clutch < bitePoint
+  if down[0]:   # the clutch is already down when it starts
+    counter.now = float(t[0])
+    sm.dispatch(stateMachine.CLUTCH_DISENGAGE)
+  gearChanges = np.flatnonzero(gear[1:] != gear[:-1]) + 1
+  clutchChanges = np.flatnonzero(down[1:] != down[:-1]) + 1
+  index = np.concatenate((gearChanges, clutchChanges))
+  isClutch = np.concatenate((np.zeros(len(gearChanges), np.bool_),
+                             np.ones(len(clutchChanges), np.bool_)))
+  order = np.lexsort((isClutch, index))   # gear before clutch, as Controls
+  for i, clutchEvent in zip(index[order].tolist(), isClutch[order].tolist()):
+    now = float(t[i])
+    if counter.deadline <= now:
+      counter.now = counter.deadline
+      sm.dispatch(stateMachine.GRAUNCH_TIMEOUT)
+    counter.now = now
+    if clutchEvent:
+      sm.dispatch(stateMachine.CLUTCH_DISENGAGE if down[i]
+                  else stateMachine.CLUTCH_ENGAGE)
+    else:
+      sm.dispatch(stateMachine.GEAR_SELECT if gear[i]
+                  else stateMachine.GEAR_DESELECT)
+    if counter.deadline <= now:
+      counter.deadline = now + TIMEOUT_REPEAT
+  return counter.graunches
+
+def sessionKey(path):
+  """ What a session is recognised by when resuming """
+  st = os.stat(path)
+  return os.path.abspath(path), st.st_size, int(st.st_mtime)
+
+def scoreSession(path, bitePoint=shiftAnalysis.DEFAULT_BITE_POINT,
+                 reshift=True, doubleDeclutch=False):
+  """ The summary of one recording, run in a worker process """
+  start = time.perf_counter()
+  absPath, size, mtime = sessionKey(path)
+  result = {'path': absPath, 'size': size, 'mtime': mtime}
+  try:
+    columns = shiftAnalysis.loadSession(path)
+  except (OSError, ValueError) as e:
+    result['error'] = str(e)
+    return result
+  gear = columns.get('gear', np.zeros(0, np.int8))
+  t = columns['t'] if len(columns.get('t', ())) else columns.get('elapsedTime', gear)
+  result['samples'] = len(gear)
+  result['duration'] = float(t[-1] - t[0]) if len(t) else 0.0
+  active = activeSamples(columns)
+  shifts = shiftAnalysis.findShifts(columns, bitePoint)
+  vehicle = columns.get('vehicle')
+  if vehicle is None:   # a session recording, shift indexes are sample indexes
+    shifts = shifts[active[shifts['index']]]
+  vehicles = shiftAnalysis.summary(shifts)
+  for v in (np.unique(vehicle) if vehicle is not None else [0]):
+    mask = slice(None) if vehicle is None else vehicle == v
+    stats = vehicles.setdefault(int(v), {'shifts': 0})
+    stats['graunches'] = countGraunches(t[mask], gear[mask], columns['clutch'][mask],
+                                        bitePoint, reshift, doubleDeclutch,
+                                        active=active[mask])
+  result['vehicles'] = {str(v): stats for v, stats in vehicles.items()}
+  result['seconds'] = time.perf_counter() - start
+  return result
+
+def findRecordings(paths):
+  """ The recordings named, folders searched for session recordings """
+  found = []
+  for path in paths:
+    if os.path.isdir(path):
+      for folder, _dirs, files in os.walk(path):
+        found.extend(os.path.join(folder, name) for name in sorted(files)
+                     if name.startswith(SESSION_PREFIX) and name.endswith(FILE_EXTENSION))
+    else:
+      found.append(path)
+  return found
+
+def readScores(output):
+  """ The summaries already written, a half written last line is ignored """
+  scores = []
+  if os.path.exists(output):
+    with open(output) as f:
+      for line in f:
+        try:
+          scores.append(json.loads(line))
+        except ValueError:
+          pass
+  return scores
+
+def _endsWithNewline(path):
+  with open(path, 'rb') as f:
+    f.seek(-1, os.SEEK_END)
+    return f.read(1) == b'\n'
+
+class Progress:
+  """ One line on stderr: done/total, rate and time left """
+  def __init__(self, total, stream=sys.stderr, quiet=False):
+    self.total = total
+    self.done = 0
+    self.stream = stream
+    self.quiet = quiet
+    self.start = time.perf_counter()
+
+  def update(self, n=1):
+    self.done += n
+    if self.quiet:
+      return
+    took = time.perf_counter() - self.start
+    rate = self.done / took if took else 0.0
+    left = (self.total - self.done) / rate if rate else 0.0
+    self.stream.write('\r%d/%d sessions  %.1f/s  %ds left ' % (self.done, self.total,
+                                                               rate, left))
+    if self.done == self.total:
+      self.stream.write('\n')
+    self.stream.flush()
+
+def scoreAll(recordings, output=DEFAULT_OUTPUT, workers=None, quiet=False, **options):
+  """
+  Score the recordings not already in output, appending their summaries.
+  Returns every summary in output.
+  """
+  done = {(s['path'], s['size'], s['mtime']) for s in readScores(output)}
+  todo = []
+  for path in recordings:
+    try:
+      if sessionKey(path) not in done:
+        todo.append(path)
+    except OSError as e:
+      print('%s: %s' % (path, e), file=sys.stderr)
+  progress = Progress(len(todo), quiet=quiet)
+  if todo:
+    with open(output, 'a') as f, ProcessPoolExecutor(workers) as executor:
+      if f.tell() and not _endsWithNewline(output):
+        f.write('\n')  # after the half written line
+      futures = [executor.submit(scoreSession, path, **options) for path in todo]
+      for future in as_completed(futures):
+        f.write(json.dumps(future.result()) + '\n')
+        f.flush()   # so it's there to resume from
+        progress.update()
+  return readScores(output)
+
+def report(scores):
+  """ All the sessions merged: totals, then the sessions with most graunches """
+  totals = {'sessions': 0, 'errors': 0, 'samples': 0, 'hours': 0.0, 'shifts': 0,
+            'without clutch': 0, 'graunches': 0}
+  mismatch = 0.0
+  worst = []
+  for s in scores:
+    totals['sessions'] += 1
+    if 'error' in s:
+      totals['errors'] += 1
+      continue
+    totals['samples'] += s['samples']
+    totals['hours'] += s['duration'] / 3600
+    graunches = 0
+    for stats in s['vehicles'].values():
+      totals['shifts'] += stats['shifts']
+      totals['without clutch'] += stats.get('without clutch', 0)
+      graunches += stats['graunches']
+      mismatch += stats.get('mean rev mismatch', 0.0) * stats['shifts']
+    totals['graunches'] += graunches
+    worst.append((graunches, s['path']))
+  lines = ['%s: %s' % (key, round(value, 2) if isinstance(value, float) else value)
+           for key, value in totals.items()]
+  if totals['shifts']:
+    lines.append('mean rev mismatch: %.0f' % (mismatch / totals['shifts']))
+  worst.sort(reverse=True)
+  if worst:
+    lines.append('most graunches:')
+    lines.extend('  %5d  %s' % w for w in worst[:10])
+  return '\n'.join(lines)
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Score recorded sessions on all cores')
+  parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                      help='JSON lines file, sessions already in it are skipped')
+  parser.add_argument('--workers', type=int, help='processes (default: one per core)')
+  parser.add_argument('--bite-point', type=int, default=shiftAnalysis.DEFAULT_BITE_POINT)
+  parser.add_argument('--no-reshift', action='store_true')
+  parser.add_argument('--double-declutch', action='store_true')
+  parser.add_argument('--quiet', action='store_true', help='no progress display')
+  parser.add_argument('recordings', nargs='+', help='%s files or folders' % FILE_EXTENSION)
+  args = parser.parse_args(argv)
+  scores = scoreAll(findRecordings(args.recordings), args.output, args.workers,
+                    quiet=args.quiet, bitePoint=args.bite_point,
+                    reshift=not args.no_reshift, doubleDeclutch=args.double_declutch)
+  print(report(scores))
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,338 @@
+# Telemetry "black box" - the last few seconds of telemetry and state
+# machine transitions, kept in fixed size ring buffers and written to disk
+# when something goes wrong (a graunch).
+#
+# The buffers are one array.array per column so recording a sample doesn't
+# create any Python objects and the memory used never grows.  Files are
+# written by a background thread so the poll loop never waits for the disk,
+# and only the newest 'keep' black box files are left in the folder.
+# SessionRecorder uses the same format to record whole sessions.
+#
+# File format (.gsbb), a sequence of blocks, each:
+#   'GSBB', kind (b'S' samples, b'T' transitions),
+#   version, number of columns, number of rows   (struct '<HHI')
+#   for each column: name length (B), name, array typecode
+#   then each column's values (little-endian, as array.tobytes())
+
+import array
+from collections import deque
+import os
+import queue
+import struct
+import sys
+import time
+from threading import Thread
+
+MAGIC = b'GSBB'
+VERSION = 1
+SAMPLES = b'S'
+TRANSITIONS = b'T'
+FILE_EXTENSION = '.gsbb'
+SESSION_PREFIX = 'session-'     # SessionRecorder's files
+BLACK_BOX_PREFIX = 'blackbox-'  # BlackBox's
+
+# (name, array typecode)
+SAMPLE_COLUMNS = (('t', 'd'),             # time.perf_counter()
+                  ('elapsedTime', 'd'),   # mElapsedTime
+                  ('gear', 'b'),
+                  ('clutch', 'h'),        # 100 clutch released, 0 clutch pressed
+                  ('engineRPM', 'f'),
+                  ('clutchRPM', 'f'),
+                  ('control', 'b'),
+                  ('speed', 'f'),         # m/S
+                  ('onTrack', 'b'))
+TRANSITION_COLUMNS = (('t', 'd'),         # time.perf_counter()
+                      ('fromState', 'b'),
+                      ('event', 'b'),
+                      ('toState', 'b'))
+
+MAX_TRANSITIONS = 256
+CHUNK_SAMPLES = 600     # samples in each block of a session recording
+WRITE_QUEUE_LENGTH = 4
+KEEP_FILES = 20         # black box files left in the folder, the oldest go
+FILES_LISTED = 100      # most recent paths kept in .files
+
+###############################################################################
+# File format
+
+def _littleEndian(column):
+  if sys.byteorder != 'little':
+    column = array.array(column.typecode, column)
+    column.byteswap()
+  return column
+
+def packBlock(kind, columns):
+  """ columns: [(name, array), ...] all the same length """
+  nRows = len(columns[0][1]) if columns else 0
+  parts = [MAGIC, kind, struct.pack('<HHI', VERSION, len(columns), nRows)]
+  for name, column in columns:
+    _name = name.encode()
+    parts.append(struct.pack('<B', len(_name)) + _name + column.typecode.encode())
+  for name, column in columns:
+    parts.append(_littleEndian(column).tobytes())
+  return b''.join(parts)
+
+def blockLayout(data):
+  """
+  Generator of (kind, nRows, [(name, typecode, offset), ...]) for each
+  block in data, where offset is where the column's values start
+  """
+  offset = 0
+  while offset < len(data):
+    if data[offset:offset+4] != MAGIC:
+      raise ValueError('Not a gearshift recording at byte %d' % offset)
+    kind = bytes(data[offset+4:offset+5])
+    _version, nColumns, nRows = struct.unpack_from('<HHI', data, offset+5)
+    offset += 13
+    names = []
+    for _c in range(nColumns):
+      length = data[offset]
+      names.append((bytes(data[offset+1:offset+1+length]).decode(),
+                    chr(data[offset+1+length])))
+      offset += length + 2
+    columns = []
+    for name, typecode in names:
+      columns.append((name, typecode, offset))
+      offset += nRows * array.array(typecode).itemsize
+    yield kind, nRows, columns
+
+def unpackBlocks(data):
+  """ Generator of (kind, {name: array}) for each block in data """
+  for kind, nRows, layout in blockLayout(data):
+    columns = {}
+    for name, typecode, offset in layout:
+      column = array.array(typecode)
+      column.frombytes(data[offset:offset + nRows * column.itemsize])
+      if sys.byteorder != 'little':
+        column.byteswap()
+      columns[name] = column
+    yield kind, columns
+
+def readRecording(path):
+  """
+  Read a recording, return (samples, transitions), dicts of
+  {column name: array} with the blocks of each kind joined together.
+  """
+  with open(path, 'rb') as f:
+    data = f.read()
+  samples = {name: array.array(typecode) for name, typecode in SAMPLE_COLUMNS}
+  transitions = {name: array.array(typecode) for name, typecode in TRANSITION_COLUMNS}
+  for kind, columns in unpackBlocks(data):
+    dest = samples if kind == SAMPLES else transitions
+    for name, column in columns.items():
+      if name not in dest:
+        dest[name] = array.array(column.typecode)
+      dest[name].extend(column)
+  return samples, transitions
+
+###############################################################################
+
+class _Ring:
+  """ Fixed size struct-of-arrays ring buffer """
+  def __init__(self, columns, capacity):
+    self.names = [name for name, typecode in columns]
+    self.capacity = capacity
+    self.columns = [array.array(typecode, [0]) * capacity
+                    for name, typecode in columns]
+    self.index = 0  # where the next row goes
+    self.count = 0  # rows ever written
+
+  def ordered(self):
+    """ Copy of the rows held, oldest first, as [(name, array), ...] """
+    n = min(self.count, self.capacity)
+    start = (self.index - n) % self.capacity
+    result = []
+    for name, column in zip(self.names, self.columns):
+      if start + n <= self.capacity:
+        result.append((name, column[start:start+n]))
+      else:
+        result.append((name, column[start:] + column[:self.index]))
+    return result
+
+class _Writer:
+  """
+  Background thread that writes (or appends) sample and transition blocks.
+  written(path) is called on the thread after each new file
+  """
+  def __init__(self, name, written=None):
+    self.files = deque(maxlen=FILES_LISTED)   # files written, the latest
+    self.written = written
+    self.dropped = 0      # writes dropped because the writer was behind
+    self._queue = queue.Queue(WRITE_QUEUE_LENGTH)
+    self._thread = Thread(target=self._write, name=name, daemon=True)
+    self._thread.start()
+
+  def put(self, path, mode, samples, transitions):
+    try:
+      self._queue.put_nowait((path, mode, samples, transitions))
+    except queue.Full:
+      self.dropped += 1
+
+  def _write(self):
+    while True:
+      item = self._queue.get()
+      if item is None:
+        break
+      path, mode, samples, transitions = item
+      try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, mode) as f:
+          f.write(packBlock(SAMPLES, samples))
+          f.write(packBlock(TRANSITIONS, transitions))
+        if path not in self.files:
+          self.files.append(path)
+          if self.written:
+            self.written(path)
+      except OSError as e:
+        print('Recording %s not written: %s' % (path, e))
+      self._queue.task_done()
+
+  def flush(self):
+    """ Wait until everything queued has been written """
+    self._queue.join()
+
+  def close(self):
+    self._queue.put(None)
+    self._thread.join()
+
+def _recordSample(columns, i, snapshot):
+  t, elapsedTime, gear, clutch, engineRPM, clutchRPM, control, speed, onTrack = columns
+  t[i] = time.perf_counter()
+  elapsedTime[i] = snapshot.elapsedTime
+  gear[i] = snapshot.gear
+  clutch[i] = snapshot.clutch
+  engineRPM[i] = snapshot.engineRPM
+  clutchRPM[i] = snapshot.clutchRPM
+  control[i] = snapshot.control
+  speed[i] = snapshot.speed
+  onTrack[i] = snapshot.onTrack
+
+def _recordTransition(columns, i, fromState, event, toState):
+  t, _fromState, _event, _toState = columns
+  t[i] = time.perf_counter()
+  _fromState[i] = fromState
+  _event[i] = event
+  _toState[i] = toState
+
+class BlackBox:
+  """
+  Record every tick's snapshot and every state machine transition.
+  trigger() writes the window around it to a file once 'after' more
+  seconds have been recorded.
+  rate: the most ticks a second, the ring holds 'seconds' of them
+  keep: black box files left in folder, older ones are deleted, 0: all
+  """
+  def __init__(self, seconds=10, rate=10, after=2, folder='.', keep=KEEP_FILES,
+               clock=time.perf_counter):
+    self.samples = _Ring(SAMPLE_COLUMNS, max(1, int(seconds * rate)))
+    self.transitions = _Ring(TRANSITION_COLUMNS, MAX_TRANSITIONS)
+    self.after = after
+    self.clock = clock
+    self.folder = folder
+    self.keep = keep
+    self.dumpAt = None    # clock() when the triggered window is complete
+    self.reason = ''
+    self.dumps = 0
+    self.deleted = 0      # old files deleted to stay within keep
+    self._writer = _Writer('BlackBox', written=self._prune)
+    self.files = self._writer.files
+
+  def record(self, snapshot):
+    """ Controls listener, called with each tick's TelemetrySnapshot """
+    ring = self.samples
+    _recordSample(ring.columns, ring.index, snapshot)
+    ring.index = (ring.index + 1) % ring.capacity
+    ring.count += 1
+    if self.dumpAt is not None and self.clock() >= self.dumpAt:
+      self.dumpAt = None
+      self._dump()
+
+  def recordTransition(self, fromState, event, toState):
+    """ GearStateMachine transition listener """
+    ring = self.transitions
+    _recordTransition(ring.columns, ring.index, fromState, event, toState)
+    ring.index = (ring.index + 1) % ring.capacity
+    ring.count += 1
+
+  def trigger(self, reason='graunch'):
+    """ Dump the window around now (unless one is already pending) """
+    if self.dumpAt is None:
+      self.reason = reason
+      self.dumpAt = self.clock() + self.after
+
+  def _dump(self):
+    # Just copy the buffers here, the writer thread does the rest
+    self.dumps += 1
+    name = '%s%s-%d-%s%s' % (BLACK_BOX_PREFIX, time.strftime('%Y%m%d-%H%M%S'),
+                             self.dumps, self.reason, FILE_EXTENSION)
+    self._writer.put(os.path.join(self.folder, name), 'wb',
+                     self.samples.ordered(),
+                     self.transitions.ordered())
+
+  def _prune(self, path):
+    # On the writer thread.  Only the black box's own files, not sessions
+    if not self.keep:
+      return
+    folder = os.path.dirname(path) or '.'
+    try:
+      names = [os.path.join(folder, name) for name in os.listdir(folder)
+               if name.startswith(BLACK_BOX_PREFIX) and name.endswith(FILE_EXTENSION)]
+      names.sort(key=os.path.getmtime)
+      for old in names[:-self.keep]:
+        os.remove(old)
+        self.deleted += 1
+    except OSError as e:
+      print('Old black box files not deleted: %s' % e)
+
+  def flush(self):
+    """ Wait until the writer has written everything queued """
+    self._writer.flush()
+
+  def close(self):
+    self._writer.close()
+
+class SessionRecorder:
+  """
+  Record every tick's snapshot and every state machine transition of a
+  whole session to a file, for replay and analysis.  Samples are
+  collected in fixed size chunks and each full chunk is appended to the
+  file as a block by the writer thread.
+  """
+  def __init__(self, folder='.', chunk=CHUNK_SAMPLES):
+    self.path = os.path.join(folder, '%s%s%s' % (SESSION_PREFIX, time.strftime('%Y%m%d-%H%M%S'),
+                                                 FILE_EXTENSION))
+    self.samples = _Ring(SAMPLE_COLUMNS, chunk)
+    self.transitions = _Ring(TRANSITION_COLUMNS, MAX_TRANSITIONS)
+    self._writer = _Writer('SessionRecorder')
+
+  def record(self, snapshot):
+    """ Controls listener, called with each tick's TelemetrySnapshot """
+    ring = self.samples
+    _recordSample(ring.columns, ring.index, snapshot)
+    ring.index += 1
+    ring.count += 1
+    if ring.index == ring.capacity:
+      self.flush()
+
+  def recordTransition(self, fromState, event, toState):
+    """ GearStateMachine transition listener """
+    ring = self.transitions
+    if ring.index == ring.capacity:
+      self.flush()
+    _recordTransition(ring.columns, ring.index, fromState, event, toState)
+    ring.index += 1
+    ring.count += 1
+
+  def flush(self):
+    """ Queue what has been collected to be appended to the file """
+    samples = [(name, column[:self.samples.index])
+               for name, column in zip(self.samples.names, self.samples.columns)]
+    transitions = [(name, column[:self.transitions.index])
+                   for name, column in zip(self.transitions.names, self.transitions.columns)]
+    self.samples.index = 0
+    self.transitions.index = 0
+    self._writer.put(self.path, 'ab', samples, transitions)
+
+  def close(self):
+    self.flush()
+    self._writer.close()
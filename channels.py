@@ -0,0 +1,41 @@
+# Values read from rF2 at their own rates.
+#
+# The telemetry (gear, clutch, revs) is read every tick but the rest of
+# what a tick looks at changes far more slowly: rF2 only updates the
+# scoring block (who's in control, the names) about 5 times a second,
+# the session / track state changes going in and out of the garage and
+# whether rF2 is running hardly ever, though isRF2running() is the
+# dearest check of all.  Each Channel keeps the last value read and only
+# reads again when its period is up, so a fast tick rate only pays for
+# the telemetry.
+
+class Channel:
+  """
+  read() at most rate times a second, rate 0: every get().
+  get(now) returns the value, read again if it's due.
+  """
+  __slots__ = ('name', 'read', 'period', 'value', 'due', 'reads', 'changed')
+
+  def __init__(self, name, read, rate=0):
+    self.name = name
+    self.read = read
+    self.period = 1.0 / rate if rate else 0.0
+    self.value = None
+    self.due = float('-inf')
+    self.reads = 0
+    self.changed = False    # the last get() read a different value
+
+  def get(self, now):
+    if now >= self.due:
+      value = self.read()
+      self.changed = value != self.value
+      self.value = value
+      self.due = now + self.period
+      self.reads += 1
+    else:
+      self.changed = False
+    return self.value
+
+  def expire(self):
+    """ Read it next get() """
+    self.due = float('-inf')
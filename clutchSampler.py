@@ -0,0 +1,125 @@
+# The clutch, watched on its own faster loop.
+#
+# Controls reads the clutch once a tick (10 Hz by default) and
+# WatchClutch() compares it with the bite point, so a quick dab between
+# ticks is missed and a noisy mUnfilteredClutch near the bite point sends
+# bursts of clutchEngage / clutchDisengage.  ClutchSampler reads only the
+# clutch, up to 500 times a second, and
+#   filters it: an exponential moving average, one multiply-add a sample
+#   de-bounces it: the clutch is down below bitePoint - hysteresis / 2
+#                  and back up above bitePoint + hysteresis / 2
+#   times the edge: between the two samples either side of the crossing,
+#                   by linear interpolation
+# Only the edges are passed on, so the state machine sees no more events
+# than before.  When it's used Controls doesn't send clutch events.
+
+from math import exp
+import time
+
+from scheduler import PeriodicThread
+import stateMachine
+from telemetrySnapshot import clutchPercent
+
+DEFAULT_RATE = 500        # Hz
+DEFAULT_HYSTERESIS = 4    # % of the pedal travel, the width of the band
+DEFAULT_FILTER_TIME = 0.004  # seconds, the filter's time constant
+THRESHOLD_MARGIN = 0.5    # %, the thresholds are kept this far inside 0 - 100
+
+class ClutchSampler:
+  """
+  Reads the clutch from info (a SimInfoAPI) rate times a second and
+  calls callback(event, edgeTime) with stateMachine.CLUTCH_DISENGAGE or
+  CLUTCH_ENGAGE and the time.perf_counter() the filtered clutch crossed
+  the threshold.
+  active: returns False when the state machine is stopped, edges are
+          followed but not passed on
+  """
+  def __init__(self, info, callback, rate=DEFAULT_RATE, bitePoint=90,
+               hysteresis=DEFAULT_HYSTERESIS, filterTime=DEFAULT_FILTER_TIME,
+               active=None, clock=time.perf_counter):
+    self.info = info
+    self.callback = callback
+    self.rate = rate
+    self.bitePoint = bitePoint
+    # Inside the pedal's travel, or with the bite point near either end
+    # the filtered clutch could never cross one of them
+    lowest, highest = THRESHOLD_MARGIN, 100 - THRESHOLD_MARGIN
+    self.downBelow = min(max(bitePoint - hysteresis / 2, lowest), highest)
+    self.upAbove = min(max(bitePoint + hysteresis / 2, lowest), highest)
+    if filterTime > 0:
+      self.alpha = 1.0 - exp(-1.0 / (rate * filterTime))
+    else:
+      self.alpha = 1.0    # no filtering
+    self.active = active
+    self.clock = clock
+    self.thread = None
+    self.clutch = None    # filtered, 100 released, 0 pressed
+    self.down = False
+    self._time = 0.0      # of the last sample
+    self._rawDown = False
+    # Statistics
+    self.samples = 0
+    self.edges = 0
+    self.bounces = 0      # bite point crossings that weren't edges
+    self.maxDelay = 0.0   # seconds from an edge to passing it on
+
+  def tick(self):
+    """ The PeriodicThread callback """
+    self.sample(clutchPercent(self.info.playersVehicleTelemetry().mUnfilteredClutch))
+
+  def sample(self, clutch, now=None):
+    """ One reading of the clutch (percent, 100 released) """
+    if now is None:
+      now = self.clock()
+    self.samples += 1
+    rawDown = clutch < self.bitePoint
+    if self.clutch is None:   # the first sample, no edge
+      self.clutch = float(clutch)
+      self.down = self._rawDown = rawDown
+      self._time = now
+      return
+    bounced = rawDown != self._rawDown
+    self._rawDown = rawDown
+    previous = self.clutch
+    self.clutch = filtered = previous + self.alpha * (clutch - previous)
+    then = self._time
+    self._time = now
+    if self.down:
+      if filtered <= self.upAbove:
+        self.bounces += bounced
+        return
+      threshold = self.upAbove
+      event = stateMachine.CLUTCH_ENGAGE
+    else:
+      if filtered >= self.downBelow:
+        self.bounces += bounced
+        return
+      threshold = self.downBelow
+      event = stateMachine.CLUTCH_DISENGAGE
+    self.down = not self.down
+    self.edges += 1
+    edgeTime = then + (threshold - previous) / (filtered - previous) * (now - then)
+    if self.active is None or self.active():
+      self.callback(event, edgeTime)
+      delay = self.clock() - edgeTime
+      if delay > self.maxDelay:
+        self.maxDelay = delay
+
+  def stats(self):
+    return {'samples': self.samples,
+            'edges': self.edges,
+            'bounces': self.bounces,
+            'max edge delay mS': self.maxDelay * 1000}
+
+  def run(self, runtime=None):
+    """ On a thread of its own or on runtime's (an asyncRuntime.AsyncRuntime) """
+    self.clutch = None    # the first sample starts the filter afresh
+    if runtime:
+      self.thread = runtime.every(1.0 / self.rate, self.tick)
+    else:
+      self.thread = PeriodicThread(self.tick, self.rate)
+      self.thread.start()
+
+  def stop(self):
+    if self.thread:
+      self.thread.stop()
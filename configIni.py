@@ -2,12 +2,15 @@ from configparser import ConfigParser
 import os
 
 configFileName = 'gearshift.ini'
-sections = ['clutch', 'shifter', 'miscellaneous']
+sections = ['clutch', 'shifter', 'miscellaneous', 'scheduler', 'black box']
 clutchValues = {
   'controller' : 'Not yet selected',
   'axis'       : '0',
   'reversed'   : '0',
-  'bite point' : '90'
+  'bite point' : '90',
+  'sample rate': '0',   # Hz, up to 1000. 0: the clutch is read with the tick
+  'hysteresis' : '4',   # % of the travel, width of the band around the bite point
+  'filter mS'  : '4'    # time constant of the clutch filter, 0: none
  }
 shifterValues = {
   'controller' : 'Not yet selected',
@@ -24,19 +27,42 @@ shifterValues = {
   }
 miscValues = {
   'shared memory'   : '1',    # 1: read gears, clutch from rF2 shared memory
-  'damage'          : '0',    # 1: damage model active
+  'damage'          : '0',    # 1: damage model active, and the over-rev warning
   'shifter'         : '1',    # 0: paddles/sequential. Different damage model
   'double declutch' : '0',    # 1: double declutch required (damage will be worse if not done)  TBD
   'preselector'     : '0',    # 1: pre-selector gearbox TBD
   'reshift'         : '0',    # 1: must go to neutral after a bad shift
   'neutral button'  : 'DIK_NUMPAD0',  # the key code sent to prevent a shift occurring
+  'neutral output'  : 'keys', # keys: send neutral button, shared memory: rF2 Shared Memory plugin HWControl input
+  'neutral control' : 'Neutral',  # the rF2 control name requested with shared memory output
   'ignition button' : 'DIK_APOSTROPHE', # the key code sent if the engine is damaged
   'wav file'        : 'Grind_default.wav',
+  'sound'           : 'winsound',  # winsound or none
+  'sound buckets'   : '8',    # versions of the wav for bigger rev differences, 0: just the wav
+  'sound cache'     : '8',    # how many of those are kept in memory, 0: all of them
+  'gear ratio file' : 'gearRatios.json', # gear ratios learnt for each car
   'debug'           : '0',
   'mock input'      : '0',
   'test mode'       : '0',
   'controller_file' : '%ProgramFiles(x86)%/Steam/steamapps/common/rFactor 2/Userdata/player/controller.json'
 }
+schedulerValues = {
+  'tick rate'       : '10',   # Hz, 10 to 1000. How often rF2's memory map is read
+  'overrun policy'  : 'skip', # skip: drop ticks missed by a slow tick, catch up: run them late
+  'runtime'         : 'threads', # threads, or asyncio: everything on one thread
+  'poll mode'       : 'timer', # timer: read at the tick rate, frame: when rF2 writes new telemetry
+  'scoring rate'    : '5',    # Hz, who's in control and the names. 0: every tick
+  'session rate'    : '5',    # Hz, track loaded / on track
+  'liveness rate'   : '1',    # Hz, is rF2 running
+  'watch rf2'       : '1'     # 1: stop polling while rF2's process isn't running
+}
+blackBoxValues = {
+  'seconds'         : '0',    # telemetry kept in memory, 0: black box off (10 is plenty)
+  'after graunch'   : '2',    # seconds recorded after a graunch before it's written
+  'folder'          : 'blackbox',
+  'files kept'      : '20',   # the oldest black box files are deleted, 0: keep them all
+  'record sessions' : '0'     # 1: record every session to a file in folder, for replay.py
+}
 
 
 class Config:
@@ -52,6 +78,10 @@ class Config:
         self.set('shifter', val, default)
     for val, default in miscValues.items():
         self.set('miscellaneous', val, default)
+    for val, default in schedulerValues.items():
+        self.set('scheduler', val, default)
+    for val, default in blackBoxValues.items():
+        self.set('black box', val, default)
 
     # if there is an existing file parse values over those
     if os.path.exists(configFileName):
@@ -72,7 +102,10 @@ class Config:
   def get(self, section, val):
     try:
       # get existing value
-      if val in ['controller', 'wav file', 'neutral button', 'ignition button'] :
+      if val in ['controller', 'wav file', 'neutral button', 'ignition button',
+                 'overrun policy', 'folder', 'gear ratio file', 'sound',
+                 'neutral output', 'neutral control', 'runtime',
+                 'poll mode'] :
         return self.config.get(section, val)
       else:
         return self.config.getint(section, val)
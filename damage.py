@@ -18,27 +18,155 @@ Misuse
 * rev mismatch on upshift or downshift
     including starts
 
-May need to calculate gear ratios from mLocalVel [velocity (m/S) in local vehicle coordinates]
-current gear and revs.
+Gear ratios are learnt from mLocalVel [velocity (m/S) in local vehicle coordinates]
+current gear and revs by gearRatios.GearRatios.  With them a downshift
+that will over-rev is spotted when the gear is selected, before the
+clutch comes up.
+
+The model is streaming: update() is called with every tick's snapshot and
+does a fixed amount of work, adding to three running totals.  Each one
+reaches 1.0 when that part is broken.  Only the player's own driving
+counts: not the AI's, replays or time off track.  A new vehicle starts
+undamaged.
 """
 
+# Wear, 1.0 is broken
+OVER_REV_WEAR = 1.0         # engine, per second at 100% over mEngineMaxRPM
+OVER_REV_HIT = 2.0          # engine, clutch let up with the gearbox 100% over the rev limit
+CLUTCH_SLIP_WEAR = 0.005    # clutch, per second slipping at max revs difference
+CLUTCH_SHOCK = 0.05         # clutch, engaging at max revs difference
+NO_CLUTCH_HIT = 0.05        # gearbox, a gear selected without the clutch
+NO_CLUTCH_MISMATCH = 0.1    #   and more at max revs difference
+FAST_SHIFT_HIT = 0.02       # gearbox, a gear selected straight after leaving the last
+MIN_SHIFT_TIME = 0.15       #   seconds in neutral for no fast shift damage
+MAX_TICK = 0.5              # seconds, longer gaps (paused, Esc) don't count
+DEFAULT_MAX_RPM = 8000.0    # if the telemetry doesn't give mEngineMaxRPM
+
+BLOWN = 1.0
+
 class Damage:
-  def __init__(self):
-    self.damage = {'engine': None,
-                   'clutch': None,
-                   'gearbox' :None}
+  __slots__ = ('engine', 'clutch', 'gearbox', 'bitePoint', 'blown',
+               'blownSent', 'gear', 'lastGear', 'engaged', 'lastTime',
+               'leftGearAt', 'maxRPM', 'ratios', 'overRev', 'overRevWarnings',
+               'vehicle', 'driving')
+
+  def __init__(self, bitePoint=90, blown=None, ratios=None, overRev=None):
+    self.engine = 0.0
+    self.clutch = 0.0
+    self.gearbox = 0.0
+    self.bitePoint = bitePoint  # ClutchEngaged
+    self.blown = blown          # called once when the engine is blown
+    self.blownSent = False
+    self.gear = 0
+    self.lastGear = 0           # the last gear other than neutral
+    self.engaged = True
+    self.lastTime = 0.0
+    self.leftGearAt = 0.0
+    self.maxRPM = DEFAULT_MAX_RPM
+    self.ratios = ratios        # GearRatios, None: no over-rev warning
+    self.overRev = overRev      # called with (gear, predicted RPM) on a warning
+    self.overRevWarnings = 0
+    self.vehicle = None
+    self.driving = False        # the last snapshot was the player on track
+
+  def reset(self):
+    """ A new vehicle, undamaged """
+    self.engine = self.clutch = self.gearbox = 0.0
+    self.blownSent = False
+    self.lastGear = 0
+
+  def levels(self):
+    return {'engine': self.engine,
+            'clutch': self.clutch,
+            'gearbox': self.gearbox}
+
+  def update(self, snapshot):
+    """
+    Controls listener, called with each tick's TelemetrySnapshot.
+    A fixed amount of work and no containers created.
+    """
+    if snapshot.vehicle != self.vehicle:
+      self.vehicle = snapshot.vehicle
+      self.reset()
+      self.driving = False
+    if snapshot.control != 0 or not snapshot.onTrack:
+      self.driving = False
+      return
+    t = snapshot.elapsedTime
+    if not self.driving:
+      # Starting to drive: take the gear and clutch as they are
+      self.driving = True
+      self.lastTime = self.leftGearAt = t
+      self.gear = snapshot.gear
+      self.engaged = snapshot.clutch >= self.bitePoint
+      return
+    dt = t - self.lastTime
+    self.lastTime = t
+    if dt < 0.0 or dt > MAX_TICK:
+      dt = 0.0
+    if snapshot.engineMaxRPM > 0.0:
+      self.maxRPM = snapshot.engineMaxRPM
+    maxRPM = self.maxRPM
+    engineRPM = snapshot.engineRPM
+    clutchRPM = snapshot.clutchRPM
+    clutch = snapshot.clutch
+    engaged = clutch >= self.bitePoint
+
+    gear = snapshot.gear
+    if gear != self.gear:
+      if self.gear != 0:
+        self.leftGearAt = t
+      if gear != 0:
+        self.gearChange(t - self.leftGearAt, engineRPM, clutchRPM, gear, self.lastGear)
+        self.lastGear = gear
+      self.gear = gear
+    if engaged and not self.engaged:
+      self.clutchEngage(engineRPM, clutchRPM)
+    self.engaged = engaged
+
+    if engineRPM > maxRPM:
+      self.engine += (engineRPM / maxRPM - 1.0) * OVER_REV_WEAR * dt
+    if gear != 0 and 0 < clutch < 100:
+      # Slipping, worse the harder the clutch is clamped
+      self.clutch += abs(engineRPM - clutchRPM) / maxRPM * clutch * 0.01 \
+        * CLUTCH_SLIP_WEAR * dt
+
+    if self.engine >= BLOWN and not self.blownSent:
+      self.blownSent = True
+      if self.blown:
+        self.blown()
+
   def gearChange(self, timeTaken, engineRPM, clutchRPM, to, _from):
     """
     The actual movement of the stick
     """
-    pass
+    if self.engaged:
+      # Without the clutch
+      self.gearbox += NO_CLUTCH_HIT + \
+        min(1.0, abs(engineRPM - clutchRPM) / self.maxRPM) * NO_CLUTCH_MISMATCH
+      self._overRev(clutchRPM)
+    elif self.ratios:
+      # Clutch down, will the engine survive it coming up?
+      predicted = self.ratios.predictRPM(to)
+      if predicted is not None and predicted > self.maxRPM:
+        self.overRevWarnings += 1
+        if self.overRev:
+          self.overRev(to, predicted)
+    if _from != 0 and timeTaken < MIN_SHIFT_TIME:
+      self.gearbox += FAST_SHIFT_HIT * (1.0 - timeTaken / MIN_SHIFT_TIME)
+
   def clutchEngage(self, engineRPM, clutchRPM):
     """
     Engaging the clutch
     What's the relation between clutchRPM and the speed of the car?
-      A bad change means a difference between what the clutch will end 
+      A bad change means a difference between what the clutch will end
       up running at and how fast the propshaft is driving the gearbox
     """
-    pass
-
+    if self.gear != 0:
+      self.clutch += min(1.0, abs(engineRPM - clutchRPM) / self.maxRPM) * CLUTCH_SHOCK
+      self._overRev(clutchRPM)
 
+  def _overRev(self, clutchRPM):
+    # The gearbox drags the engine up to clutchRPM
+    if clutchRPM > self.maxRPM:
+      self.engine += (clutchRPM / self.maxRPM - 1.0) * OVER_REV_HIT
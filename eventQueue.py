@@ -0,0 +1,184 @@
+# Every gear state machine event goes through one queue to one consumer.
+#
+# Events come from Controls' poll (gear, clutch, stop), the clutch sampler
+# and the graunch3 timer.  Rather than each of them running the state
+# machine on its own thread, put() adds the event to a ring and returns;
+# a single consumer thread takes them in order and calls the handler, so
+# the state machine and ClutchPrev are only ever touched by that thread.
+# (graunch_o's neutral pulses still run on the timer thread, graunch_o's
+# lock keeps them in step with graunchStart/Stop.)
+#
+# The ring is preallocated and bounded.  When it's full a gear or clutch
+# event is dropped, but STOP and TIMEOUT never are: they push out the
+# oldest gear or clutch event instead, or wait for room if every queued
+# event is a STOP or TIMEOUT.  Drops are logged.  Each entry holds the event, where
+# it came from (SOURCES), the perf_counter_ns() it was put and the
+# latency tickStart() of the poll that found it, so the consumer carries
+# on that tick's latency stages.  How deep the queue was at each put() and
+# how long each event waited are kept in latency.LatencyHistograms.
+#
+# synchronous: no thread, put() runs the handler there and then (replay,
+# the asyncio runtime).
+
+import threading
+from time import perf_counter_ns
+
+from latency import LatencyHistogram
+
+CAPACITY = 256
+
+# Sources
+GEAR = 'gear'
+CLUTCH = 'clutch'
+CLUTCH_SAMPLER = 'clutch sampler'
+TIMEOUT = 'timeout'
+STOP = 'stop'
+SOURCES = (GEAR, CLUTCH, CLUTCH_SAMPLER, TIMEOUT, STOP)
+CRITICAL = (TIMEOUT, STOP)   # never dropped while the queue is open
+
+class EventQueue:
+  """
+  handler(event, source, timestamp) is called for each event put(), in
+  order, on the consumer thread.  timestamp: perf_counter_ns() when put.
+  latency: a LatencyTracker whose ticks are carried on to the consumer
+  """
+  def __init__(self, handler, capacity=CAPACITY, synchronous=False, latency=None):
+    self.handler = handler
+    self.capacity = capacity
+    self.synchronous = synchronous
+    self.latency = latency
+    self._events = [0] * capacity
+    self._sources = [None] * capacity
+    self._times = [0] * capacity
+    self._starts = [None] * capacity
+    self._head = 0      # next to take
+    self._count = 0
+    self._cond = threading.Condition(threading.RLock())
+    self._closed = False
+    self.depth = LatencyHistogram()   # events already queued at each put()
+    self.wait = LatencyHistogram()    # microseconds from put() to handling
+    self.handled = 0
+    self.dropped = 0    # put() on a full or closed queue
+    self.evicted = 0    # queued events pushed out by a STOP or TIMEOUT
+    self.bySource = dict.fromkeys(SOURCES, 0)
+    self._thread = None
+    if not synchronous:
+      self._thread = threading.Thread(target=self._run, name='eventQueue', daemon=True)
+      self._thread.start()
+
+  def put(self, event, source):
+    """ Queue event, False if it had to be dropped """
+    now = perf_counter_ns()
+    start = self.latency.tickStart() if self.latency else None
+    with self._cond:
+      if self._count == self.capacity and not self._closed:
+        if source not in CRITICAL:
+          return self._drop(event, source, 'queue full')
+        if not self._evict() and not self._waitForRoom():
+          return self._drop(event, source, 'queue full')
+      if self._closed:
+        return self._drop(event, source, 'queue closed')
+      self.depth.record(self._count)
+      self.bySource[source] = self.bySource.get(source, 0) + 1
+      if self.synchronous:
+        self.wait.record(0)
+        self.handled += 1
+        self.handler(event, source, now)
+        return True
+      i = (self._head + self._count) % self.capacity
+      self._events[i] = event
+      self._sources[i] = source
+      self._times[i] = now
+      self._starts[i] = start
+      self._count += 1
+      self._cond.notify()
+    return True
+
+  def _drop(self, event, source, why):
+    self.dropped += 1
+    print('Event %s from %s dropped: %s' % (event, source, why))
+    return False
+
+  def _evict(self):
+    """ Push out the oldest queued event that isn't CRITICAL """
+    for n in range(self._count):
+      i = (self._head + n) % self.capacity
+      if self._sources[i] not in CRITICAL:
+        print('Event %s from %s dropped for a %s' % (
+          self._events[i], self._sources[i], 'later critical event'))
+        # close the gap by moving the events before it up one
+        while i != self._head:
+          j = (i - 1) % self.capacity
+          self._events[i] = self._events[j]
+          self._sources[i] = self._sources[j]
+          self._times[i] = self._times[j]
+          self._starts[i] = self._starts[j]
+          i = j
+        self._starts[i] = None
+        self._head = (self._head + 1) % self.capacity
+        self._count -= 1
+        self.evicted += 1
+        return True
+    return False
+
+  def _waitForRoom(self):
+    """ Wait for the consumer to take one, False if it can't """
+    if threading.current_thread() is self._thread:
+      return False    # the handler put it, waiting would never end
+    while self._count == self.capacity and not self._closed:
+      self._cond.wait()
+    return True
+
+  def pending(self):
+    with self._cond:
+      return self._count
+
+  def close(self):
+    """ Handle what's queued then stop the thread, later put()s are dropped """
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    if self._thread:
+      self._thread.join()
+
+  def _run(self):
+    latency = self.latency
+    while True:
+      with self._cond:
+        while not self._count and not self._closed:
+          self._cond.wait()
+        if not self._count:
+          return
+        i = self._head
+        event = self._events[i]
+        source = self._sources[i]
+        put = self._times[i]
+        start = self._starts[i]
+        self._starts[i] = None
+        self._head = (i + 1) % self.capacity
+        self._count -= 1
+        self._cond.notify_all()   # a STOP or TIMEOUT may wait for room
+      self.wait.record((perf_counter_ns() - put) // 1000)
+      if latency and start is not None:
+        latency.begin(start)
+      try:
+        self.handler(event, source, put)
+      except Exception as e:
+        print('Event %s from %s failed: %s' % (event, source, e))
+      finally:
+        if latency and start is not None:
+          latency.end()
+      self.handled += 1
+
+  def stats(self):
+    return {'handled': self.handled,
+            'dropped': self.dropped,
+            'evicted': self.evicted,
+            'depth max': self.depth.max,
+            'depth p99': self.depth.percentile(99),
+            'wait p50 uS': self.wait.percentile(50),
+            'wait p99 uS': self.wait.percentile(99),
+            'wait max uS': self.wait.max}
+
+  def __str__(self):
+    return ', '.join('%s %s' % item for item in self.stats().items())
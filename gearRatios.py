@@ -0,0 +1,120 @@
+# Learn each gear's ratio while driving.
+#
+# With a gear engaged the gearbox side of the clutch turns in step with
+# the wheels, so mClutchRPM / speed (the length of mLocalVel) is that
+# gear's overall ratio in RPM per m/S.  Every tick adds one sample to an
+# exponentially weighted least squares fit through the origin, which is
+# just two running sums per gear, so the memory and the work per tick are
+# the same however long the session.
+#
+# Ratios are kept per vehicle in a JSON file so a car that has been driven
+# before starts with its ratios and the fit only has to refine them.
+#
+# predictRPM(gear) is what the engine would be dragged to if the clutch
+# came up in that gear at the current speed - a multiply, cheap enough for
+# every tick.
+
+import json
+import os
+
+GEARS = range(-1, 9)       # reverse, neutral, 1st to 8th
+MIN_SPEED = 2.0            # m/S, slower samples are mostly wheelspin and noise
+MIN_SAMPLES = 10           # before a gear's ratio is trusted
+FORGET = 0.999             # per sample, old samples fade out (setup changed)
+PRIOR_SAMPLES = 20         # a cached ratio counts as this many samples...
+PRIOR_SPEED = 20.0         #   at this speed
+
+class GearRatios:
+  """
+  Controls listener, update() with each tick's TelemetrySnapshot.
+  """
+  def __init__(self, cacheFile=None):
+    self.cacheFile = cacheFile  # None: don't keep ratios between sessions
+    self.cache = {}             # {vehicle: {gear: ratio}}
+    if cacheFile and os.path.exists(cacheFile):
+      try:
+        with open(cacheFile) as f:
+          self.cache = json.load(f)
+      except (OSError, ValueError):
+        self.cache = {}
+    self.vehicle = None
+    self.speed = 0.0
+    n = len(GEARS)
+    self.sxy = [0.0] * n  # sum of speed * clutchRPM
+    self.sxx = [0.0] * n  # sum of speed * speed
+    self.n = [0] * n      # samples, a cached ratio counts as PRIOR_SAMPLES
+
+  def update(self, snapshot):
+    if snapshot.vehicle != self.vehicle:
+      self.setVehicle(snapshot.vehicle)
+    speed = snapshot.speed
+    self.speed = speed
+    gear = snapshot.gear
+    if gear == 0 or speed < MIN_SPEED or snapshot.clutchRPM <= 0.0:
+      return
+    i = gear + 1
+    rpm = snapshot.clutchRPM
+    self.sxy[i] = self.sxy[i] * FORGET + speed * rpm
+    self.sxx[i] = self.sxx[i] * FORGET + speed * speed
+    self.n[i] += 1
+
+  def ratio(self, gear):
+    """ RPM per m/S in gear, None if not known yet """
+    i = gear + 1
+    if gear == 0 or not 0 <= i < len(self.n) or self.n[i] < MIN_SAMPLES:
+      return None
+    return self.sxy[i] / self.sxx[i]
+
+  def ratios(self):
+    """ {gear: ratio} of the gears known """
+    result = {}
+    for gear in GEARS:
+      ratio = self.ratio(gear)
+      if ratio is not None:
+        result[gear] = ratio
+    return result
+
+  def predictRPM(self, gear, speed=None):
+    """
+    The clutch RPM in gear at speed (default: the latest speed),
+    None if the gear's ratio isn't known yet
+    """
+    ratio = self.ratio(gear)
+    if ratio is None:
+      return None
+    if speed is None:
+      speed = self.speed
+    return ratio * speed
+
+  def setVehicle(self, vehicle):
+    """ Keep what was learnt about the last vehicle, start on vehicle """
+    if self.vehicle:
+      self._remember()
+    self.vehicle = vehicle
+    for i in range(len(self.n)):
+      self.sxy[i] = self.sxx[i] = 0.0
+      self.n[i] = 0
+    for gear, ratio in self.cache.get(vehicle, {}).items():
+      i = int(gear) + 1
+      if 0 <= i < len(self.n):
+        self.sxx[i] = PRIOR_SAMPLES * PRIOR_SPEED * PRIOR_SPEED
+        self.sxy[i] = self.sxx[i] * ratio
+        self.n[i] = PRIOR_SAMPLES
+
+  def _remember(self):
+    ratios = self.ratios()
+    if ratios:
+      # JSON keys are strings
+      self.cache[self.vehicle] = {str(gear): ratio for gear, ratio in ratios.items()}
+
+  def save(self):
+    """ Write the ratios of every vehicle seen to cacheFile """
+    if self.vehicle:
+      self._remember()
+    if not self.cacheFile:
+      return
+    try:
+      with open(self.cacheFile, 'w') as f:
+        json.dump(self.cache, f, indent=1, sort_keys=True)
+    except OSError:
+      pass
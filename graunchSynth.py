@@ -0,0 +1,128 @@
+# The graunch noise follows how badly the revs are mismatched.
+#
+# The engine RPM - clutch RPM difference when the graunch starts picks one
+# of a number of buckets and each bucket has its own version of the wav
+# file: resampled higher pitched and louder the bigger the difference.
+# The versions are made by a background thread and kept in a small LRU
+# cache, so the memory used is bounded and nothing is resampled when a
+# graunch starts - if the bucket's version isn't ready yet the nearest one
+# that is (or the original) is played and the bucket's is made for next
+# time.
+
+from collections import OrderedDict
+import queue
+import threading
+
+MAX_RPM_DIFFERENCE = 5000.0   # and above, the top bucket
+LOW_PITCH = 0.8               # playback speed of the bottom bucket
+HIGH_PITCH = 1.6              #   and the top
+LOW_GAIN = 0.5                # volume of the bottom bucket
+HIGH_GAIN = 1.0               #   and the top
+
+def resample(sound, pitch, gain, name=None):
+  """
+  A new sound.Sound, sound played pitch times faster and gain times
+  louder.  Only 16 bit sounds can be changed, others are returned as they
+  are.
+  """
+  # Only GraunchSynth's thread gets here, numpy isn't needed to start
+  import numpy as np
+  from sound import Sound
+  if sound.sampleWidth != 2:
+    return sound
+  channels = sound.channels
+  src = np.frombuffer(sound.frames, '<i2')    # WAV is little-endian
+  n = len(src) // channels
+  src = src[:n * channels].reshape(n, channels)
+  m = max(1, int(n / pitch))
+  x = np.arange(m) * pitch
+  out = np.empty((m, channels), np.float64)
+  for c in range(channels):
+    # linear interpolation between the two nearest samples
+    out[:, c] = np.interp(x, np.arange(n), src[:, c])
+  out *= gain
+  np.clip(out, -32768.0, 32767.0, out=out)
+  return Sound(name or sound.name, channels, 2, sound.rate,
+               out.astype('<i2').tobytes())
+
+class GraunchSynth:
+  """
+  sound(rpmDifference) returns the version of the sound for that
+  difference at once, never resampling.
+  cacheSize: versions kept, None: one per bucket so none is made twice
+  """
+  def __init__(self, sound, buckets=8, cacheSize=None, maxDifference=MAX_RPM_DIFFERENCE):
+    self.base = sound
+    self.buckets = max(1, buckets)
+    self.cacheSize = max(1, cacheSize or self.buckets)
+    self.maxDifference = maxDifference
+    self.cache = OrderedDict()    # bucket: Sound, least recently used first
+    self._lock = threading.Lock()
+    self._queue = queue.Queue()
+    self._pending = set()         # buckets queued to be made
+    self.made = 0                 # resampled versions made (cache misses)
+    self._thread = threading.Thread(target=self._run, name='graunchSynth', daemon=True)
+    self._thread.start()
+    # Make the quieter end first, most graunches are small mismatches
+    for bucket in range(min(self.buckets, self.cacheSize)):
+      self._request(bucket)
+
+  def bucket(self, rpmDifference):
+    b = int(abs(rpmDifference) / self.maxDifference * self.buckets)
+    return b if b < self.buckets else self.buckets - 1
+
+  def sound(self, rpmDifference):
+    bucket = self.bucket(rpmDifference)
+    with self._lock:
+      cached = self.cache.get(bucket)
+      if cached is not None:
+        self.cache.move_to_end(bucket)
+        return cached
+      nearest = None
+      if self.cache:
+        b = min(self.cache, key=lambda b: abs(b - bucket))
+        self.cache.move_to_end(b)
+        nearest = self.cache[b]
+    self._request(bucket)
+    return nearest or self.base
+
+  def pitchAndGain(self, bucket):
+    if self.buckets == 1:
+      return 1.0, 1.0
+    x = bucket / (self.buckets - 1)
+    return (LOW_PITCH + (HIGH_PITCH - LOW_PITCH) * x,
+            LOW_GAIN + (HIGH_GAIN - LOW_GAIN) * x)
+
+  def _request(self, bucket):
+    with self._lock:
+      if bucket in self._pending or bucket in self.cache:
+        return
+      self._pending.add(bucket)
+    self._queue.put(bucket)
+
+  def waitUntilIdle(self):
+    """ Wait for the versions asked for so far to be made (for tests) """
+    self._queue.join()
+
+  def close(self):
+    self._queue.put(None)
+    self._thread.join()
+
+  def _run(self):
+    while True:
+      bucket = self._queue.get()
+      try:
+        if bucket is None:
+          return
+        pitch, gain = self.pitchAndGain(bucket)
+        made = resample(self.base, pitch, gain,
+                        name='%s@%d' % (self.base.name, bucket))
+        made.wavBytes()   # here, not when it's played
+        with self._lock:
+          self._pending.discard(bucket)
+          self.cache[bucket] = made
+          self.made += 1
+          while len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+      finally:
+        self._queue.task_done()
@@ -0,0 +1,106 @@
+# Run gearshift with no window: Controls and the gear state machine only.
+#
+# For monitoring boxes where nobody looks at the GUI.  Neither tkinter
+# nor winsound is imported (unless --sound winsound), config errors go to
+# the log instead of message boxes and there's no GUI tick competing with
+# the poll thread for the GIL.  Stop it with Ctrl+C.
+#
+# python headless.py [--sound none|winsound] [--log file] [--stats-interval 60]
+#                    [--ticks N] [--runtime threads|asyncio]
+
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from scheduler import RUNTIMES
+import Gearshift
+import sound
+
+log = logging.getLogger('gearshift')
+
+def logStats(controls_o, cpu=None):
+  # cpu: (time.process_time(), time.perf_counter()) at the start
+  stats = controls_o.schedulerStats()
+  if stats:
+    log.info('Scheduler: %s', stats)
+  log.info('Events: %s', Gearshift.eventQueue_o)
+  log.info('Reads: %s', controls_o.channelStats())
+  if Gearshift.watcher_o:
+    log.info('rF2: %s', Gearshift.watcher_o)
+  if cpu:
+    used = time.process_time() - cpu[0]
+    log.info('CPU %.2f%% (%.3f s in %.1f s), %d threads', 100 * used / (time.perf_counter() - cpu[1]),
+             used, time.perf_counter() - cpu[1], threading.active_count())
+  for line in controls_o.latency.report().split('\n'):
+    log.info(line)
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Run gearshift without a GUI')
+  parser.add_argument('--sound', default=sound.NONE,
+                      choices=sorted(sound.backends))
+  parser.add_argument('--log', help='log file (default: stderr)')
+  parser.add_argument('--stats-interval', type=float, default=60.0,
+                      help='seconds between logging the statistics, 0: only at exit')
+  parser.add_argument('--ticks', type=int, default=0,
+                      help='stop after this many ticks and print when the first was '
+                      '(for startupBenchmark.py)')
+  parser.add_argument('--runtime', choices=RUNTIMES,
+                      help="override gearshift.ini's [scheduler] runtime")
+  parser.add_argument('--no-watch', action='store_true',
+                      help="poll even when rF2 isn't running")
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(filename=args.log, level=logging.INFO,
+                      format='%(asctime)s %(levelname)s %(message)s')
+  cpu = (time.process_time(), time.perf_counter())
+  # --ticks (startupBenchmark) wants ticks whether rF2 is running or not
+  watchRF2 = False if args.no_watch or args.ticks else None
+  controls_o, _graunch_o, neutralButtonKeycode = Gearshift.main(soundBackend=args.sound,
+                                                                runtime=args.runtime,
+                                                                watchRF2=watchRF2)
+  runtime_o = Gearshift.runtime_o
+  log.info('%s running headless, neutral button %s', Gearshift.versionStr,
+           neutralButtonKeycode)
+  Gearshift.get_neutral_control(report=Gearshift.logConfigError)
+
+  if args.ticks:
+    if runtime_o:
+      def check():
+        if controls_o.ticks >= args.ticks:
+          runtime_o.loop.stop()
+      runtime_o.every(0.01, check)
+      runtime_o.run()
+    else:
+      while controls_o.ticks < args.ticks:
+        time.sleep(0.01)
+    Gearshift.shutdown(controls_o)
+    print('first tick %.6f' % controls_o.firstTick)
+    return
+
+  try:
+    if runtime_o:
+      if args.stats_interval:
+        runtime_o.every(args.stats_interval, lambda: logStats(controls_o, cpu))
+      # Wakes up once a second, Ctrl+C doesn't interrupt a long wait on Windows
+      runtime_o.every(1.0, lambda: None)
+      runtime_o.run()
+    else:
+      # Short sleeps, Ctrl+C doesn't interrupt a long wait on Windows
+      waited = 0.0
+      while True:
+        time.sleep(1.0)
+        waited += 1.0
+        if args.stats_interval and waited >= args.stats_interval:
+          logStats(controls_o, cpu)
+          waited = 0.0
+  except KeyboardInterrupt:
+    pass
+  finally:
+    Gearshift.shutdown(controls_o)
+    logStats(controls_o, cpu)
+    log.info('Stopped')
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
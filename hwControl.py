@@ -0,0 +1,146 @@
+# Force neutral through the rF2 Shared Memory plugin instead of a keystroke.
+#
+# The plugin reads hardware control requests from its input buffer
+# $rFactor2SMMP_HWControl$ (it has to be enabled in
+# UserData\player\CustomPluginVariables.JSON, "EnableHWControlInput": 1)
+# and passes them to rF2 as if the control had been operated.  Writing
+# there skips the OS input queue, doesn't care which window has the focus
+# and doesn't need a key mapped in controller.json.
+#
+# The buffer is the plugin's rF2HWControl struct.  A request is written
+# inside mVersionUpdateBegin / mVersionUpdateEnd, the same as the plugin
+# does for the buffers it writes: Begin is bumped, the request written,
+# then End is set to match.  The plugin only acts on a new, consistent
+# version.
+#
+# On Windows the plugin's mapping is opened, never created: if the plugin
+# isn't loaded or its HW control input isn't enabled there's no mapping and
+# HWControl() raises OSError, so Gearshift falls back to the key.  (mmap
+# would quietly create a mapping of its own that nothing reads.)
+# On anything else (or given a path) the buffer is a file, so it can be
+# tested without rF2.
+
+import ctypes
+import mmap
+import os
+import sys
+
+BUFFER_NAME = '$rFactor2SMMP_HWControl$'
+LAYOUT_VERSION = 1              # rF2HWControl::SUPPORTED_LAYOUT_VERSION
+MAX_HWCONTROL_NAME_LEN = 96
+PRESSED = 1.0
+RELEASED = 0.0
+FILE_MAP_WRITE = 0x0002   # read / write access
+
+class rF2HWControl(ctypes.Structure):
+  _pack_ = 4
+  _fields_ = [('mVersionUpdateBegin', ctypes.c_uint32),
+              ('mVersionUpdateEnd', ctypes.c_uint32),
+              ('mLayoutVersion', ctypes.c_int32),
+              ('mControlName', ctypes.c_char * MAX_HWCONTROL_NAME_LEN),
+              ('mfRetVal', ctypes.c_double)]
+
+class NamedMapping:
+  """
+  A view of an existing Windows named file mapping, OSError if there's no
+  mapping called name.  kernel32, lastError: for testing
+  """
+  def __init__(self, name, size, kernel32=None, lastError=None):
+    if kernel32 is None:
+      kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+      kernel32.OpenFileMappingW.restype = ctypes.c_void_p
+      kernel32.OpenFileMappingW.argtypes = (ctypes.c_uint32, ctypes.c_int, ctypes.c_wchar_p)
+      kernel32.MapViewOfFile.restype = ctypes.c_void_p
+      kernel32.MapViewOfFile.argtypes = (ctypes.c_void_p, ctypes.c_uint32, ctypes.c_uint32,
+                                         ctypes.c_uint32, ctypes.c_size_t)
+      kernel32.UnmapViewOfFile.argtypes = (ctypes.c_void_p,)
+      kernel32.CloseHandle.argtypes = (ctypes.c_void_p,)
+      lastError = ctypes.get_last_error
+    self._kernel32 = kernel32
+    self.address = None
+    self.handle = kernel32.OpenFileMappingW(FILE_MAP_WRITE, False, name)
+    if not self.handle:
+      raise OSError(lastError(), '%s not found, is the rF2 Shared Memory plugin '
+                    'running with "EnableHWControlInput": 1?' % name)
+    self.address = kernel32.MapViewOfFile(self.handle, FILE_MAP_WRITE, 0, 0, size)
+    if not self.address:
+      error = lastError()
+      self.close()
+      raise OSError(error, "Can't map %s" % name)
+
+  def close(self):
+    if self.address:
+      self._kernel32.UnmapViewOfFile(self.address)
+      self.address = None
+    if self.handle:
+      self._kernel32.CloseHandle(self.handle)
+      self.handle = None
+
+class HWControl:
+  """
+  The plugin's hardware control input buffer, OSError if the plugin
+  doesn't provide it
+  """
+  def __init__(self, path=None):
+    size = ctypes.sizeof(rF2HWControl)
+    self._file = None
+    self._map = None
+    self._mapping = None
+    if path is None and sys.platform == 'win32':
+      self._mapping = NamedMapping(BUFFER_NAME, size)
+      self.buffer = rF2HWControl.from_address(self._mapping.address)
+    else:
+      if path is None:
+        import tempfile
+        path = os.path.join(tempfile.gettempdir(), BUFFER_NAME)
+      if not os.path.exists(path) or os.path.getsize(path) < size:
+        with open(path, 'wb') as f:
+          f.write(bytes(size))
+      self._file = open(path, 'r+b')
+      self._map = mmap.mmap(self._file.fileno(), size)
+      self.buffer = rF2HWControl.from_buffer(self._map)
+    self.requests = 0
+
+  def request(self, controlName, retVal=PRESSED):
+    """ Ask rF2 to operate controlName """
+    b = self.buffer
+    version = (b.mVersionUpdateEnd + 1) & 0xFFFFFFFF
+    b.mVersionUpdateBegin = version
+    b.mLayoutVersion = LAYOUT_VERSION
+    b.mControlName = controlName.encode()[:MAX_HWCONTROL_NAME_LEN - 1]
+    b.mfRetVal = retVal
+    b.mVersionUpdateEnd = version
+    self.requests += 1
+
+  def close(self):
+    del self.buffer   # the map can't be closed while the struct uses it
+    if self._map:
+      self._map.close()
+    if self._mapping:
+      self._mapping.close()
+    if self._file:
+      self._file.close()
+
+class HWControlKeys:
+  """
+  keySender backend: the neutral button goes to the plugin as the
+  controlName hardware control, other keys (debug, ignition) go to
+  fallback (DirectInputKeys)
+  """
+  def __init__(self, hwControl, neutralButton, controlName, fallback=None):
+    self.hwControl = hwControl
+    self.neutralButton = neutralButton
+    self.controlName = controlName
+    self.fallback = fallback
+
+  def press(self, key):
+    if key == self.neutralButton:
+      self.hwControl.request(self.controlName, PRESSED)
+    elif self.fallback:
+      self.fallback.press(key)
+
+  def release(self, key):
+    if key == self.neutralButton:
+      self.hwControl.request(self.controlName, RELEASED)
+    elif self.fallback:
+      self.fallback.release(key)
@@ -0,0 +1,141 @@
+# All the key presses go out from one thread.
+#
+# press(), release() and pressRelease() only queue the key and return, so
+# a slow SendInput() can't hold up the poll loop, the state machine or the
+# graunch timers.  The key thread sends them in the order they were
+# queued, so a key's press always goes before its release.
+#
+# A press of a key that's already down (or queued to go down), or a
+# release of one that's already up, changes nothing and is dropped - the
+# state machine releases Neutral on nearly every event.
+#
+# The queue is bounded.  When it's full presses are dropped but releases
+# never are, a key mustn't be left held down.
+
+from collections import deque
+import threading
+import time
+
+import latency
+
+MAX_QUEUE = 64
+
+class DirectInputKeys:
+  """ Sends the keys with pyDirectInputKeySend """
+  def __init__(self, module=None):
+    if module is None:
+      import pyDirectInputKeySend.directInputKeySend as module
+    self.module = module
+
+  def press(self, key):
+    self.module.PressKey(key)
+
+  def release(self, key):
+    self.module.ReleaseKey(key)
+
+class RecordingKeys:
+  """ Sends nothing, keeps a list of (time, 'press'/'release', key) """
+  def __init__(self, clock=time.perf_counter):
+    self.clock = clock
+    self.events = []
+
+  def press(self, key):
+    self.events.append((self.clock(), 'press', key))
+
+  def release(self, key):
+    self.events.append((self.clock(), 'release', key))
+
+class KeySender:
+  """
+  Queue keys for backend (DirectInputKeys or RecordingKeys) to send.
+  synchronous: send them straight away on the caller's thread (replay).
+  latency: a LatencyTracker, the time from the start of the tick to a key
+           press being sent is recorded as latency.KEY_SENT
+  """
+  def __init__(self, backend, maxQueue=MAX_QUEUE, synchronous=False, latency=None):
+    self.backend = backend
+    self.maxQueue = maxQueue
+    self.synchronous = synchronous
+    self.latency = latency
+    self._cond = threading.Condition()
+    self._queue = deque()   # (key, down, tick start)
+    self._state = {}        # key: True down / False up, as last queued
+    self._sending = False
+    self._closed = False
+    self.sent = 0
+    self.coalesced = 0      # redundant presses and releases dropped
+    self.dropped = 0        # presses dropped because the queue was full
+    self._thread = None
+    if not synchronous:
+      self._thread = threading.Thread(target=self._run, name='keySender', daemon=True)
+      self._thread.start()
+
+  def press(self, key):
+    self._put(key, True)
+
+  def release(self, key):
+    self._put(key, False)
+
+  def pressRelease(self, key):
+    self._put(key, True)
+    self._put(key, False)
+
+  def _put(self, key, down):
+    start = self.latency.tickStart() if self.latency and down else None
+    with self._cond:
+      if self._state.get(key) == down:
+        self.coalesced += 1
+        return
+      if down and len(self._queue) >= self.maxQueue:
+        self.dropped += 1
+        return
+      self._state[key] = down
+      if not self.synchronous:
+        self._queue.append((key, down, start))
+        self._cond.notify()
+        return
+    self._send(key, down, start)
+
+  def _send(self, key, down, start):
+    if down:
+      self.backend.press(key)
+    else:
+      self.backend.release(key)
+    self.sent += 1
+    if start is not None:
+      self.latency.record(latency.KEY_SENT,
+                          (time.perf_counter_ns() - start) // 1000)
+
+  def pending(self):
+    """ Keys queued or being sent """
+    with self._cond:
+      return len(self._queue) + self._sending
+
+  def flush(self, timeout=None):
+    """ Wait until everything queued has been sent """
+    with self._cond:
+      return self._cond.wait_for(lambda: not self._queue and not self._sending, timeout)
+
+  def close(self):
+    """ Send what's queued then stop the thread """
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    if self._thread:
+      self._thread.join()
+
+  def _run(self):
+    while True:
+      with self._cond:
+        while not self._queue and not self._closed:
+          self._cond.wait()
+        if not self._queue:
+          return
+        key, down, start = self._queue.popleft()
+        self._sending = True
+      try:
+        self._send(key, down, start)
+      finally:
+        with self._cond:
+          self._sending = False
+          self._cond.notify_all()
@@ -0,0 +1,160 @@
+# How long it takes from reading a bad gear change to sending Neutral.
+#
+# Each tick of Controls.monitor() starts the clock as it reads the
+# telemetry.  As the tick's work reaches each stage
+#   read          the telemetry snapshot has been copied
+#   dispatch      the event is handed to the gear state machine
+#   graunchStart  the state machine has decided it's a graunch
+#   neutral key   the neutral button press has been queued
+#   key sent      the key thread's SendInput() for it has returned
+# the time since the start of the tick is added to that stage's histogram.
+# Only the tick's own thread counts - graunch2() is also run by the timers
+# to repeat the key and those presses don't have a start time.  The key
+# thread is given the start time with the key, see keySender.py, and the
+# event queue's thread carries on the tick of the event it's handling, see
+# eventQueue.py.
+#
+# The histograms are HDR style: buckets are linear within each power of two
+# so any value is held to within about 3% in a fixed, small array, and
+# recording is a few integer operations.  Cheap enough to leave on.
+
+import threading
+from time import perf_counter_ns
+
+READ          = 'read'
+DISPATCH      = 'dispatch'
+GRAUNCH_START = 'graunchStart'
+NEUTRAL_KEY   = 'neutral key'
+KEY_SENT      = 'key sent'
+STAGES = (READ, DISPATCH, GRAUNCH_START, NEUTRAL_KEY, KEY_SENT)
+
+SUB_BUCKET_BITS = 5               # 32 sub-buckets per power of two, ~3%
+MAX_MICROSECONDS = 60 * 1000000   # longer than this is counted as this
+
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_HALF = _SUB_BUCKETS >> 1
+
+def bucketIndex(value):
+  """ Bucket of a non-negative int """
+  if value < _SUB_BUCKETS:
+    return value
+  shift = value.bit_length() - SUB_BUCKET_BITS
+  return shift * _HALF + (value >> shift)
+
+def bucketLowest(index):
+  """ The smallest value in bucket index """
+  if index < _SUB_BUCKETS:
+    return index
+  shift = index // _HALF - 1
+  return (index - shift * _HALF) << shift
+
+_N_BUCKETS = bucketIndex(MAX_MICROSECONDS) + 1
+
+class LatencyHistogram:
+  """ Latencies in microseconds """
+  def __init__(self):
+    self.counts = [0] * _N_BUCKETS
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+  def record(self, microseconds):
+    if microseconds > MAX_MICROSECONDS:
+      microseconds = MAX_MICROSECONDS
+    elif microseconds < 0:
+      microseconds = 0
+    self.counts[bucketIndex(microseconds)] += 1
+    self.count += 1
+    self.total += microseconds
+    if microseconds > self.max:
+      self.max = microseconds
+
+  def percentile(self, percent):
+    """
+    The value percent of the latencies are at or below (to bucket
+    precision), 0 if nothing recorded
+    """
+    if not self.count:
+      return 0
+    wanted = max(1, -(-self.count * percent // 100))  # rounded up
+    seen = 0
+    for index, n in enumerate(self.counts):
+      seen += n
+      if seen >= wanted:
+        # The highest value in the bucket, but never above the real max
+        return min(bucketLowest(index + 1) - 1, self.max)
+    return self.max
+
+  def mean(self):
+    if not self.count:
+      return 0.0
+    return self.total / self.count
+
+  def reset(self):
+    self.__init__()
+
+class LatencyTracker:
+  """
+  One histogram per stage.
+  begin() at the start of a tick, mark(stage) as each stage is reached,
+  end() when the tick is done.
+  """
+  def __init__(self, enabled=True):
+    self.enabled = enabled
+    self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+    self._tick = threading.local()  # .start, of the tick this thread is in
+
+  def begin(self, start=None):
+    """ start: carry on a tick begun on another thread, its tickStart() """
+    if self.enabled:
+      self._tick.start = perf_counter_ns() if start is None else start
+
+  def mark(self, stage):
+    start = getattr(self._tick, 'start', None)
+    if start is not None:
+      self.histograms[stage].record((perf_counter_ns() - start) // 1000)
+
+  def tickStart(self):
+    """ perf_counter_ns() at the start of the tick, None if not in one """
+    return getattr(self._tick, 'start', None)
+
+  def record(self, stage, microseconds):
+    """ For a stage timed on another thread, from tickStart() """
+    self.histograms[stage].record(microseconds)
+
+  def end(self):
+    self._tick.start = None
+
+  def reset(self):
+    for histogram in self.histograms.values():
+      histogram.reset()
+
+  def stats(self):
+    """ {stage: {'count', 'p50', 'p99', 'max', 'mean'}}, microseconds """
+    result = {}
+    for stage in STAGES:
+      h = self.histograms[stage]
+      result[stage] = {'count': h.count,
+                       'p50': h.percentile(50),
+                       'p99': h.percentile(99),
+                       'max': h.max,
+                       'mean': h.mean()}
+    return result
+
+  def report(self):
+    lines = ['Latency from reading rF2 (microseconds)',
+             '%-13s %8s %8s %8s %8s' % ('stage', 'count', 'p50', 'p99', 'max')]
+    for stage, s in self.stats().items():
+      lines.append('%-13s %8d %8d %8d %8d' % (stage, s['count'], s['p50'],
+                                              s['p99'], s['max']))
+    return '\n'.join(lines)
+
+  def dump(self, path):
+    """ Write report() and each stage's non-empty buckets to path """
+    with open(path, 'w') as f:
+      f.write(self.report())
+      f.write('\n\nstage, bucket lowest microseconds, count\n')
+      for stage in STAGES:
+        for index, n in enumerate(self.histograms[stage].counts):
+          if n:
+            f.write('%s, %d, %d\n' % (stage, bucketLowest(index), n))
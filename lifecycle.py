@@ -0,0 +1,121 @@
+# Watch for rF2 starting and stopping.
+#
+# Without it Controls polls the memory map rate times a second and the GUI
+# refreshes 5 times a second all day long, only to find rF2 isn't running.
+# RF2Watcher looks for rF2's process with psutil instead: while it's not
+# there the looks get further apart (MIN_BACKOFF doubling up to
+# MAX_BACKOFF), once it's found only that process is checked every
+# PRESENT_INTERVAL, which is cheap.  onStop() is called when rF2 goes (or
+# isn't there at the first look) and onStart() when it's back, Gearshift
+# pauses and resumes the polling with them.
+#
+# The looks are timers on a TimerService (or the asyncio runtime's), so
+# there's no thread of its own and nothing runs in between.
+
+import threading
+
+import psutil
+
+# rF2 and its dedicated server
+PROCESS_NAMES = ('rFactor2.exe', 'rFactor2 Dedicated.exe')
+MIN_BACKOFF = 0.5       # seconds
+MAX_BACKOFF = 30.0
+PRESENT_INTERVAL = 2.0  # seconds between checking rF2 is still running
+
+def findProcess(names=PROCESS_NAMES):
+  """ The first running process called one of names, or None """
+  for process in psutil.process_iter(['name']):
+    if process.info['name'] in names:
+      return process
+  return None
+
+class RF2Watcher:
+  """
+  Calls onStart() / onStop() on timers' thread when rF2 starts / stops.
+  It starts off assuming rF2 is running, as Controls does.
+  find(): the rF2 process, None if it's not running (findProcess)
+  """
+  def __init__(self, timers, onStart, onStop, find=findProcess,
+               minBackoff=MIN_BACKOFF, maxBackoff=MAX_BACKOFF,
+               presentInterval=PRESENT_INTERVAL):
+    self.timers = timers
+    self.onStart = onStart
+    self.onStop = onStop
+    self.find = find
+    self.minBackoff = minBackoff
+    self.maxBackoff = maxBackoff
+    self.presentInterval = presentInterval
+    self.process = None
+    self.running = True   # what onStart / onStop last said
+    self.backoff = minBackoff
+    self._handle = None
+    self._stopped = False
+    self._lock = threading.RLock()  # stop() waits for a look in progress
+    # Statistics
+    self.searches = 0
+    self.checks = 0
+    self.starts = 0
+    self.stops = 0
+
+  def start(self):
+    """ The first look, straight away """
+    self._schedule(0)
+
+  def _schedule(self, delay):
+    self._handle = self.timers.schedule(delay, self._look)
+
+  def _look(self):
+    with self._lock:
+      if self._stopped:
+        return
+      delay = self.backoff    # if a callback fails
+      try:
+        if self.process is not None:
+          self.checks += 1
+          if self.process.is_running():
+            delay = self.presentInterval
+          else:
+            self.process = None
+            delay = self._absent()
+        else:
+          self.searches += 1
+          self.process = self.find()
+          if self.process is not None:
+            self.backoff = self.minBackoff
+            delay = self.presentInterval
+            if not self.running:
+              self.running = True
+              self.starts += 1
+              self.onStart()
+          else:
+            delay = self._absent()
+      finally:
+        if not self._stopped:
+          self._schedule(delay)
+
+  def _absent(self):
+    """ rF2 isn't running, the delay to the next look """
+    if self.running:
+      self.running = False
+      self.stops += 1
+      self.backoff = self.minBackoff
+      self.onStop()
+    delay = self.backoff
+    self.backoff = min(self.backoff * 2, self.maxBackoff)
+    return delay
+
+  def stop(self):
+    with self._lock:
+      self._stopped = True
+      if self._handle:
+        self._handle.cancel()
+
+  def stats(self):
+    return {'running': self.running,
+            'searches': self.searches,
+            'checks': self.checks,
+            'starts': self.starts,
+            'stops': self.stops}
+
+  def __str__(self):
+    return ', '.join('%s %s' % item for item in self.stats().items())
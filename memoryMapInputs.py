@@ -3,46 +3,124 @@
 # https://github.com/TheIronWolfModding/rF2SharedMemoryMapPlugin
 # https://forum.studio-397.com/index.php?members/k3nny.35143/
 
-from scheduler import MyThread
+import threading
+from time import perf_counter, time
+
+from channels import Channel
+from latency import LatencyTracker, READ
+from scheduler import PeriodicThread, FrameSyncThread, DEFAULT_RATE, SKIP, FRAME, \
+    TIMER, MAX_FRAME_RATE, clampRate
 
 from pyRfactor2SharedMemory.sharedMemoryAPI import SimInfoAPI,\
     Cbytestring2Python
-from mockMemoryMap import gui
+from telemetrySnapshot import SnapshotReader, TelemetrySnapshot
 
-tick_interval = 0.1 # seconds
-_timestamp = 0
 
 class Controls:
   """
   Monitor the gears, clutch etc. in the shared memory.
   Send events to callback when there are changes
   """
-  def __init__(self, debug=0, mocking=False):
+  def __init__(self, debug=0, mocking=False, rate=DEFAULT_RATE, overrunPolicy=SKIP,
+               info=None, latency=None, pollMode=TIMER, channelRates=None):
     self.debug = debug
     self.mocking=mocking
-    self.info = SimInfoAPI()
+    self.rate = clampRate(rate)         # ticks per second
+    self.overrunPolicy = overrunPolicy
+    # FRAME: tick when rF2 writes new telemetry, otherwise rate times a second
+    self.pollMode = pollMode
+    self.thread = None
+    self.runtime = None
+    self.paused = False   # by pause(), e.g. while rF2 isn't running
+    self.listeners = []   # called with each tick's snapshot
+    self.resumeListeners = []  # called by resume(), e.g. the GUI
+    self.clutchEvents = True  # False: a clutchSampler.ClutchSampler sends them
+    self.ticks = 0
+    self.firstTick = None # time.time() of the first tick, for startupBenchmark
+    if info is None:  # e.g. replay.ReplayInfo instead of rF2
+      info = SimInfoAPI()
+    self.info = info
+    if latency is None:
+      latency = LatencyTracker()
+    self.latency = latency  # times from reading rF2 to sending Neutral
+    self._timestamp = 0   # mElapsedTime last tick
+    # What changes slowly is read at its own rate, channelRates
+    # {'scoring', 'session', 'liveness': Hz}, missing or 0: every tick
+    rates = channelRates or {}
+    self.reader = SnapshotReader(self.info, control=False)
+    self.scoring = Channel('scoring', self.__readControl, rates.get('scoring'))
+    self.names = Channel('names', self.__readNames, rates.get('scoring'))
+    self.session = Channel('session', self.__readSession, rates.get('session'))
+    self.liveness = Channel('liveness', self.info.isRF2running, rates.get('liveness'))
     self._SMactive = False
+    self.vehicleName = ''
+    self.driverName = ''
+    self.names.get(perf_counter())
+    # Double buffer: each tick fills the snapshot not published, then
+    # publishes it.  The GUI thread reads self.snapshot without a lock.
+    self._buffers = [TelemetrySnapshot(), TelemetrySnapshot()]
+    self._back = 1
+    self.snapshot = self.__readSnapshot(self._buffers[0])
     if self.debug > 5:
       self.clutchState = 0
       self.currentGear = 0
     else:
-      self.clutchState = self.__readClutch()
-      self.currentGear = self.__readGear()
+      self.clutchState = self.snapshot.clutch
+      self.currentGear = self.snapshot.gear
 
-  def __readClutch(self):
+  def __readNames(self):
     if self.debug > 5:
-      return 100 # clutch is not pressed
-    _c = self.info.playersVehicleTelemetry().mUnfilteredClutch # 1.0 clutch down, 0 clutch up
-    # We want 100 clutch released, 0 clutch pressed
-    return int(-(_c-1)*100)
-  def __readGear(self):
+      return
+    self.vehicleName = Cbytestring2Python(self.info.playersVehicleScoring().mVehicleName)
+    self.driverName = self.info.driverName()
+
+  def __readControl(self):
+    return self.info.playersVehicleScoring().mControl
+
+  def __readSession(self):
+    # (track loaded, on track)
+    if not self.info.isTrackLoaded():
+      return False, False
+    return True, bool(self.info.isOnTrack())
+
+  def __readSnapshot(self, snapshot, now=None):
     if self.debug > 5:
-      return 1  # trying to get first
-    return self.info.playersVehicleTelemetry().mGear  # -1 to number of gears, 0 is neutral
+      snapshot.gear = 1       # trying to get first
+      snapshot.clutch = 100   # clutch is not pressed
+      return snapshot
+    self.reader.read(snapshot)
+    snapshot.control = self.scoring.get(perf_counter() if now is None else now)
+    return snapshot
 
   def monitor(self):
-    # Run every tick_interval
-    stop = self.reasons2stop()
+    # Run every tick (rate times a second)
+    self.latency.begin()
+    if not self.ticks:
+      self.firstTick = time()
+    self.ticks += 1
+    try:
+      self.__monitor()
+    finally:
+      self.latency.end()
+
+  def __monitor(self):
+    # Everything this tick uses comes from the one snapshot
+    snapshot = self._buffers[self._back]
+    snapshot.tick = -1    # a reader still holding it will see it changing
+    now = perf_counter()
+    self.__readSnapshot(snapshot, now)
+    self.latency.mark(READ)
+    if not self._SMactive:
+      # Only while not driving, the car can't change while driving
+      self.names.get(now)
+    snapshot.vehicle = self.vehicleName
+    snapshot.driver = self.driverName
+    stop = self.reasons2stop(snapshot, now)
+    snapshot.tick = self.ticks
+    self.snapshot = snapshot
+    self._back ^= 1
+    for listener in self.listeners:
+      listener(snapshot)
     if stop:
       self.callback(stopEvent=True)
       self._SMactive = False
@@ -50,51 +128,61 @@ class Controls:
         print('SM stopped because %s' % stop)
     else:
       self._SMactive = True
-      if self.currentGear != self.__readGear():
-        self.currentGear   = self.__readGear()
+      if self.currentGear != snapshot.gear:
+        self.currentGear   = snapshot.gear
         if self.debug > 0:
           print('[MemoryMapped] gear: %s' % self.currentGear)
         #driver = Cbytestring2Python(self.playersVehicleScoring().mDriverName)
         self.callback(gearEvent=self.currentGear)
 
-      if self.clutchState != self.__readClutch():
-        self.clutchState   = self.__readClutch()
-        if self.getDriverType() == 0:
+      if self.clutchState != snapshot.clutch:
+        self.clutchState   = snapshot.clutch
+        if snapshot.control == 0 and self.clutchEvents:
           self.callback(clutchEvent=self.clutchState)
 
       # debug print when clutch RPM > engine RPM (when slamming down a gear)
-      mEngineRPM = int(self.info.playersVehicleTelemetry().mEngineRPM)
-      mClutchRPM = int(self.info.playersVehicleTelemetry().mClutchRPM)
-
-      if self.info.playersVehicleTelemetry().mUnfilteredClutch < .9: # 1.0 clutch down, 0 clutch up
-        if mClutchRPM > mEngineRPM:
-          #print(mClutchRPM, mEngineRPM)
+      if snapshot.clutch > 10: # i.e. mUnfilteredClutch < .9
+        if snapshot.clutchRPM > snapshot.engineRPM:
+          #print(int(snapshot.clutchRPM), int(snapshot.engineRPM))
           pass
 
-  def reasons2stop(self):
+  def reasons2stop(self, snapshot=None, now=None):
     # Return text if the state machine should stop
-    # and with it the graunching
-    global _timestamp
+    # and with it the graunching.
+    # The status found on the way is left in snapshot for the GUI
     ret = ''
 
+    if snapshot is None:
+      snapshot = self.snapshot
+    if now is None:
+      now = perf_counter()
     if not self.mocking:
-      if not self.info.isRF2running():
+      snapshot.rF2running = snapshot.trackLoaded = snapshot.onTrack = False
+      snapshot.escape = False
+      if not self.liveness.get(now):
         return 'rF2 not running'
-      if not self.info.isTrackLoaded():
+      if self.liveness.changed:   # just started, don't wait for the rest
+        self.session.expire()
+        self.scoring.expire()
+      snapshot.rF2running = True
+      trackLoaded, onTrack = self.session.get(now)
+      if not trackLoaded:
         return 'Track not loaded'
-      if not self.info.isOnTrack():
+      snapshot.trackLoaded = True
+      if not onTrack:
         return 'Not on track'
-      if self.getDriverType() != 0:
+      snapshot.onTrack = True
+      snapshot.escape = not self._timestamp < snapshot.elapsedTime
+      self._timestamp = snapshot.elapsedTime
+      if snapshot.control != 0:
         return 'AI in control'
       #if not self.info.playersVehicleTelemetry().mIgnitionStarter:  # Ignition off
       #  return 'Ignition off'
-      if self.info.playersVehicleTelemetry().mEngineRPM == 0:  # Engine has stopped
+      if snapshot.engineRPM == 0:  # Engine has stopped
         return 'Engine stopped'
-      if not _timestamp < self.info.playersVehicleTelemetry().mElapsedTime:
+      if snapshot.escape:
           ret = 'Esc pressed, mElapsedTime stopped'
 
-      _timestamp = self.info.playersVehicleTelemetry().mElapsedTime
-
     # OK, no reason NOT to run the state machine
     return ret
 
@@ -103,25 +191,96 @@ class Controls:
     return self._SMactive
 
   def getMaxRevs(self):
-    return self.info.playersVehicleTelemetry().mEngineMaxRPM
+    return self.snapshot.engineMaxRPM
 
   def getMaxGears(self):
-    return self.info.playersVehicleTelemetry().mMaxGears
+    return self.snapshot.maxGears
 
   def getDriverType(self):
     # Who's in control: -1=nobody (shouldn't get this), 0=local player, 1=local AI, 2=remote, 3=replay (shouldn't get this)
-    return self.info.playersVehicleScoring().mControl
+    return self.snapshot.control
+
+  def addListener(self, listener):
+    """ listener(snapshot) will be called every tick """
+    self.listeners.append(listener)
 
-  def run(self, callback):
-    """ Event loop """
+  def run(self, callback, runtime=None):
+    """
+    Event loop, a thread of its own or on runtime's
+    (an asyncRuntime.AsyncRuntime)
+    """
     self.callback = callback
-    self.thread = MyThread(self.monitor, tick_interval)
-    self.thread.start()
+    self.runtime = runtime
+    if runtime:   # can't spin on the loop, always TIMER
+      self.thread = runtime.every(1.0 / self.rate, self.monitor, self.overrunPolicy)
+    elif self.pollMode == FRAME:
+      # Ticks at the tick rate while no frames are coming
+      self.thread = FrameSyncThread(self.monitor,
+                                    version=lambda: self.info.Rf2Tele.mVersionUpdateEnd,
+                                    staleTimeout=1.0 / self.rate)
+      self.thread.start()
+    else:
+      self.thread = PeriodicThread(self.monitor, self.rate, self.overrunPolicy)
+      self.thread.start()
+
+  def maxRate(self):
+    """ The most ticks a second, for sizing buffers of ticks """
+    if self.pollMode == FRAME:   # a tick each frame
+      return max(self.rate, MAX_FRAME_RATE)
+    return self.rate
 
   def stop(self):
     """ Stop the event loop """
     self.thread.stop()
 
+  def pause(self):
+    """
+    Stop the event loop until resume().  One last tick stops the state
+    machine and leaves the status in the snapshot for the GUI.
+    """
+    if self.paused:
+      return
+    self.paused = True
+    self.stop()
+    if hasattr(self.thread, 'join') and self.thread is not threading.current_thread():
+      self.thread.join()
+    self.liveness.expire()
+    self.session.expire()
+    self.monitor()
+
+  def resume(self):
+    """
+    Start the event loop again after pause().  A warm start: everything
+    is read afresh and the first tick is run before returning.
+    """
+    if not self.paused:
+      return
+    for channel in (self.scoring, self.names, self.session, self.liveness):
+      channel.expire()
+    self._timestamp = 0
+    self.names.get(perf_counter())
+    self.monitor()
+    self.paused = False
+    self.run(self.callback, self.runtime)
+    for listener in self.resumeListeners:
+      listener()
+
+  def channelStats(self):
+    """ How many times each channel has been read, and the telemetry (ticks) """
+    stats = {'telemetry': self.ticks}
+    for channel in (self.scoring, self.names, self.session, self.liveness):
+      stats[channel.name] = channel.reads
+    return stats
+
+  def schedulerStats(self):
+    """
+    Jitter and overrun statistics of the event loop, frames seen, missed
+    etc. when polling by frame
+    """
+    if self.thread:
+      return self.thread.stats
+    return None
+
 def mock_callback(clutchEvent=None, gearEvent=None, stopEvent=None):
     # Mock stub
     if clutchEvent or gearEvent or stopEvent:
@@ -131,6 +290,7 @@ def mock_callback(clutchEvent=None, gearEvent=None, stopEvent=None):
       print('Driver %s, Gear: %d, Clutch position: %d' % (driver, gear, clutch))
 
 def test_main():
+    from mockMemoryMap import gui
     class graunch:  #dummy
       def isGraunching(self):
         return False
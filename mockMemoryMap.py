@@ -1,7 +1,7 @@
 # Simple GUI to poke inputs into the memory map
 
 import tkinter as tk
-from tkinter import font, ttk, messagebox
+from tkinter import font, ttk
 from time import sleep
 
 try:
@@ -23,10 +23,12 @@ class Gui:
   """
   Superclass for GUI items common to Mock and Live.
   """
-  def __init__(self, parentFrame, maxRevs, maxFwdGears=6):
+  def __init__(self, parentFrame, maxRevs, maxFwdGears=6, info=None):
     """ Put this into the parent frame """
     self.parentFrame = parentFrame
-    self.info = SimInfoAPI()
+    if info is None:
+      info = SimInfoAPI()
+    self.info = info
     #clutch = self.info.playersVehicleTelemetry().mUnfilteredClutch') # 1.0 clutch down, 0 clutch up
     #gear  = self.info.playersVehicleTelemetry().mGear')  # -1 to 6
 
@@ -234,10 +236,16 @@ class mock(Gui):
 class live(Gui):
   # Subclass for GUI items for Live.
   def __init__(self, parentFrame, graunch_o, controls_o, maxRevs=10000, maxFwdGears=6, instructions=''):
-    Gui.__init__(self, parentFrame, maxRevs, maxFwdGears)
-    self._timestamp = 0
+    # Share Controls' memory map rather than opening another
+    Gui.__init__(self, parentFrame, maxRevs, maxFwdGears, info=controls_o.info)
+    self._shown = {}  # the values the widgets are showing
     self.graunch_o = graunch_o
     self.controls_o = controls_o
+    self._ticking = False
+    # Refreshing stops while Controls is paused, resume() is called from
+    # another thread so it's sent as an event
+    parentFrame.bind('<<Resume>>', lambda event: self.__tick())
+    controls_o.resumeListeners.append(self.resume)
 
     self._createBoolVar('SMactive', False)
     self._createBoolVar('Graunching', False)
@@ -305,32 +313,55 @@ class live(Gui):
 
   #######################################
 
+  def resume(self):
+    """ Start refreshing again, when Controls is resumed """
+    self.parentFrame.event_generate('<<Resume>>', when='tail')
+
   def __tick(self):
     # timed callback to update live status
-    mEngineRPM = int(self.info.playersVehicleTelemetry().mEngineRPM)
-    mClutchRPM = int(self.info.playersVehicleTelemetry().mClutchRPM)
-    mClutch = int(self.info.playersVehicleTelemetry().mUnfilteredClutch*100)
-    self.vars['EngineRPM'].set(mEngineRPM)
-    self.vars['ClutchRPM'].set(mClutchRPM)
-    self.vars['Clutch'].set(mClutch)
-    self.vars['Gear'].set(GEARS[self.info.playersVehicleTelemetry().mGear+1])
-    self.vars['rF2 running'].set(self.info.isRF2running())
-    self.vars['Track loaded'].set(self.info.isTrackLoaded())
-    self.vars['On track'].set(self.info.isOnTrack())
-    self.driverLabel.config(text=self.info.driverName())
-    #self.vars['Escape pressed'].set(not self._timestamp < self.info.playersVehicleScoring().mTimeIntoLap)
-    if not self.info.isOnTrack() or \
-      self._timestamp < self.info.playersVehicleTelemetry().mElapsedTime:
-      self.vars['Escape pressed'].set(False)
-    else:
-      self.vars['Escape pressed'].set(True)
-    self._timestamp = self.info.playersVehicleTelemetry().mElapsedTime
+    # Everything comes from the snapshot the monitor thread last
+    # published, nothing is read from rF2 here
+    if self._ticking:   # already, resumed before the last one stopped
+      return
+    status = self.__readStatus()
+    if status:
+      shown = self._shown
+      for name, value in status:
+        if shown.get(name) != value:  # only redraw what's changed
+          shown[name] = value
+          if name == 'Player':
+            self.driverLabel.config(text=value)
+          else:
+            self.vars[name].set(value)
+    if not self.controls_o.paused:
+      self._ticking = True
+      self.parentFrame.after(200, self.__ticked)
+
+  def __ticked(self):
+    self._ticking = False
+    self.__tick()
 
-    self.vars['AI driving'].set(self.info.isOnTrack() and \
-      self.info.isAiDriving())
-    self.vars['Graunching'].set(self.graunch_o.isGraunching())
-    self.vars['SMactive'].set(self.controls_o.SMactive())
-    self.parentFrame.after(200, self.__tick)
+  def __readStatus(self):
+    # The monitor thread may start refilling the snapshot while it's being
+    # read, if so it's marked with tick -1 and read again
+    for _retry in range(3):
+      snapshot = self.controls_o.snapshot
+      tick = snapshot.tick
+      status = (('EngineRPM', int(snapshot.engineRPM)),
+                ('ClutchRPM', int(snapshot.clutchRPM)),
+                ('Clutch', 100 - snapshot.clutch),
+                ('Gear', GEARS[snapshot.gear+1]),
+                ('rF2 running', snapshot.rF2running),
+                ('Track loaded', snapshot.trackLoaded),
+                ('On track', snapshot.onTrack),
+                ('Player', snapshot.driver),
+                ('Escape pressed', snapshot.onTrack and snapshot.escape),
+                ('AI driving', snapshot.onTrack and snapshot.control == 1),
+                ('Graunching', self.graunch_o.isGraunching()),
+                ('SMactive', self.controls_o.SMactive()))
+      if tick != -1 and snapshot.tick == tick:
+        return status
+    return None
 
   def _gearChange(self):
     # Null command
@@ -340,12 +371,32 @@ class live(Gui):
 class Menu:
   def __init__(self,
                menubar,
-               menu2tab=None):
+               menu2tab=None,
+               latency=None):
+    if latency:
+      latencymenu = tk.Menu(menubar, tearoff=0)
+      latencymenu.add_command(label="Show", command=lambda: showLatency(latency))
+      latencymenu.add_command(label="Save to file...", command=lambda: saveLatency(latency))
+      latencymenu.add_command(label="Reset", command=latency.reset)
+      menubar.add_cascade(label="Latency", menu=latencymenu)
     helpmenu = tk.Menu(menubar, tearoff=0)
     helpmenu.add_command(label="Credits", command=credits)
     helpmenu.add_command(label="About", command=about)
     menubar.add_cascade(label="Help", menu=helpmenu)
+def showLatency(latency):
+  # Fixed width font so the columns line up
+  top = tk.Toplevel()
+  top.title('gearshift latency')
+  tk.Label(top, text=latency.report(), font='TkFixedFont', justify='l').grid(padx=10, pady=10)
+def saveLatency(latency):
+  from tkinter import filedialog
+  path = filedialog.asksaveasfilename(title='Save latency histograms',
+                                      initialfile='latency.txt',
+                                      defaultextension='.txt')
+  if path:
+    latency.dump(path)
 def about():
+  from tkinter import messagebox
   from Gearshift import versionStr, versionDate
   messagebox.askokcancel(
             'About gearshift',
@@ -354,6 +405,7 @@ def about():
             % (versionStr, versionDate)
         )
 def credits():
+  from tkinter import messagebox
   from Gearshift import credits
   messagebox.askokcancel(
             'FAQ',
@@ -364,7 +416,7 @@ def gui(maxRevs=10000, maxFwdGears=6, mocking=False, instructions='', graunch_o=
   root = tk.Tk()
   root.title('gearshift')
   menubar = tk.Menu(root)
-  _m = Menu(menubar)
+  _m = Menu(menubar, latency=controls_o.latency if controls_o else None)
   root.config(menu=menubar)
 
   mockMemoryMap = ttk.Frame(root, width=1200, height=1200, relief='sunken', borderwidth=5)
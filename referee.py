@@ -0,0 +1,284 @@
+# Referee mode: the gear state machine for every car on the grid.
+#
+# For league race control on a dedicated server.  Every car in the rF2
+# telemetry is tracked with the same transition table as the player's
+# (stateMachine.transitionTable()) but nothing is sent: no keys, no noise.
+# Each car's graunches and abuse (gears selected without the clutch) are
+# counted for the stewards.
+#
+# The state of all the cars is held in NumPy arrays, one slot per car, and
+# each tick's events are applied to all the cars at once: the gear events,
+# then the clutch events, then the graunch timeouts (the graunch3 timer of
+# Gearshift.py, GRAUNCH_TIMEOUT_SECONDS after the graunch started).  The
+# only Python loop per car is copying its gear and clutch out of the
+# shared memory, so a full grid takes well under a millisecond a tick.
+#
+# python referee.py [--rate 50] [--interval 10] [--benchmark N]
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import stateMachine
+from stateMachine import (CLUTCH_DISENGAGE, CLUTCH_ENGAGE, GEAR_DESELECT,
+                          GEAR_SELECT, GRAUNCH_START, GRAUNCH_STOP,
+                          GRAUNCH_TIMEOUT, GRAUNCH_TIMEOUT_SECONDS, N_EVENTS,
+                          NEUTRAL, stateNames)
+from scheduler import PeriodicThread
+from shiftAnalysis import DEFAULT_BITE_POINT
+from telemetrySnapshot import MAX_RETRIES, clutchPercent
+
+MAX_CARS = 128              # slots, more than rF2's grid
+DEFAULT_RATE = 50           # Hz
+
+def transitionArrays(reshift=True, doubleDeclutch=False):
+  """
+  stateMachine.transitionTable() as arrays indexed by state * N_EVENTS + event
+    nextState     the state after the event
+    graunch       1: graunching afterwards, 0: not, -1: unchanged
+    restart       a graunch starts even if one already was (stop then start)
+    startIfIdle   a graunch starts if one wasn't already
+  """
+  table = stateMachine.transitionTable(reshift, doubleDeclutch, debug=0)
+  n = len(table)
+  nextState = np.zeros(n, np.int8)
+  graunch = np.full(n, -1, np.int8)
+  restart = np.zeros(n, np.bool_)
+  startIfIdle = np.zeros(n, np.bool_)
+  for i, (state, actions) in enumerate(table):
+    nextState[i] = state
+    stopped = False
+    for action in actions:
+      if action[0] == GRAUNCH_STOP:
+        stopped = True
+        graunch[i] = 0
+      elif action[0] == GRAUNCH_START:
+        if stopped:
+          restart[i] = True
+        else:
+          startIfIdle[i] = True
+        graunch[i] = 1
+  return nextState, graunch, restart, startIfIdle
+
+class Referee:
+  """
+  Gearbox state of up to maxCars cars.
+  tick() reads rF2 and steps every car; step() does the work given the
+  gears and clutches so it can be fed from anywhere.
+  """
+  def __init__(self, info=None, maxCars=MAX_CARS, reshift=True, doubleDeclutch=False,
+               bitePoint=DEFAULT_BITE_POINT, timeout=GRAUNCH_TIMEOUT_SECONDS,
+               clock=time.perf_counter):
+    self.info = info          # SimInfoAPI, or anything that looks like one
+    self.maxCars = maxCars
+    self.bitePoint = bitePoint
+    self.timeout = timeout
+    self.clock = clock
+    (self._next, self._graunch,
+     self._restart, self._startIfIdle) = transitionArrays(reshift, doubleDeclutch)
+    # Per car
+    self.active = np.zeros(maxCars, np.bool_)
+    self.state = np.full(maxCars, NEUTRAL, np.int8)
+    self.gear = np.zeros(maxCars, np.int8)
+    self.clutchDown = np.zeros(maxCars, np.bool_)
+    self.graunching = np.zeros(maxCars, np.bool_)
+    self.deadline = np.full(maxCars, np.inf)    # graunch timeout
+    self.graunches = np.zeros(maxCars, np.int32)
+    self.abuse = np.zeros(maxCars, np.int32)    # gears selected, clutch up
+    self.names = [''] * maxCars
+    self.slots = {}           # mID: slot
+    # Read into these each tick
+    self._gearIn = np.zeros(maxCars, np.int8)
+    self._clutchIn = np.full(maxCars, 100, np.int16)
+    self._seen = np.zeros(maxCars, np.bool_)
+    self._scoringVersion = None
+    self.ticks = 0
+    self.tornReads = 0
+    self.thread = None
+
+  def slot(self, mID):
+    """ The slot for car mID, a new one if it's new.  None if they're all used """
+    slot = self.slots.get(mID)
+    if slot is None:
+      free = np.flatnonzero(~self.active)
+      if not free.size:
+        return None
+      slot = int(free[0])
+      self.slots[mID] = slot
+      self._reset(slot)
+    return slot
+
+  def _reset(self, slot):
+    self.active[slot] = True
+    self.state[slot] = NEUTRAL
+    self.gear[slot] = 0
+    self.clutchDown[slot] = False
+    self.graunching[slot] = False
+    self.deadline[slot] = np.inf
+    self.graunches[slot] = 0
+    self.abuse[slot] = 0
+    self.names[slot] = ''
+
+  def read(self):
+    """ Copy every car's gear and clutch from rF2 into the input arrays """
+    tele = self.info.Rf2Tele
+    gearIn = self._gearIn
+    clutchIn = self._clutchIn
+    seen = self._seen
+    for _retry in range(MAX_RETRIES):
+      begin = tele.mVersionUpdateBegin
+      seen[:] = False
+      for i in range(min(tele.mNumVehicles, len(tele.mVehicles))):
+        vehicle = tele.mVehicles[i]
+        slot = self.slot(vehicle.mID)
+        if slot is None:
+          continue
+        seen[slot] = True
+        gearIn[slot] = vehicle.mGear
+        clutchIn[slot] = clutchPercent(vehicle.mUnfilteredClutch)
+      if begin == tele.mVersionUpdateEnd:
+        break
+    else:
+      self.tornReads += 1
+    # Cars that have left the server
+    for mID, slot in list(self.slots.items()):
+      if not seen[slot]:
+        del self.slots[mID]
+        self.active[slot] = False
+    self._readNames()
+
+  def _readNames(self):
+    # Scoring is only updated about 5 times a second
+    scoring = self.info.Rf2Scor
+    if scoring.mVersionUpdateEnd == self._scoringVersion:
+      return
+    self._scoringVersion = scoring.mVersionUpdateEnd
+    for i in range(min(scoring.mScoringInfo.mNumVehicles, len(scoring.mVehicles))):
+      vehicle = scoring.mVehicles[i]
+      slot = self.slots.get(vehicle.mID)
+      if slot is not None:
+        self.names[slot] = bytes(vehicle.mDriverName).partition(b'\0')[0].decode(
+          errors='replace')
+
+  def tick(self):
+    """ Read rF2 and step every car (the PeriodicThread callback) """
+    self.read()
+    self.step(self._gearIn, self._clutchIn, self.clock())
+
+  def step(self, gearIn, clutchIn, now):
+    """
+    Dispatch the events of every active car, gearIn and clutchIn indexed
+    by slot (clutch 100 released, 0 pressed as in TelemetrySnapshot)
+    """
+    self.ticks += 1
+    active = self.active
+    # Gears first, as Controls does
+    changed = active & (gearIn != self.gear)
+    if changed.any():
+      selected = gearIn != 0
+      self.abuse += changed & selected & ~self.clutchDown
+      self._dispatch(changed,
+                     np.where(selected, GEAR_SELECT, GEAR_DESELECT), now)
+      self.gear[changed] = gearIn[changed]
+    down = clutchIn < self.bitePoint
+    changed = active & (down != self.clutchDown)
+    if changed.any():
+      self._dispatch(changed,
+                     np.where(down, CLUTCH_DISENGAGE, CLUTCH_ENGAGE), now)
+      self.clutchDown[changed] = down[changed]
+    timedOut = active & self.graunching & (self.deadline <= now)
+    if timedOut.any():
+      self._dispatch(timedOut, GRAUNCH_TIMEOUT, now)
+
+  def _dispatch(self, mask, events, now):
+    slots = np.flatnonzero(mask)
+    if np.ndim(events):
+      events = events[slots]
+    i = self.state[slots].astype(np.intp) * N_EVENTS + events
+    self.state[slots] = self._next[i]
+    graunching = self.graunching[slots]
+    started = self._restart[i] | (self._startIfIdle[i] & ~graunching)
+    self.graunches[slots] += started
+    self.deadline[slots[started]] = now + self.timeout
+    graunch = self._graunch[i]
+    graunching = np.where(graunch < 0, graunching, graunch > 0)
+    self.graunching[slots] = graunching
+    self.deadline[slots[~graunching]] = np.inf
+
+  def results(self):
+    """ [{'driver', 'slot', 'graunches', 'abuse', 'state'}], most graunches first """
+    rows = [{'driver': self.names[slot],
+             'slot': slot,
+             'graunches': int(self.graunches[slot]),
+             'abuse': int(self.abuse[slot]),
+             'state': stateNames[self.state[slot]]}
+            for slot in np.flatnonzero(self.active)]
+    rows.sort(key=lambda row: (-row['graunches'], -row['abuse'], row['driver']))
+    return rows
+
+  def report(self):
+    lines = ['%-24s %9s %6s  %s' % ('driver', 'graunches', 'abuse', 'state')]
+    for row in self.results():
+      lines.append('%-24s %9d %6d  %s' % (row['driver'][:24], row['graunches'],
+                                          row['abuse'], row['state']))
+    return '\n'.join(lines)
+
+  def start(self, rate=DEFAULT_RATE):
+    self.thread = PeriodicThread(self.tick, rate)
+    self.thread.start()
+
+  def stop(self):
+    if self.thread:
+      self.thread.stop()
+
+def benchmark(nCars=MAX_CARS, ticks=5000, seed=1):
+  """ Mean and worst step() in microseconds for nCars changing gear at random """
+  rng = np.random.default_rng(seed)
+  referee = Referee(maxCars=nCars)
+  referee.active[:] = True
+  gears = rng.integers(0, 7, (ticks, nCars)).astype(np.int8)
+  clutches = rng.integers(0, 101, (ticks, nCars)).astype(np.int16)
+  # most cars don't change anything most ticks
+  hold = rng.random((ticks, nCars)) < 0.95
+  for t in range(1, ticks):
+    gears[t][hold[t]] = gears[t - 1][hold[t]]
+    clutches[t][hold[t]] = clutches[t - 1][hold[t]]
+  times = np.empty(ticks)
+  for t in range(ticks):
+    start = time.perf_counter()
+    referee.step(gears[t], clutches[t], t / DEFAULT_RATE)
+    times[t] = time.perf_counter() - start
+  return times.mean() * 1e6, times.max() * 1e6
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Count the graunches of every car')
+  parser.add_argument('--rate', type=int, default=DEFAULT_RATE, help='ticks per second')
+  parser.add_argument('--interval', type=float, default=10.0,
+                      help='seconds between reports')
+  parser.add_argument('--benchmark', type=int, metavar='CARS',
+                      help="time step() for CARS cars, rF2 isn't needed")
+  args = parser.parse_args(argv)
+
+  if args.benchmark:
+    mean, worst = benchmark(args.benchmark)
+    print('%d cars: step() mean %.0f us, worst %.0f us (a %d Hz tick is %d us)' % (
+      args.benchmark, mean, worst, args.rate, 1000000 // args.rate))
+    return
+
+  from pyRfactor2SharedMemory.sharedMemoryAPI import SimInfoAPI
+  referee = Referee(SimInfoAPI())
+  referee.start(args.rate)
+  try:
+    while True:
+      time.sleep(args.interval)
+      print(referee.report())
+  except KeyboardInterrupt:
+    pass
+  finally:
+    referee.stop()
+    print(referee.report())
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
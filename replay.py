@@ -0,0 +1,185 @@
+# Replay recorded telemetry through the real gearshift code, faster than
+# real time.
+#
+# Samples from a recording (blackBox.readRecording()) are fed to a
+# memoryMapInputs.Controls through ReplayInfo, a stand-in for SimInfoAPI,
+# and Controls sends its events to Gearshift.memoryMapCallback() and on to
+# the gear state machine, just as when driving.  There's no rF2 and no
+# GUI, and instead of waiting, every SetTimer() timer (including the 3
+# second graunch3 neutral timeout) runs on a virtual clock that jumps from
+# one recorded timestamp to the next.
+#
+# python replay.py session.gsbb [session.gsbb ...]
+
+import sys
+import time
+
+import Gearshift
+from blackBox import readRecording
+from eventQueue import EventQueue
+from keySender import KeySender, RecordingKeys
+from latency import LatencyTracker
+from memoryMapInputs import Controls
+from stateMachine import GRAUNCHING, NEUTRAL_KEY_SENT, stateNames
+from timerWheel import VirtualTimerService
+
+class _Vec3:
+  x = 0.0
+  y = 0.0
+  z = 0.0
+
+class _Vehicle:
+  """ The telemetry fields Controls reads """
+  mGear = 0
+  mUnfilteredClutch = 0.0
+  mEngineRPM = 0.0
+  mClutchRPM = 0.0
+  mElapsedTime = 0.0
+  mMaxGears = 0
+  mEngineMaxRPM = 0.0
+  mLocalVel = _Vec3()
+
+class _Scoring:
+  mControl = 0
+  mVehicleName = b'Replay'
+
+class _Telemetry:
+  # Replay is never torn
+  mVersionUpdateBegin = 0
+  mVersionUpdateEnd = 0
+
+class ReplayInfo:
+  """
+  Stands in for pyRfactor2SharedMemory's SimInfoAPI, serving one
+  recorded sample at a time
+  """
+  def __init__(self, samples):
+    self.samples = samples
+    self.nSamples = len(samples['gear'])
+    self.Rf2Tele = _Telemetry()
+    self.vehicle = _Vehicle()
+    self.vehicle.mLocalVel = _Vec3()
+    self.scoring = _Scoring()
+
+  def setSample(self, i):
+    s = self.samples
+    vehicle = self.vehicle
+    vehicle.mGear = s['gear'][i]
+    # clutch was recorded as a percentage, 100 released.  Put it back
+    # half way into the percent so that int() gets the same value again
+    vehicle.mUnfilteredClutch = (100 - s['clutch'][i] - 0.5) / 100
+    vehicle.mEngineRPM = s['engineRPM'][i]
+    vehicle.mClutchRPM = s['clutchRPM'][i]
+    vehicle.mElapsedTime = s['elapsedTime'][i]
+    if 'control' in s:
+      self.scoring.mControl = s['control'][i]
+    if len(s['speed']):
+      vehicle.mLocalVel.z = -s['speed'][i]  # rF2's z points backwards
+    self.Rf2Tele.mVersionUpdateBegin = self.Rf2Tele.mVersionUpdateEnd = i
+
+  def playersVehicleTelemetry(self):
+    return self.vehicle
+
+  def playersVehicleScoring(self):
+    return self.scoring
+
+  def isRF2running(self):
+    return True
+
+  def isTrackLoaded(self):
+    return True
+
+  def isOnTrack(self):
+    return True
+
+  def isAiDriving(self):
+    return self.scoring.mControl == 1
+
+  def driverName(self):
+    return 'Replay'
+
+  def close(self):
+    pass
+
+class Replay:
+  """
+  Run recorded samples through Controls and Gearshift's state machine.
+  Gearshift's module settings (bite point, neutral button etc.) are used
+  as they are; its timer service, key sender and sound are swapped for
+  virtual ones until close().
+  """
+  def __init__(self, samples, tail=3.5):
+    self.info = ReplayInfo(samples)
+    self.tail = tail  # seconds run on after the last sample for timeouts
+    self.timers = VirtualTimerService()
+    self.keys = RecordingKeys(clock=self.timers.now)
+    self.transitions = [] # (virtual time, fromState, event, toState)
+    self._saved = {name: getattr(Gearshift, name)
+                   for name in ('timerService', 'keys_o',
+                                'graunchWav', 'graunch_o', 'gearSM',
+                                'ClutchPrev', 'latency_o', 'eventQueue_o')}
+    Gearshift.timerService = self.timers
+    Gearshift.keys_o = KeySender(self.keys, synchronous=True)
+    Gearshift.graunchWav = None   # silence
+    Gearshift.graunch_o = Gearshift.graunch()
+    Gearshift.gearSM = Gearshift.newGearStateMachine(Gearshift.graunch_o)
+    Gearshift.gearSM.transitionListeners.append(self._transition)
+    Gearshift.ClutchPrev = 2
+    Gearshift.eventQueue_o = EventQueue(Gearshift.dispatchEvent, synchronous=True)
+    # Real (not virtual) times through the code
+    self.latency = Gearshift.latency_o = LatencyTracker()
+    self.controls = Controls(debug=0, mocking=False, info=self.info,
+                             latency=self.latency)
+    self.controls.callback = Gearshift.memoryMapCallback
+
+  def _transition(self, fromState, event, toState):
+    self.transitions.append((self.timers.now(), fromState, event, toState))
+
+  def run(self):
+    """ Replay every sample, return a summary dict """
+    samples = self.info.samples
+    times = samples['t'] if len(samples['t']) else samples['elapsedTime']
+    start = time.perf_counter()
+    if self.info.nSamples:
+      t0 = times[0]
+      for i in range(self.info.nSamples):
+        self.timers.advanceTo(times[i] - t0)
+        self.info.setSample(i)
+        self.controls.monitor()
+      self.timers.advanceTo(self.timers.now() + self.tail)
+    return self.summary(time.perf_counter() - start)
+
+  def summary(self, took=0.0):
+    graunches = sum(1 for _t, fromState, _e, toState in self.transitions
+                    if toState == GRAUNCHING
+                    and fromState not in (GRAUNCHING, NEUTRAL_KEY_SENT))
+    neutralPresses = sum(1 for _t, action, key in self.keys.events
+                         if action == 'press')
+    return {'samples': self.info.nSamples,
+            'session seconds': self.timers.now(),
+            'replay seconds': took,
+            'events': len(self.transitions),
+            'graunches': graunches,
+            'neutral presses': neutralPresses,
+            'final state': stateNames[Gearshift.gearSM.state]
+            }
+
+  def close(self):
+    """ Put Gearshift's own timer service, keys etc. back """
+    for name, value in self._saved.items():
+      setattr(Gearshift, name, value)
+
+def replayFile(path):
+  samples, _transitions = readRecording(path)
+  replay = Replay(samples)
+  try:
+    return replay.run()
+  finally:
+    replay.close()
+
+if __name__ == '__main__':
+  for path in sys.argv[1:]:
+    result = replayFile(path)
+    print(path)
+    for key, value in result.items():
+      print('  %s: %s' % (key, value))
@@ -1,58 +1,315 @@
-import sched, time
-from threading import Timer, Thread, Event
+import sys
+import time
+from threading import Thread, Event
 
-tick_interval = 0.1 # seconds
+# Deadline based periodic thread.
+# Each tick is due at start + n * period on the monotonic clock, so the time
+# the callback takes doesn't push the following ticks back.
+#
+# The wait is a sleep then a short spin, the sleep is only as fine as the
+# OS timer: on Windows that's 15.6 mS unless something asks for better, too
+# coarse for much above 30 Hz.  Rather than spinning for whole timer ticks,
+# threads faster than FINE_TIMER_RATE (and FrameSyncThread) ask for 1 mS
+# with winmm timeBeginPeriod() while they run, see FineTimer.
 
-def tick():
-  print('tick')
-  s.enter(tick_interval, 1, tick)
+DEFAULT_RATE = 10     # Hz
+MIN_RATE = 10
+MAX_RATE = 1000
+SPIN_TIME = 0.001     # Spin (rather than sleep) this long before a deadline
+MAX_CATCH_UP = 10     # Periods behind before 'catch up' gives up and resyncs
+FINE_TIMER_RATE = 30  # Hz, faster than this needs the 1 mS OS timer
+FINE_TIMER_MS = 1     # timeBeginPeriod() resolution
 
-class Tick:
-  def monitor(self):
-    # Run every tick_interval
-    print('tick')
-    #Timer(tick_interval, self.monitor, ()).start()
-    self.t.start()
+# Frame synchronised polling, FrameSyncThread
+FRAME_INTERVAL = 0.02       # seconds, the first guess at the game's frame interval
+FRAME_SPIN = 0.001          # wake this long before the frame is due and spin
+FRAME_POLL = 0.001          # then poll this often if it's late
+FRAME_SMOOTHING = 0.1       # of the frame interval estimate
+FRAME_STALE_TIMEOUT = 0.1   # seconds without a frame before a stale tick
+MAX_FRAME_RATE = 100        # Hz, the fastest rF2 is expected to update the telemetry
+
+# Polling modes
+TIMER = 'timer'             # PeriodicThread at the tick rate
+FRAME = 'frame'             # FrameSyncThread, once per telemetry update
+POLL_MODES = [TIMER, FRAME]
+
+# Overrun policies, what to do when the callback runs past the next deadline
+SKIP = 'skip'         # drop the missed ticks, stay on the original grid
+CATCH_UP = 'catch up' # run the missed ticks back to back
+POLICIES = [SKIP, CATCH_UP]
+
+# Runtimes, [scheduler] runtime.  Here rather than in asyncRuntime so
+# choosing one doesn't import asyncio
+THREADS = 'threads'   # a PeriodicThread each, TimerService, Tk's mainloop()
+ASYNCIO = 'asyncio'   # asyncRuntime.AsyncRuntime, everything on one loop
+RUNTIMES = [THREADS, ASYNCIO]
+
+def clampRate(rate):
+  """ Keep the rate in MIN_RATE to MAX_RATE, None gives DEFAULT_RATE """
+  if not rate:
+    return DEFAULT_RATE
+  return max(MIN_RATE, min(MAX_RATE, rate))
+
+def _winmm():
+  """ winmm.dll on Windows, None elsewhere (the timers are fine already) """
+  if sys.platform != 'win32':
+    return None
+  import ctypes
+  try:
+    return ctypes.WinDLL('winmm')
+  except OSError:
+    return None
+
+class FineTimer:
+  """
+  with FineTimer(): the OS timer at FINE_TIMER_MS resolution while inside,
+  if needed.  Windows counts the requests, each timeBeginPeriod() is
+  matched by a timeEndPeriod() on the way out.
+  """
+  def __init__(self, needed=True):
+    self.needed = needed
+    self._winmm = None
+
+  def __enter__(self):
+    if self.needed:
+      self._winmm = _winmm()
+      if self._winmm:
+        self._winmm.timeBeginPeriod(FINE_TIMER_MS)
+    return self
+
+  def __exit__(self, *exc):
+    if self._winmm:
+      self._winmm.timeEndPeriod(FINE_TIMER_MS)
+      self._winmm = None
+    return False
+
+class SchedulerStats:
+  """
+  Jitter and overrun statistics, updated by the scheduler thread and
+  readable at any time.
+  Jitter is how late each tick started compared with its deadline.
+  """
+  __slots__ = ('ticks', 'overruns', 'skipped', 'totalJitter', 'maxJitter',
+               'maxCallbackTime')
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.ticks = 0
+    self.overruns = 0         # callbacks that ran past the next deadline
+    self.skipped = 0          # ticks dropped by the SKIP policy
+    self.totalJitter = 0.0
+    self.maxJitter = 0.0
+    self.maxCallbackTime = 0.0
+
+  def meanJitter(self):
+    if self.ticks:
+      return self.totalJitter / self.ticks
+    return 0.0
+
+  def summary(self):
+    return {'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'mean jitter mS': self.meanJitter() * 1000,
+            'max jitter mS': self.maxJitter * 1000,
+            'max callback mS': self.maxCallbackTime * 1000
+            }
+
+  def __str__(self):
+    return 'ticks %(ticks)d, overruns %(overruns)d, skipped %(skipped)d, ' \
+      'jitter mean %(mean jitter mS).3f max %(max jitter mS).3f mS, ' \
+      'callback max %(max callback mS).3f mS' % self.summary()
+
+class PeriodicThread(Thread):
+  """
+  Call callback rate times a second until stop()
+  """
+  def __init__(self, callback, rate=DEFAULT_RATE, policy=SKIP):
+    Thread.__init__(self)
+    self._stop_event = Event()
+    self.callback = callback
+    self.rate = clampRate(rate)
+    self.period = 1.0 / self.rate
+    if policy not in POLICIES:
+      policy = SKIP
+    self.policy = policy
+    self.stats = SchedulerStats()
+
+  def _waitUntil(self, deadline):
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN_TIME:
+      self._stop_event.wait(remaining - SPIN_TIME)
+    while time.perf_counter() < deadline:
+      time.sleep(0)   # let other threads have the GIL
 
   def run(self):
-    """ Event loop """
-    #self.callback = callback
-    #Timer(tick_interval, self.monitor, ()).start()
-    self.t = Timer(tick_interval, self.monitor)
-    self.t.start()
+    with FineTimer(self.rate > FINE_TIMER_RATE):
+      self._run()
 
-def printTick():
-  print("tick")
+  def _run(self):
+    stats = self.stats
+    period = self.period
+    deadline = time.perf_counter()   # first tick straight away
+    while not self._stop_event.is_set():
+      self._waitUntil(deadline)
+      if self._stop_event.is_set():
+        break
+      start = time.perf_counter()
+      jitter = start - deadline
+      stats.ticks += 1
+      stats.totalJitter += jitter
+      if jitter > stats.maxJitter:
+        stats.maxJitter = jitter
+
+      self.callback()
+
+      end = time.perf_counter()
+      if end - start > stats.maxCallbackTime:
+        stats.maxCallbackTime = end - start
+      deadline += period
+      if end > deadline:
+        if start < deadline:
+          # this callback overran, rather than a late one catching up
+          stats.overruns += 1
+        behind = int((end - deadline) / period) + 1
+        if self.policy == SKIP or behind > MAX_CATCH_UP:
+          stats.skipped += behind
+          deadline += behind * period
+        # else CATCH_UP: the next deadline has passed so it runs at once
+
+  def stop(self):
+    self._stop_event.set()
+
+class FrameSyncStats:
+  """
+  What FrameSyncThread saw, updated by its thread and readable at any time.
+  A game frame is a new telemetry version, framesMissed is versions that
+  went by between two polls.
+  """
+  __slots__ = ('ticks', 'framesSeen', 'framesMissed', 'wastedPolls', 'staleTicks',
+               'frameInterval', 'maxCallbackTime')
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.ticks = 0            # callbacks, frames and stale ticks
+    self.framesSeen = 0
+    self.framesMissed = 0
+    self.wastedPolls = 0      # polls that found the same version
+    self.staleTicks = 0       # callbacks when no frame came for staleTimeout
+    self.frameInterval = 0.0  # seconds, the game's, smoothed
+    self.maxCallbackTime = 0.0
 
-class MyThread(Thread):
-    def __init__(self, callback, tick_interval):
-        Thread.__init__(self)
-        self.stopped = Event()
-        self._stop_event = Event()
-        self.callback = callback
-        self.tick_interval = tick_interval
+  def summary(self):
+    return {'ticks': self.ticks,
+            'frames seen': self.framesSeen,
+            'frames missed': self.framesMissed,
+            'wasted polls': self.wastedPolls,
+            'stale ticks': self.staleTicks,
+            'frame rate': 1.0 / self.frameInterval if self.frameInterval else 0.0,
+            'max callback mS': self.maxCallbackTime * 1000
+            }
 
-    def run(self):
-        while not self._stop_event.isSet():
-            time.sleep(self.tick_interval)
-            self.callback()
+  def __str__(self):
+    return 'frames seen %(frames seen)d, missed %(frames missed)d, ' \
+      'wasted polls %(wasted polls)d, stale ticks %(stale ticks)d, ' \
+      'frame rate %(frame rate).1f Hz, callback max %(max callback mS).3f mS' % self.summary()
 
-    def stop(self):
-        self._stop_event.set()
+class FrameSyncThread(Thread):
+  """
+  Call callback once for each new game frame: each time version()
+  (the telemetry's mVersionUpdateEnd) changes.
+  It sleeps until just before the next frame is expected, then polls
+  version() spinning (FRAME_SPIN), then less often (FRAME_POLL) if the
+  frame is late.  If no frame comes for staleTimeout seconds (rF2 paused,
+  Esc pressed, not running) callback is called anyway every staleTimeout,
+  so the checks that stop the state machine still run, and version() is
+  only polled that often until the frames start again.
+  """
+  def __init__(self, callback, version, staleTimeout=FRAME_STALE_TIMEOUT):
+    Thread.__init__(self)
+    self._stop_event = Event()
+    self.callback = callback
+    self.version = version
+    self.staleTimeout = staleTimeout
+    self.stats = FrameSyncStats()
+
+  def _call(self):
+    stats = self.stats
+    stats.ticks += 1
+    start = time.perf_counter()
+    self.callback()
+    took = time.perf_counter() - start
+    if took > stats.maxCallbackTime:
+      stats.maxCallbackTime = took
+
+  def run(self):
+    with FineTimer():   # waits of FRAME_SPIN and FRAME_POLL
+      self._run()
+
+  def _run(self):
+    stats = self.stats
+    stopped = self._stop_event
+    last = self.version()
+    lastFrame = lastTick = time.perf_counter()
+    interval = FRAME_INTERVAL
+    self._call()    # first tick straight away
+    while not stopped.is_set():
+      now = time.perf_counter()
+      # Sleep until just before the next frame is due
+      wake = lastFrame + interval - FRAME_SPIN
+      if now < wake:
+        stopped.wait(wake - now)
+        now = time.perf_counter()
+      spinUntil = now
+      if now - lastFrame < self.staleTimeout:   # a frame is due
+        spinUntil += 2 * FRAME_SPIN
+      while not stopped.is_set():
+        version = self.version()
+        if version != last:
+          break
+        stats.wastedPolls += 1
+        now = time.perf_counter()
+        if now - lastTick >= self.staleTimeout:
+          version = None
+          break
+        if now < spinUntil:
+          time.sleep(0)   # let other threads have the GIL
+        elif now - lastFrame < self.staleTimeout:
+          stopped.wait(FRAME_POLL)
+        else:   # no frames coming, just the stale ticks
+          stopped.wait(lastTick + self.staleTimeout - now)
+      if stopped.is_set():
+        break
+      now = time.perf_counter()
+      if version is None:
+        stats.staleTicks += 1
+      else:
+        frames = (version - last) & 0xFFFFFFFF
+        stats.framesSeen += 1
+        stats.framesMissed += frames - 1
+        if now - lastFrame < self.staleTimeout:
+          # The game's frame interval, smoothed
+          interval += (min(max((now - lastFrame) / frames, FRAME_SPIN), self.staleTimeout)
+                       - interval) * FRAME_SMOOTHING
+          stats.frameInterval = interval
+        last = version
+        lastFrame = now
+      lastTick = now
+      self._call()
+
+  def stop(self):
+    self._stop_event.set()
+
+def printTick():
+  print("tick")
 
 if __name__ == '__main__':
-  if 0: 
-    #using sched
-    s = sched.scheduler(time.time, time.sleep)
-
-    s.enter(tick_interval, 1, tick)
-    s.run()
-  else:
-    # using threading
-    #T = Tick()
-    #T.run()
-    #stopFlag = Event()
-    thread = MyThread(printTick, tick_interval)
-    thread.start()
-    # this will stop the timer
-    #stopFlag.set()
\ No newline at end of file
+  thread = PeriodicThread(printTick, DEFAULT_RATE)
+  thread.start()
+  time.sleep(2)
+  thread.stop()
+  print(thread.stats)
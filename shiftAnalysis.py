@@ -0,0 +1,178 @@
+# Offline analysis of every gear shift in recorded sessions.
+#
+# A recording (see blackBox.py) is loaded into NumPy arrays and all the
+# shifts are found with whole-array operations, no Python loop per sample,
+# so hours of data from many cars take a fraction of a second.
+#
+# For each shift into a gear:
+#   revMismatch     engine RPM - clutch RPM when the clutch comes back up
+#                   (+ve: engine faster than the gearbox, e.g. upshift
+#                    without waiting, -ve: downshift over-rev / no blip)
+#   clutchDownTime  how long the clutch was below the bite point
+#   neutralTime     time between leaving the old gear and selecting the new
+#   bitePointCrossed  whether the clutch went below ClutchEngaged at all
+#
+# Recordings with a 'vehicle' column (several cars) are analysed per car.
+#
+# python shiftAnalysis.py [--bite-point 90] session.gsbb [session.gsbb ...]
+
+import argparse
+import mmap
+import sys
+import time
+
+import numpy as np
+
+from blackBox import blockLayout, SAMPLES
+
+DEFAULT_BITE_POINT = 90   # configIni's default clutch bite point
+
+SHIFT_DTYPE = np.dtype([('vehicle', np.int32),
+                        ('index', np.int64),      # sample where the new gear appears
+                        ('time', np.float64),
+                        ('fromGear', np.int8),
+                        ('toGear', np.int8),
+                        ('revMismatch', np.float32),
+                        ('clutchDownTime', np.float32),
+                        ('neutralTime', np.float32),
+                        ('bitePointCrossed', np.bool_)])
+
+def loadSession(path):
+  """
+  Load the samples of a recording as {column name: numpy array}.
+  The file is memory-mapped and each block is a view on it until the
+  blocks are joined.
+  """
+  with open(path, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    parts = {}
+    for kind, nRows, layout in blockLayout(data):
+      if kind != SAMPLES:
+        continue
+      for name, typecode, offset in layout:
+        dtype = np.dtype(typecode).newbyteorder('<')
+        parts.setdefault(name, []).append(
+          np.frombuffer(data, dtype=dtype, count=nRows, offset=offset))
+    columns = {name: np.concatenate(blocks) for name, blocks in parts.items()}
+  finally:
+    del parts
+    data.close()
+  return columns
+
+def findShifts(columns, bitePoint=DEFAULT_BITE_POINT):
+  """ Return a SHIFT_DTYPE array, one entry per shift into a gear """
+  gear = columns['gear']
+  n = len(gear)
+  if n < 2:
+    return np.zeros(0, dtype=SHIFT_DTYPE)
+  t = columns['t'] if 't' in columns and len(columns['t']) else columns['elapsedTime']
+  t = t.astype(np.float64)
+  clutch = columns['clutch']
+  engineRPM = columns['engineRPM']
+  clutchRPM = columns['clutchRPM']
+  vehicle = columns.get('vehicle')
+  if vehicle is None:
+    vehicle = np.zeros(n, dtype=np.int32)
+  else:
+    # All of each car's samples together, still in time order
+    order = np.argsort(vehicle, kind='stable')
+    gear, t, clutch, engineRPM, clutchRPM, vehicle = (
+      a[order] for a in (gear, t, clutch, engineRPM, clutchRPM, vehicle))
+
+  sameCar = vehicle[1:] == vehicle[:-1]
+  # First sample of each car
+  carStart = np.flatnonzero(np.concatenate(([True], ~sameCar)))
+  carOf = np.cumsum(np.concatenate(([True], ~sameCar))) - 1
+
+  changed = (gear[1:] != gear[:-1]) & sameCar
+  # Samples where a new gear appears, and where a gear is left
+  entries = np.flatnonzero(changed & (gear[1:] != 0)) + 1
+  departures = np.flatnonzero(changed & (gear[:-1] != 0)) + 1
+
+  # The last departure at or before each entry, in the same car
+  d = np.searchsorted(departures, entries, side='right') - 1
+  hasDeparture = d >= 0
+  if len(departures):
+    dep = np.where(hasDeparture, departures[np.maximum(d, 0)], 0)
+  else:   # never left a gear
+    dep = np.zeros(len(entries), dtype=np.int64)
+  hasDeparture &= dep >= carStart[carOf[entries]]
+  dep = np.where(hasDeparture, dep, entries)
+  fromGear = np.where(hasDeparture, gear[np.maximum(dep - 1, 0)], 0)
+  neutralTime = np.where(hasDeparture, t[entries] - t[dep], np.nan)
+
+  # Clutch below the bite point: runs of 'down' samples
+  down = clutch < bitePoint
+  downCount = np.concatenate(([0], np.cumsum(down)))
+  # any clutch down from leaving the old gear up to the new one appearing
+  crossed = downCount[entries + 1] - downCount[dep] > 0
+
+  edges = np.diff(np.concatenate(([False], down, [False])).astype(np.int8))
+  runStarts = np.flatnonzero(edges == 1)
+  runEnds = np.flatnonzero(edges == -1)   # first sample back up
+  # The run that started most recently at or before the entry
+  k = np.maximum(np.searchsorted(runStarts, entries, side='right') - 1, 0)
+  if len(runStarts):
+    runStart = runStarts[k]
+    runEnd = runEnds[k]
+    clutchDownTime = np.where(crossed,
+                              t[np.minimum(runEnd, n - 1)] - t[runStart],
+                              0.0)
+    # Revs compared when the clutch comes back up (or at the entry if it
+    # never went down)
+    engage = np.where(crossed & (runEnd > entries), np.minimum(runEnd, n - 1), entries)
+  else:
+    clutchDownTime = np.zeros(len(entries))
+    engage = entries
+
+  shifts = np.zeros(len(entries), dtype=SHIFT_DTYPE)
+  shifts['vehicle'] = vehicle[entries]
+  shifts['index'] = entries
+  shifts['time'] = t[entries]
+  shifts['fromGear'] = fromGear
+  shifts['toGear'] = gear[entries]
+  shifts['revMismatch'] = engineRPM[engage] - clutchRPM[engage]
+  shifts['clutchDownTime'] = clutchDownTime
+  shifts['neutralTime'] = neutralTime
+  shifts['bitePointCrossed'] = crossed
+  return shifts
+
+def summary(shifts):
+  """ Per vehicle: {vehicle: {statistic: value}} """
+  result = {}
+  for vehicle in np.unique(shifts['vehicle']):
+    s = shifts[shifts['vehicle'] == vehicle]
+    mismatch = np.abs(s['revMismatch'])
+    result[int(vehicle)] = {
+      'shifts': len(s),
+      'upshifts': int(np.count_nonzero(s['toGear'] > s['fromGear'])),
+      'downshifts': int(np.count_nonzero(s['toGear'] < s['fromGear'])),
+      'without clutch': int(np.count_nonzero(~s['bitePointCrossed'])),
+      'mean rev mismatch': float(mismatch.mean()) if len(s) else 0.0,
+      'max rev mismatch': float(mismatch.max()) if len(s) else 0.0,
+      'mean clutch down': float(s['clutchDownTime'].mean()) if len(s) else 0.0,
+      'mean neutral time': float(np.nanmean(s['neutralTime']))
+                           if np.any(~np.isnan(s['neutralTime'])) else 0.0
+    }
+  return result
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Analyse the gear shifts in recorded sessions')
+  parser.add_argument('--bite-point', type=int, default=DEFAULT_BITE_POINT)
+  parser.add_argument('recordings', nargs='+')
+  args = parser.parse_args(argv)
+  for path in args.recordings:
+    start = time.perf_counter()
+    columns = loadSession(path)
+    shifts = findShifts(columns, args.bite_point)
+    took = time.perf_counter() - start
+    print('%s: %d samples, %d shifts in %.3f s' % (path, len(columns.get('gear', ())),
+                                                   len(shifts), took))
+    for vehicle, stats in summary(shifts).items():
+      print('  vehicle %d' % vehicle)
+      for key, value in stats.items():
+        print('    %s: %s' % (key, value))
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,180 @@
+# The graunch noise.
+#
+# The WAV file is decoded once, at startup, into a Sound holding the PCM
+# samples, and the backends loop a Sound from memory, so starting and
+# stopping the noise never goes back to the file system.
+#
+# Gearshift only needs to start a looping sound and stop it, so the
+# backend is chosen by name ([miscellaneous] sound in gearshift.ini) and
+# winsound is only imported if it's used.  'none' plays nothing, for
+# headless monitoring or machines without winsound, and RecordingSound
+# notes what would have been played, for tests.
+
+import io
+import threading
+import time
+
+WINSOUND = 'winsound'
+NONE = 'none'
+PURGE_RETRY = 0.002   # seconds, WinSound purges again until the pass has stopped
+
+class Sound:
+  """ Decoded PCM and its format """
+  __slots__ = ('name', 'channels', 'sampleWidth', 'rate', 'frames', '_wav')
+
+  def __init__(self, name, channels, sampleWidth, rate, frames):
+    self.name = name
+    self.channels = channels
+    self.sampleWidth = sampleWidth  # bytes
+    self.rate = rate                # frames per second
+    self.frames = frames            # the PCM, bytes
+    self._wav = None
+
+  def nFrames(self):
+    return len(self.frames) // (self.channels * self.sampleWidth)
+
+  def duration(self):
+    """ seconds """
+    return self.nFrames() / self.rate
+
+  def wavBytes(self):
+    """ The sound as a WAV file image (made the first time it's needed) """
+    if self._wav is None:
+      import wave
+      f = io.BytesIO()
+      w = wave.open(f, 'wb')
+      w.setnchannels(self.channels)
+      w.setsampwidth(self.sampleWidth)
+      w.setframerate(self.rate)
+      w.writeframes(self.frames)
+      w.close()
+      self._wav = f.getvalue()
+    return self._wav
+
+  def __repr__(self):
+    return 'Sound(%r, %d Hz, %.2f s)' % (self.name, self.rate, self.duration())
+
+def loadWav(path):
+  """ Decode a PCM WAV file, None (and a message) if it can't be read """
+  import wave
+  try:
+    w = wave.open(path, 'rb')
+    try:
+      sound = Sound(path, w.getnchannels(), w.getsampwidth(), w.getframerate(),
+                    w.readframes(w.getnframes()))
+    finally:
+      w.close()
+  except (OSError, EOFError, wave.Error) as e:
+    print('Sound file "%s" could not be read: %s' % (path, e))
+    return None
+  sound.wavBytes()  # ready for play()
+  return sound
+
+class NullSound:
+  """ Plays nothing """
+  def play(self, sound):
+    pass
+
+  def stop(self):
+    pass
+
+  def close(self):
+    pass
+
+class RecordingSound:
+  """ Plays nothing, keeps a list of (time, 'play'/'stop', sound name) """
+  def __init__(self, clock=time.perf_counter):
+    self.clock = clock
+    self.playing = None
+    self.events = []
+
+  def play(self, sound):
+    if sound is not self.playing:
+      self.playing = sound
+      self.events.append((self.clock(), 'play', sound.name))
+
+  def stop(self):
+    if self.playing is not None:
+      self.playing = None
+      self.events.append((self.clock(), 'stop', None))
+
+  def close(self):
+    self.stop()
+
+class WinSound:
+  """
+  Loops a Sound with the Windows PlaySound().
+  PlaySound() can't play from memory asynchronously so a thread of our
+  own plays the WAV image over and over, stop() cuts it short.
+  Each play() / stop() is a new generation; a purge in the moment before
+  the thread's PlaySound() starts is lost, so they purge again until the
+  thread has finished the pass of the generation before.
+  """
+  def __init__(self):
+    import winsound
+    self.winsound = winsound
+    self._cond = threading.Condition()
+    self._sound = None      # what should be playing
+    self._generation = 0    # of _sound
+    self._playing = None    # the generation the thread is playing
+    self._closed = False
+    self._thread = threading.Thread(target=self._run, name='sound', daemon=True)
+    self._thread.start()
+
+  def play(self, sound):
+    with self._cond:
+      if sound is self._sound:
+        return  # already looping
+      self._change(sound)
+
+  def stop(self):
+    with self._cond:
+      if self._sound is None:
+        return
+      self._change(None)
+
+  def close(self):
+    with self._cond:
+      self._closed = True
+      self._change(None)
+    self._thread.join()
+
+  def _change(self, sound):
+    # With the lock held.  Returns when the thread is no longer playing
+    # an older generation
+    self._sound = sound
+    self._generation += 1
+    generation = self._generation
+    self._cond.notify_all()
+    while self._playing is not None and self._playing < generation:
+      self.winsound.PlaySound(None, 0)  # stops the PlaySound() the thread is in
+      self._cond.wait(PURGE_RETRY)
+
+  def _run(self):
+    ws = self.winsound
+    while True:
+      with self._cond:
+        while self._sound is None and not self._closed:
+          self._cond.wait()
+        if self._closed:
+          return
+        wav = self._sound.wavBytes()
+        self._playing = self._generation
+      # Returns at the end of the sound or when purged
+      ws.PlaySound(wav, ws.SND_MEMORY | ws.SND_NODEFAULT)
+      with self._cond:
+        self._playing = None
+        self._cond.notify_all()
+
+backends = {WINSOUND: WinSound,
+            NONE: NullSound}
+
+def newSound(name=WINSOUND):
+  """
+  The backend called name, NullSound if it can't be loaded
+  (e.g. winsound when not on Windows)
+  """
+  try:
+    return backends[name or NONE]()
+  except (KeyError, ImportError):
+    return NullSound()
@@ -0,0 +1,97 @@
+# How long gearshift takes from being started to its first tick.
+#
+# Runs `headless.py --ticks 1` repeatedly in a new Python process and
+# times from starting the process to the time it reports for the first
+# tick.  The first run is cold: it's given an empty bytecode cache so
+# every module is compiled (as after installing or updating).  The rest
+# are warm, reusing that cache.  Then `python -X importtime` shows what
+# importing each module costs.
+#
+# python startupBenchmark.py [--runs 5] [--top 15] [--module Gearshift] [--json file]
+#
+# Results depend on the machine, compare runs on the same one.  The cold
+# bytecode cache needs Python 3.8+ (PYTHONPYCACHEPREFIX), before that the
+# first run uses the existing __pycache__ folders.
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def timeToFirstTick(env):
+  """ Seconds from starting headless.py to its first tick """
+  start = time.time()
+  result = subprocess.run([sys.executable, os.path.join(HERE, 'headless.py'),
+                           '--ticks', '1', '--stats-interval', '0'],
+                          cwd=HERE, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+  for line in result.stdout.splitlines():
+    if line.startswith('first tick '):
+      return float(line.split()[2]) - start
+  raise RuntimeError('headless.py did not tick:\n%s' % result.stderr)
+
+def importTimes(module, env):
+  """
+  [(module, self microseconds, cumulative microseconds)] importing module,
+  most expensive (cumulative) first
+  """
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                          cwd=HERE, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+  times = []
+  for line in result.stderr.splitlines():
+    # import time: self [us] | cumulative | imported package
+    if not line.startswith('import time:') or 'self [us]' in line:
+      continue
+    selfUs, cumulative, name = line[len('import time:'):].split('|')
+    times.append((name.strip(), int(selfUs), int(cumulative)))
+  times.sort(key=lambda t: t[2], reverse=True)
+  return times
+
+def benchmark(runs=5, module='Gearshift'):
+  cache = tempfile.mkdtemp(prefix='gearshift-pycache-')
+  env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+  env.pop('PYTHONDONTWRITEBYTECODE', None)  # warm runs need the cache
+  try:
+    cold = timeToFirstTick(env)
+    warm = [timeToFirstTick(env) for _run in range(runs)]
+    imports = importTimes(module, env)
+  finally:
+    shutil.rmtree(cache, ignore_errors=True)
+  return {'python': sys.version.split()[0],
+          'cold first tick': cold,
+          'warm first tick': statistics.median(warm),
+          'warm first tick min': min(warm),
+          'warm first tick max': max(warm),
+          'imports': imports}
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Time gearshift from start to its first tick')
+  parser.add_argument('--runs', type=int, default=5, help='warm runs')
+  parser.add_argument('--top', type=int, default=15, help='modules listed')
+  parser.add_argument('--module', default='Gearshift', help='module whose imports are timed')
+  parser.add_argument('--json', help='also write the results to this file')
+  args = parser.parse_args(argv)
+
+  result = benchmark(args.runs, args.module)
+  print('Python %s' % result['python'])
+  print('Cold first tick  %7.1f mS' % (result['cold first tick'] * 1000))
+  print('Warm first tick  %7.1f mS (median of %d, %.1f to %.1f)' % (
+    result['warm first tick'] * 1000, args.runs,
+    result['warm first tick min'] * 1000, result['warm first tick max'] * 1000))
+  print('\nImporting %s (mS)\n%10s %10s  module' % (args.module, 'self', 'cumulative'))
+  for name, selfUs, cumulative in result['imports'][:args.top]:
+    print('%10.1f %10.1f  %s' % (selfUs / 1000, cumulative / 1000, name))
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump(result, f, indent=1)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
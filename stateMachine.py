@@ -0,0 +1,188 @@
+# The gear change state machine as a transition table.
+#
+# States and events are small integers.  The table is compiled once (with
+# the reshift, doubleDeclutch and debug settings baked in) to one entry per
+# state/event pair holding the next state and the list of actions to run,
+# so handling an event is a single lookup.  All the state is in the
+# GearStateMachine instance so any number of them can run in one process.
+
+# Gear change states
+NEUTRAL                     = 0
+CLUTCH_DOWN                 = 1
+WAIT_FOR_DOUBLE_DECLUTCH_UP = 2
+CLUTCH_DOWN_GEAR_SELECTED   = 3
+IN_GEAR                     = 4
+GRAUNCHING                  = 5
+GRAUNCHING_CLUTCH_DOWN      = 6
+NEUTRAL_KEY_SENT            = 7
+stateNames = ('neutral', 'clutchDown', 'waitForDoubleDeclutchUp',
+              'clutchDownGearSelected', 'inGear', 'graunching',
+              'graunchingClutchDown', 'neutralKeySent')
+N_STATES = len(stateNames)
+
+# Gear change events
+CLUTCH_DISENGAGE = 0
+CLUTCH_ENGAGE    = 1
+GEAR_SELECT      = 2
+GEAR_DESELECT    = 3
+GRAUNCH_TIMEOUT  = 4  # Memory-mapped mode
+STOP             = 5  # Stop the state machine
+eventNames = ('clutchDisengage', 'clutchEngage', 'gearSelect',
+              'gearDeselect', 'graunchTimeout', 'stop')
+N_EVENTS = len(eventNames)
+_validEvents = frozenset(range(N_EVENTS))
+GRAUNCH_TIMEOUT_SECONDS = 3.0   # a graunch's GRAUNCH_TIMEOUT comes this much later
+
+# Actions
+GRAUNCH_START = 'graunchStart'
+GRAUNCH_STOP  = 'graunchStop'
+KEY           = 'key'   # (KEY, keycode, debug level) debug key press
+MSG           = 'msg'   # (MSG, text, debug level) debug message
+
+def _rules(reshift, doubleDeclutch):
+  """
+  (state, event, next state, actions)
+  Pairs not listed leave the state unchanged and do nothing.
+  """
+  if reshift:
+    graunchingClutchDisengage = (GRAUNCHING, CLUTCH_DISENGAGE, GRAUNCHING_CLUTCH_DOWN,
+                                 [(GRAUNCH_STOP,), (KEY, 'DIK_G', 1)])
+  else:
+    graunchingClutchDisengage = (GRAUNCHING, CLUTCH_DISENGAGE, CLUTCH_DOWN_GEAR_SELECTED,
+                                 [(KEY, 'DIK_R', 1), (GRAUNCH_STOP,), (KEY, 'DIK_G', 1)])
+  if doubleDeclutch:
+    afterDeselect = WAIT_FOR_DOUBLE_DECLUTCH_UP
+  else:
+    afterDeselect = CLUTCH_DOWN
+  return [
+    (NEUTRAL, CLUTCH_DISENGAGE, CLUTCH_DOWN, [(KEY, 'DIK_D', 1)]),
+    (NEUTRAL, GEAR_SELECT, GRAUNCHING, [(GRAUNCH_START,)]),
+    (NEUTRAL, GRAUNCH_TIMEOUT, NEUTRAL, [(GRAUNCH_STOP,)]),
+
+    (CLUTCH_DOWN, GEAR_SELECT, CLUTCH_DOWN_GEAR_SELECTED, []),
+    (CLUTCH_DOWN, CLUTCH_ENGAGE, NEUTRAL, [(KEY, 'DIK_U', 1)]),
+
+    (WAIT_FOR_DOUBLE_DECLUTCH_UP, CLUTCH_ENGAGE, NEUTRAL,
+     [(MSG, 'Double declutch spin up the box', 2)]),
+    (WAIT_FOR_DOUBLE_DECLUTCH_UP, GEAR_SELECT, GRAUNCHING, [(GRAUNCH_START,)]),
+
+    (CLUTCH_DOWN_GEAR_SELECTED, CLUTCH_ENGAGE, IN_GEAR, [(MSG, 'In gear', 2)]),
+    (CLUTCH_DOWN_GEAR_SELECTED, GEAR_DESELECT, afterDeselect, []),
+
+    (IN_GEAR, GEAR_DESELECT, NEUTRAL, [(MSG, 'Knocked out of gear', 2)]),
+    (IN_GEAR, CLUTCH_DISENGAGE, CLUTCH_DOWN_GEAR_SELECTED, []),
+    # smashed straight through without neutral.
+    # I don't think this can happen if rF2, only with mock inputs...
+    (IN_GEAR, GEAR_SELECT, GRAUNCHING, [(GRAUNCH_START,)]),
+
+    graunchingClutchDisengage,
+    (GRAUNCHING, CLUTCH_ENGAGE, GRAUNCHING, [(GRAUNCH_START,)]),   # graunch again
+    (GRAUNCHING, GEAR_DESELECT, NEUTRAL_KEY_SENT, []),
+    (GRAUNCHING, GEAR_SELECT, GRAUNCHING, [(GRAUNCH_STOP,), (GRAUNCH_START,)]),
+
+    # rF2 will have put it into neutral but if shifter
+    # still in gear it will have put it back in gear again
+    (NEUTRAL_KEY_SENT, GEAR_SELECT, GRAUNCHING, []),
+    # timed out and still not in gear, player has shifted to neutral
+    (NEUTRAL_KEY_SENT, GRAUNCH_TIMEOUT, NEUTRAL, [(GRAUNCH_STOP,)]),
+
+    (GRAUNCHING_CLUTCH_DOWN, CLUTCH_ENGAGE, GRAUNCHING, [(GRAUNCH_START,)]),
+    (GRAUNCHING_CLUTCH_DOWN, GEAR_DESELECT, CLUTCH_DOWN, [(GRAUNCH_STOP,)]),
+  ]
+
+def transitionTable(reshift=True, doubleDeclutch=False, debug=0):
+  """
+  List indexed by state * N_EVENTS + event of (next state, actions)
+  with the actions above debug level dropped.
+  """
+  table = [(state, []) for state in range(N_STATES) for event in range(N_EVENTS)]
+  for state, event, nextState, actions in _rules(reshift, doubleDeclutch):
+    table[state * N_EVENTS + event] = (nextState, actions)
+  for state in range(N_STATES):
+    table[state * N_EVENTS + STOP] = (NEUTRAL, [(GRAUNCH_STOP,)])
+
+  compiled = []
+  for nextState, actions in table:
+    actions = [action for action in actions
+               if action[0] not in (KEY, MSG) or debug >= action[2]]
+    if nextState not in (GRAUNCHING, NEUTRAL_KEY_SENT):
+      # belt and braces - sometimes it gets stuck. REALLY????
+      actions.append((GRAUNCH_STOP,))
+    compiled.append((nextState, tuple(actions)))
+  return compiled
+
+class GearStateMachine:
+  """
+  Feed it events with dispatch(), it calls graunch_o.graunchStart() and
+  graunchStop() when the gear change goes wrong.
+  """
+  def __init__(self, graunch_o, reshift=True, doubleDeclutch=False, debug=0,
+               pressKey=None, msgBox=print):
+    self.graunch_o = graunch_o
+    self.reshift = reshift
+    self.doubleDeclutch = doubleDeclutch
+    self.debug = debug
+    self.pressKey = pressKey    # for the debug keys, None: don't send them
+    self.msgBox = msgBox
+    self.state = NEUTRAL
+    self.transitionListeners = []   # called with (fromState, event, toState)
+    self.compile()
+
+  def compile(self):
+    """ (Re)build the table, after changing reshift, doubleDeclutch or debug """
+    self.transitions = transitionTable(self.reshift, self.doubleDeclutch, self.debug)
+    self._table = [(nextState, tuple(self._bind(action) for action in actions))
+                   for nextState, actions in self.transitions]
+
+  def _bind(self, action):
+    if action[0] == GRAUNCH_START:
+      return self.graunch_o.graunchStart
+    if action[0] == GRAUNCH_STOP:
+      return self.graunch_o.graunchStop
+    if action[0] == KEY:
+      if self.pressKey:
+        return lambda key=action[1]: self.pressKey(key)
+      return lambda: None
+    return lambda text=action[1]: self.msgBox(text)
+
+  def dispatch(self, event):
+    if self.debug >= 3:
+      self.msgBox('gearState %s event %s' % (stateNames[self.state],
+                                              eventNames[event] if event in _validEvents else event))
+    if event not in _validEvents:
+      self.msgBox('gearStateMachine() invalid event %s' % event)
+      if self.state not in (GRAUNCHING, NEUTRAL_KEY_SENT):
+        self.graunch_o.graunchStop()
+      return
+    fromState = self.state
+    self.state, actions = self._table[fromState * N_EVENTS + event]
+    for listener in self.transitionListeners:
+      listener(fromState, event, self.state)
+    for action in actions:
+      action()
+
+  def stateName(self):
+    return stateNames[self.state]
+
+class GraunchCounter:
+  """
+  A graunch_o that counts the graunches instead of sending Neutral, for
+  scoring and checking.  Set now (seconds) before each dispatch(); deadline
+  is when the graunch in progress would get its GRAUNCH_TIMEOUT.
+  """
+  def __init__(self, timeout=GRAUNCH_TIMEOUT_SECONDS):
+    self.timeout = timeout
+    self.now = 0.0
+    self.graunching = False
+    self.graunches = 0
+    self.deadline = float('inf')
+
+  def graunchStart(self):
+    if not self.graunching:
+      self.graunches += 1
+      self.deadline = self.now + self.timeout
+    self.graunching = True
+
+  def graunchStop(self):
+    self.graunching = False
+    self.deadline = float('inf')
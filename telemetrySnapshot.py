@@ -0,0 +1,115 @@
+# One consistent copy of the player's telemetry per tick.
+#
+# Each call to SimInfoAPI.playersVehicleTelemetry() searches the scoring
+# block for the player and then reads straight out of the shared memory,
+# so reading field by field can mix values from two rF2 frames.  Here we
+# copy everything the tick needs in one go, inside the
+# mVersionUpdateBegin / mVersionUpdateEnd check that the rF2 Shared Memory
+# plugin provides for exactly this.
+
+from math import sqrt
+
+MAX_RETRIES = 3 # Attempts at a consistent copy before accepting a torn one
+
+class TelemetrySnapshot:
+  """
+  The values read from rF2 for one tick
+  """
+  __slots__ = ('gear',          # -1 to number of gears, 0 is neutral
+               'clutch',        # 100 clutch released, 0 clutch pressed
+               'engineRPM',
+               'clutchRPM',
+               'elapsedTime',   # mElapsedTime, stops when Esc pressed
+               'control',       # -1=nobody, 0=local player, 1=local AI, 2=remote, 3=replay
+               'maxGears',
+               'engineMaxRPM',
+               'speed',         # m/S, the length of mLocalVel
+               'vehicle',       # vehicle name, set by Controls
+               'driver',        # driver name, set by Controls
+               'version',       # mVersionUpdateEnd of the telemetry copied
+               'consistent',    # False if the copy was still torn after MAX_RETRIES
+               # Status set by Controls.reasons2stop()
+               'rF2running',
+               'trackLoaded',
+               'onTrack',
+               'escape',        # mElapsedTime has stopped
+               'tick'           # Controls tick that filled it, -1 while being filled
+              )
+
+  def __init__(self, gear=0, clutch=100, engineRPM=0.0, clutchRPM=0.0,
+               elapsedTime=0.0, control=0, maxGears=0, engineMaxRPM=0.0,
+               speed=0.0, vehicle='', driver=''):
+    self.gear = gear
+    self.clutch = clutch
+    self.engineRPM = engineRPM
+    self.clutchRPM = clutchRPM
+    self.elapsedTime = elapsedTime
+    self.control = control
+    self.maxGears = maxGears
+    self.engineMaxRPM = engineMaxRPM
+    self.speed = speed
+    self.vehicle = vehicle
+    self.driver = driver
+    self.version = 0
+    self.consistent = True
+    self.rF2running = False
+    self.trackLoaded = False
+    self.onTrack = False
+    self.escape = False
+    self.tick = 0
+
+  def __repr__(self):
+    return 'TelemetrySnapshot(gear=%d, clutch=%d, engineRPM=%d, clutchRPM=%d, ' \
+      'elapsedTime=%.3f, control=%d)' % (self.gear, self.clutch,
+                                        self.engineRPM, self.clutchRPM,
+                                        self.elapsedTime, self.control)
+
+def clutchPercent(mUnfilteredClutch):
+  """
+  rF2 gives 1.0 clutch down, 0 clutch up.
+  We want 100 clutch released, 0 clutch pressed
+  """
+  return int(-(mUnfilteredClutch-1)*100)
+
+class SnapshotReader:
+  """
+  Reads a TelemetrySnapshot from a SimInfoAPI (or anything that looks
+  like one) once per tick.
+  """
+  def __init__(self, info, control=True):
+    self.info = info
+    self.control = control  # False: the caller fills in snapshot.control
+    self.tornReads = 0   # Copies still inconsistent after MAX_RETRIES
+
+  def read(self, snapshot=None):
+    """
+    Return a TelemetrySnapshot, snapshot refilled if given
+    otherwise a new one
+    """
+    if snapshot is None:
+      snapshot = TelemetrySnapshot()
+    snapshot.consistent = True
+    tele = self.info.Rf2Tele
+    for _retry in range(MAX_RETRIES):
+      begin = tele.mVersionUpdateBegin
+      vehicle = self.info.playersVehicleTelemetry()
+      snapshot.gear = vehicle.mGear
+      snapshot.clutch = clutchPercent(vehicle.mUnfilteredClutch)
+      snapshot.engineRPM = vehicle.mEngineRPM
+      snapshot.clutchRPM = vehicle.mClutchRPM
+      snapshot.elapsedTime = vehicle.mElapsedTime
+      snapshot.maxGears = vehicle.mMaxGears
+      snapshot.engineMaxRPM = vehicle.mEngineMaxRPM
+      v = vehicle.mLocalVel
+      snapshot.speed = sqrt(v.x * v.x + v.y * v.y + v.z * v.z)
+      end = tele.mVersionUpdateEnd
+      if begin == end:
+        break
+    else:
+      self.tornReads += 1
+      snapshot.consistent = False
+    snapshot.version = end
+    # The scoring block is a separate buffer, updated about 5 times a second
+    if self.control:
+      snapshot.control = self.info.playersVehicleScoring().mControl
+    return snapshot
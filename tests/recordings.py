@@ -0,0 +1,23 @@
+import array
+
+from blackBox import SAMPLE_COLUMNS
+
+# Made up black box recordings for the tests
+
+def recording(rows):
+  """ rows of (seconds, gear, clutch) at 10 Hz, a column of samples each """
+  samples = {name: array.array(typecode) for name, typecode in SAMPLE_COLUMNS}
+  t = 0.0
+  for seconds, gear, clutch in rows:
+    for _i in range(int(seconds * 10)):
+      t += 0.1
+      samples['t'].append(t)
+      samples['elapsedTime'].append(t)
+      samples['gear'].append(gear)
+      samples['clutch'].append(clutch)
+      samples['engineRPM'].append(3000)
+      samples['clutchRPM'].append(3000)
+      samples['control'].append(0)
+      samples['speed'].append(20.0 if gear else 0.0)
+      samples['onTrack'].append(1)
+  return samples
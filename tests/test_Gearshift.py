@@ -1,6 +1,9 @@
 import unittest
 
+import Gearshift
 from Gearshift import main
+from keySender import KeySender, RecordingKeys
+from telemetrySnapshot import TelemetrySnapshot
 
 class Test_Gearshift(unittest.TestCase):
   def test_Gearshift_main_runs(self):
@@ -9,5 +12,68 @@ class Test_Gearshift(unittest.TestCase):
     controls_o.stop()
     assert root != None
 
+  def test_over_rev_warning_sends_neutral(self):
+    class _Controls:
+      def __init__(self):
+        self.listeners = []
+      def addListener(self, listener):
+        self.listeners.append(listener)
+    def tick(gear, clutch, speed, rpmPerSpeed):
+      snapshot = TelemetrySnapshot(gear=gear, clutch=clutch, speed=speed,
+                                   engineRPM=rpmPerSpeed * speed,
+                                   clutchRPM=rpmPerSpeed * speed,
+                                   engineMaxRPM=8000.0, vehicle='Car')
+      snapshot.onTrack = True
+      for listener in controls.listeners:
+        listener(snapshot)
+    saved = (Gearshift.keys_o, Gearshift.neutralButton, Gearshift.blackBox_o,
+             Gearshift.ratios_o, Gearshift.damage_o)
+    keys = RecordingKeys()
+    Gearshift.keys_o = KeySender(keys, synchronous=True)
+    Gearshift.neutralButton = 'DIK_NUMPAD0'
+    Gearshift.blackBox_o = None
+    try:
+      controls = _Controls()
+      damage = Gearshift.newDamage(controls, 'DIK_APOSTROPHE')
+      for speed in range(10, 40):   # learn 1st and 3rd
+        tick(1, 100, speed, 300.0)
+      for speed in range(10, 40):
+        tick(3, 100, speed, 150.0)
+      # Down to 1st at 40 m/S: 12000 RPM when the clutch comes up
+      tick(3, 0, 40, 150.0)
+      tick(0, 0, 40, 150.0)
+      tick(1, 0, 40, 150.0)
+      assert damage.overRevWarnings == 1
+      assert [event[1:] for event in keys.events] == [('press', 'DIK_NUMPAD0'),
+                                                      ('release', 'DIK_NUMPAD0')]
+    finally:
+      (Gearshift.keys_o, Gearshift.neutralButton, Gearshift.blackBox_o,
+       Gearshift.ratios_o, Gearshift.damage_o) = saved
+
+  def test_pulses_after_graunch_stop_do_nothing(self):
+    # graunch2/graunch3 timers already firing when graunchStop() ran
+    class _Queue:
+      def __init__(self):
+        self.events = []
+      def put(self, event, source):
+        self.events.append(event)
+        return True
+    saved = (Gearshift.keys_o, Gearshift.neutralButton, Gearshift.eventQueue_o)
+    keys = RecordingKeys()
+    Gearshift.keys_o = KeySender(keys, synchronous=True)
+    Gearshift.neutralButton = 'DIK_NUMPAD0'
+    Gearshift.eventQueue_o = _Queue()
+    try:
+      g = Gearshift.graunch()
+      g.graunchStop()
+      keys.events.clear()
+      g.graunch2()
+      g.graunch3()
+      assert keys.events == []
+      assert Gearshift.eventQueue_o.events == []
+      assert g.timers == []
+    finally:
+      (Gearshift.keys_o, Gearshift.neutralButton, Gearshift.eventQueue_o) = saved
+
 if __name__ == '__main__':
   unittest.main(exit=False)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+from asyncRuntime import AsyncRuntime
+
+class Test_asyncRuntime(unittest.TestCase):
+  def setUp(self):
+    self.runtime = AsyncRuntime()
+    self.calls = []
+
+  def tearDown(self):
+    self.runtime.close()
+
+  def stopAfter(self, seconds):
+    self.runtime.loop.call_later(seconds, self.runtime.loop.stop)
+
+  def test_every(self):
+    periodic = self.runtime.every(0.01, lambda: self.calls.append(self.runtime.loop.time()))
+    self.stopAfter(0.205)
+    self.runtime.run()
+    periodic.stop()
+    # first straight away, then on the grid
+    assert 18 <= len(self.calls) <= 22, len(self.calls)
+    assert periodic.stats.ticks == len(self.calls)
+    assert periodic.stats.overruns == 0
+
+  def test_stop_in_callback(self):
+    def callback():
+      self.calls.append(1)
+      if len(self.calls) == 3:
+        periodic.stop()
+    periodic = self.runtime.every(0.001, callback)
+    self.stopAfter(0.05)
+    self.runtime.run()
+    assert len(self.calls) == 3
+
+  def test_timers(self):
+    timers = self.runtime.timers
+    timers.schedule(0.03, lambda: self.calls.append('graunch3'))
+    timers.schedule(0.01, lambda: self.calls.append('graunch1'))
+    cancelled = timers.schedule(0.02, lambda: self.calls.append('cancelled'))
+    cancelled.cancel()
+    assert timers.pending() == 2
+    self.stopAfter(0.05)
+    self.runtime.run()
+    assert self.calls == ['graunch1', 'graunch3']
+    assert timers.pending() == 0
+    assert not cancelled.fired
+
+  def test_one_thread(self):
+    # Timers set from another thread still run on the loop's
+    def other():
+      self.runtime.timers.schedule(0.001, lambda: self.calls.append(threading.get_ident()))
+    self.runtime.loop.call_soon(lambda: threading.Thread(target=other).start())
+    self.stopAfter(0.05)
+    self.runtime.run()
+    assert self.calls == [threading.get_ident()]
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
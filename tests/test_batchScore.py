@@ -0,0 +1,104 @@
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from blackBox import SAMPLES, SAMPLE_COLUMNS, packBlock
+import batchScore
+from tests.recordings import recording
+
+def _recording(rows):
+  """ rows of (seconds, gear, clutch) at 10 Hz, as a .gsbb image """
+  samples = recording(rows)
+  return packBlock(SAMPLES, [(name, samples[name]) for name, _typecode in SAMPLE_COLUMNS])
+
+CLEAN = [(1, 0, 100), (0.5, 0, 0), (0.5, 1, 0), (2, 1, 100)]
+# 2nd without the clutch, rF2 knocks it out, the driver gives up, then
+# tries again after the timeout
+GRAUNCHED = CLEAN + [(0.5, 2, 100), (4, 0, 100), (0.5, 2, 100), (1, 0, 100)]
+
+class Test_batchScore(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.output = os.path.join(self.folder, 'scores.jsonl')
+    self.paths = []
+    for n, rows in enumerate((CLEAN, GRAUNCHED, GRAUNCHED)):
+      path = os.path.join(self.folder, 'session-%d.gsbb' % n)
+      with open(path, 'wb') as f:
+        f.write(_recording(rows))
+      self.paths.append(path)
+
+  def tearDown(self):
+    for name in os.listdir(self.folder):
+      os.remove(os.path.join(self.folder, name))
+    os.rmdir(self.folder)
+
+  def test_countGraunches(self):
+    def count(rows):
+      t, gear, clutch = [], [], []
+      for seconds, g, c in rows:
+        for _i in range(int(seconds * 10)):
+          t.append(len(t) * 0.1)
+          gear.append(g)
+          clutch.append(c)
+      return batchScore.countGraunches(np.array(t), np.array(gear), np.array(clutch))
+    assert count(CLEAN) == 0
+    assert count(GRAUNCHED) == 2
+    # Still in neutralKeySent, not timed out: no new graunch
+    assert count(CLEAN + [(0.5, 2, 100), (0.5, 0, 100), (0.5, 2, 100)]) == 1
+    # Starts with the clutch already down, then selects a gear
+    assert batchScore.countGraunches(np.arange(4) * 0.1, np.array([0, 0, 1, 1]),
+                                     np.array([0, 0, 0, 100])) == 0
+
+  def test_only_while_driving(self):
+    gear = np.array([0, 2, 2, 0, 2, 2, 0, 2, 2])
+    clutch = np.full(len(gear), 100)
+    t = np.arange(len(gear)) * 0.1
+    assert batchScore.countGraunches(t, gear, clutch) == 1
+    # The AI's shifts and those in the garage aren't counted
+    columns = {'gear': gear, 'control': np.array([1, 1, 1, 0, 0, 0, 0, 0, 0]),
+               'onTrack': np.array([1, 1, 1, 0, 0, 0, 1, 1, 1])}
+    active = batchScore.activeSamples(columns)
+    assert active.tolist() == [False] * 6 + [True] * 3
+    assert batchScore.countGraunches(t, gear, clutch, active=active) == 1
+    active[:] = False
+    assert batchScore.countGraunches(t, gear, clutch, active=active) == 0
+
+  def test_scoreAll(self):
+    # The black box's excerpts aren't sessions
+    with open(os.path.join(self.folder, 'blackbox-1-graunch.gsbb'), 'wb') as f:
+      f.write(_recording(GRAUNCHED))
+    assert batchScore.findRecordings([self.folder]) == self.paths
+    scores = batchScore.scoreAll(self.paths, self.output, workers=2, quiet=True)
+    assert len(scores) == 3
+    byPath = {s['path']: s for s in scores}
+    assert byPath[os.path.abspath(self.paths[0])]['vehicles']['0']['graunches'] == 0
+    assert byPath[os.path.abspath(self.paths[1])]['vehicles']['0']['graunches'] == 2
+    assert byPath[os.path.abspath(self.paths[1])]['vehicles']['0']['without clutch'] == 2
+    assert 'graunches: 4' in batchScore.report(scores)
+
+  def test_resume(self):
+    batchScore.scoreAll(self.paths[:2], self.output, workers=1, quiet=True)
+    with open(self.output, 'a') as f:
+      f.write('{"path": "half writ')   # interrupted
+    scores = batchScore.scoreAll(self.paths, self.output, workers=1, quiet=True)
+    assert len(scores) == 3   # only the third was scored this time
+    assert sorted(s['path'] for s in scores) == sorted(map(os.path.abspath, self.paths))
+
+  def test_bad_recording(self):
+    with open(self.paths[0], 'wb') as f:
+      f.write(b'not a recording')
+    result = batchScore.scoreSession(self.paths[0])
+    assert 'error' in result or result['samples'] == 0
+
+  def test_progress(self):
+    stream = io.StringIO()
+    progress = batchScore.Progress(2, stream=stream)
+    progress.update()
+    progress.update()
+    assert '2/2 sessions' in stream.getvalue()
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
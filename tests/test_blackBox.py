@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+from blackBox import BlackBox, readRecording
+from telemetrySnapshot import TelemetrySnapshot
+
+class Test_blackBox(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.now = 0.0
+    self.blackBox = BlackBox(seconds=1, rate=10, after=0.5, folder=self.folder,
+                             clock=lambda: self.now)
+
+  def tearDown(self):
+    self.blackBox.close()
+
+  def test_memory_is_fixed(self):
+    for i in range(100):
+      self.blackBox.record(TelemetrySnapshot(gear=i % 7, elapsedTime=i))
+    assert self.blackBox.samples.count == 100
+    assert len(self.blackBox.samples.columns[0]) == 10
+
+  def test_graunch_dumps_window(self):
+    for i in range(25):
+      self.blackBox.record(TelemetrySnapshot(gear=1, engineRPM=i, elapsedTime=i))
+    self.blackBox.recordTransition(0, 2, 5)
+    self.blackBox.trigger()
+    for i in range(25, 30):
+      assert not self.blackBox.files
+      self.now += 0.1   # at 10 Hz
+      self.blackBox.record(TelemetrySnapshot(gear=1, engineRPM=i, elapsedTime=i))
+    self.blackBox.flush()
+    assert len(self.blackBox.files) == 1
+    samples, transitions = readRecording(self.blackBox.files[0])
+    # The last 10 samples, 5 before and 5 after the trigger
+    assert list(samples['elapsedTime']) == list(range(20, 30))
+    assert list(transitions['toState']) == [5]
+    assert os.path.dirname(self.blackBox.files[0]) == self.folder
+
+  def test_after_is_in_seconds(self):
+    # Ticking faster than rate (frame polling) still records 'after' seconds
+    blackBox = BlackBox(seconds=1, rate=50, after=0.5, folder=self.folder,
+                        clock=lambda: self.now)
+    try:
+      blackBox.trigger()
+      for i in range(25):
+        assert not blackBox.files
+        self.now += 0.02  # at 50 Hz
+        blackBox.record(TelemetrySnapshot(elapsedTime=i))
+      blackBox.flush()
+      samples, _transitions = readRecording(blackBox.files[0])
+      assert len(samples['elapsedTime']) == 25
+    finally:
+      blackBox.close()
+
+  def test_old_files_deleted(self):
+    names = ['blackbox-old-1-graunch.gsbb', 'blackbox-old-2-graunch.gsbb',
+             'session-old.gsbb']
+    for age, name in enumerate(names):
+      path = os.path.join(self.folder, name)
+      open(path, 'wb').close()
+      os.utime(path, (1000 + age, 1000 + age))
+    blackBox = BlackBox(seconds=1, rate=10, after=0, folder=self.folder, keep=2,
+                        clock=lambda: self.now)
+    try:
+      blackBox.trigger()
+      blackBox.record(TelemetrySnapshot())
+      blackBox.flush()
+      # the oldest black box file went, the session recording stays
+      assert sorted(os.listdir(self.folder)) == sorted(
+        names[1:] + [os.path.basename(blackBox.files[0])])
+      assert blackBox.deleted == 1
+    finally:
+      blackBox.close()
+
+  def test_files_listed_bounded(self):
+    blackBox = BlackBox(seconds=1, rate=10, after=0, folder=self.folder, keep=0,
+                        clock=lambda: self.now)
+    try:
+      for _i in range(blackBox.files.maxlen + 5):
+        blackBox.trigger()
+        blackBox.record(TelemetrySnapshot())
+        blackBox.flush()
+      assert len(blackBox.files) == blackBox.files.maxlen
+      assert len(os.listdir(self.folder)) == blackBox.files.maxlen + 5
+    finally:
+      blackBox.close()
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,30 @@
+import unittest
+
+from channels import Channel
+
+class Test_channels(unittest.TestCase):
+  def test_read_when_due(self):
+    values = iter([1, 1, 2])
+    channel = Channel('test', lambda: next(values), rate=5)
+    assert channel.get(0.0) == 1 and channel.changed   # None to 1
+    assert channel.get(0.1) == 1 and not channel.changed and channel.reads == 1
+    assert channel.get(0.2) == 1 and not channel.changed and channel.reads == 2
+    assert channel.get(0.3) == 1 and channel.reads == 2
+    assert channel.get(0.4) == 2 and channel.changed and channel.reads == 3
+
+  def test_every_get(self):
+    channel = Channel('test', lambda: 'x')
+    for _i in range(3):
+      channel.get(0.0)
+    assert channel.reads == 3
+
+  def test_expire(self):
+    channel = Channel('test', lambda: 'x', rate=1)
+    channel.get(0.0)
+    channel.get(0.5)
+    channel.expire()
+    channel.get(0.5)
+    assert channel.reads == 2
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,86 @@
+import random
+import unittest
+
+from clutchSampler import ClutchSampler
+from stateMachine import CLUTCH_DISENGAGE, CLUTCH_ENGAGE
+
+class _Vehicle:
+  mUnfilteredClutch = 0.0
+
+class _Info:
+  def __init__(self):
+    self.vehicle = _Vehicle()
+
+  def playersVehicleTelemetry(self):
+    return self.vehicle
+
+class Test_clutchSampler(unittest.TestCase):
+  def setUp(self):
+    self.edges = []
+    self.now = 0.0
+    self.sampler = self.newSampler()
+
+  def newSampler(self, **kwargs):
+    return ClutchSampler(None, lambda event, t: self.edges.append((event, t)),
+                         rate=500, bitePoint=90, clock=lambda: self.now, **kwargs)
+
+  def run_(self, clutches, sampler=None):
+    sampler = sampler or self.sampler
+    for clutch in clutches:
+      self.now += 0.002
+      sampler.sample(clutch)
+
+  def test_noise_at_the_bite_point(self):
+    rng = random.Random(1)
+    self.run_([100] * 10)
+    # resting the foot on the pedal near the bite point
+    self.run_([90 + rng.uniform(-1.5, 1.5) for _i in range(500)])
+    assert not self.edges
+    assert self.sampler.bounces > 100
+    self.run_([0] * 10 + [100] * 10)
+    assert [event for event, t in self.edges] == [CLUTCH_DISENGAGE, CLUTCH_ENGAGE]
+
+  def test_quick_dab(self):
+    # 30 mS down, missed by a 100 mS tick
+    self.run_([100] * 50 + [0] * 15 + [100] * 50)
+    assert [event for event, t in self.edges] == [CLUTCH_DISENGAGE, CLUTCH_ENGAGE]
+
+  def test_edge_time(self):
+    sampler = self.newSampler(filterTime=0, hysteresis=0)
+    self.run_([100, 100], sampler)
+    self.now = 1.0
+    sampler.sample(100)
+    self.now = 1.002
+    sampler.sample(80)    # crosses 90 half way between
+    assert self.edges[0][0] == CLUTCH_DISENGAGE
+    assert abs(self.edges[0][1] - 1.001) < 1e-9
+
+  def test_bite_point_near_the_ends(self):
+    for bitePoint in (0, 2, 98, 100):
+      self.edges = []
+      sampler = ClutchSampler(None, lambda event, t: self.edges.append(event),
+                              rate=500, bitePoint=bitePoint, clock=lambda: self.now)
+      self.run_([100] * 50 + [0] * 50 + [100] * 50, sampler)
+      assert self.edges == [CLUTCH_DISENGAGE, CLUTCH_ENGAGE], (bitePoint, self.edges)
+
+  def test_inactive(self):
+    active = [False]
+    sampler = self.newSampler(active=lambda: active[0])
+    self.run_([100] * 10 + [0] * 10, sampler)
+    assert not self.edges and sampler.down
+    active[0] = True
+    self.run_([100] * 10, sampler)
+    assert [event for event, t in self.edges] == [CLUTCH_ENGAGE]
+
+  def test_tick(self):
+    info = _Info()
+    sampler = ClutchSampler(info, lambda event, t: self.edges.append(event),
+                            filterTime=0)
+    sampler.tick()
+    info.vehicle.mUnfilteredClutch = 1.0    # pressed
+    sampler.tick()
+    assert self.edges == [CLUTCH_DISENGAGE]
+    assert sampler.stats()['samples'] == 2
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
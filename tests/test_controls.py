@@ -0,0 +1,109 @@
+import time
+import unittest
+
+from memoryMapInputs import Controls
+from replay import ReplayInfo
+from scheduler import FRAME, MAX_FRAME_RATE
+
+class _Info(ReplayInfo):
+  """ One sample, off track """
+  def __init__(self):
+    ReplayInfo.__init__(self, {'gear': [3], 'clutch': [100], 'engineRPM': [4000.0],
+                               'clutchRPM': [4000.0], 'elapsedTime': [1.0],
+                               'control': [0], 'speed': []})
+    self.setSample(0)
+    self.onTrack = False
+    self.running = True
+    self.statusReads = 0
+
+  def isRF2running(self):
+    return self.running
+
+  def isOnTrack(self):
+    self.statusReads += 1
+    return self.onTrack
+
+class Test_controls(unittest.TestCase):
+  def test_double_buffered_snapshot(self):
+    info = _Info()
+    controls = Controls(info=info)
+    controls.callback = lambda **kwargs: None
+    published = []
+    for _tick in range(4):
+      controls.monitor()
+      published.append(controls.snapshot)
+    # Two snapshots used in turn, never a new one per tick
+    assert published[0] is published[2] and published[1] is published[3]
+    assert published[0] is not published[1]
+    assert [s.tick for s in published[2:]] == [3, 4]
+
+  def test_status_for_the_gui(self):
+    info = _Info()
+    controls = Controls(info=info)
+    controls.callback = lambda **kwargs: None
+    controls.monitor()
+    snapshot = controls.snapshot
+    assert snapshot.rF2running and snapshot.trackLoaded and not snapshot.onTrack
+    assert snapshot.driver == 'Replay'
+    assert info.statusReads == 1  # once a tick
+    info.onTrack = True
+    controls.monitor()
+    assert controls.snapshot.onTrack and not controls.snapshot.escape
+    controls.monitor()
+    assert controls.snapshot.escape   # mElapsedTime didn't move
+
+  def test_slow_channels(self):
+    # The session is read at its own rate, not every tick
+    info = _Info()
+    controls = Controls(info=info, channelRates={'session': 1, 'liveness': 1})
+    controls.callback = lambda **kwargs: None
+    for _tick in range(5):
+      controls.monitor()
+    assert info.statusReads == 1
+    assert controls.channelStats()['telemetry'] == 5
+    assert controls.channelStats()['scoring'] == 6   # and __init__'s snapshot
+    assert controls.channelStats()['liveness'] == 1
+
+  def test_pause_and_resume(self):
+    info = _Info()
+    info.onTrack = True
+    controls = Controls(info=info, rate=100)
+    events = []
+    controls.run(lambda **kwargs: events.append(kwargs))
+    time.sleep(0.05)
+    info.running = False
+    controls.pause()
+    ticks = controls.ticks
+    assert events[-1] == {'stopEvent': True}
+    assert not controls.snapshot.rF2running
+    time.sleep(0.05)
+    assert controls.ticks == ticks   # not polling
+    resumed = []
+    controls.resumeListeners.append(lambda: resumed.append(controls.ticks))
+    info.running = True
+    controls.resume()
+    assert resumed[0] >= ticks + 1 and controls.snapshot.rF2running   # warm
+    time.sleep(0.05)
+    controls.stop()
+    controls.thread.join()
+    assert controls.ticks > resumed[0]
+
+  def test_frame_polling(self):
+    # A tick for each new frame, not for the same one again
+    info = _Info()
+    controls = Controls(info=info, rate=10, pollMode=FRAME)
+    assert controls.maxRate() == MAX_FRAME_RATE   # for sizing the black box
+    controls.run(lambda **kwargs: None)
+    for version in range(1, 6):
+      time.sleep(0.02)
+      info.Rf2Tele.mVersionUpdateEnd = version
+    time.sleep(0.03)
+    controls.stop()
+    controls.thread.join()
+    stats = controls.schedulerStats()
+    assert stats.framesSeen == 5, str(stats)
+    assert controls.ticks == 1 + stats.framesSeen + stats.staleTicks
+    assert stats.staleTicks <= 1
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
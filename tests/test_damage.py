@@ -0,0 +1,86 @@
+import time
+import unittest
+
+from damage import Damage
+from telemetrySnapshot import TelemetrySnapshot
+
+def _snapshot(onTrack=True, **kwargs):
+  snapshot = TelemetrySnapshot(**kwargs)
+  snapshot.onTrack = onTrack
+  return snapshot
+
+class Test_damage(unittest.TestCase):
+  def setUp(self):
+    self.blown = []
+    self.damage = Damage(bitePoint=90, blown=lambda: self.blown.append(True))
+    self.t = 0.0
+
+  def tick(self, gear, clutch, engineRPM=4000.0, clutchRPM=4000.0, control=0,
+           onTrack=True, vehicle='Car'):
+    self.t += 0.01
+    self.damage.update(_snapshot(gear=gear, clutch=clutch,
+                                 engineRPM=engineRPM, clutchRPM=clutchRPM,
+                                 elapsedTime=self.t, engineMaxRPM=8000.0,
+                                 control=control, onTrack=onTrack, vehicle=vehicle))
+
+  def test_clean_shift_no_damage(self):
+    for clutch, gear in [(100, 0), (0, 0), (0, 1), (0, 1), (100, 1)]:
+      self.tick(gear, clutch)
+    assert self.damage.levels() == {'engine': 0.0, 'clutch': 0.0, 'gearbox': 0.0}
+
+  def test_shift_without_clutch(self):
+    self.tick(0, 100)
+    self.tick(1, 100)
+    assert self.damage.gearbox > 0.0
+
+  def test_over_rev_downshift_blows_engine(self):
+    self.tick(4, 100, 7000, 7000)
+    self.tick(4, 0, 7000, 7000)
+    self.tick(0, 0, 7000, 7000)
+    self.tick(1, 0, 7000, 16000)
+    assert not self.blown
+    self.tick(1, 100, 16000, 16000)   # clutch up, engine dragged to 16000
+    assert self.damage.engine >= 1.0
+    assert self.blown == [True]
+    self.tick(1, 100, 16000, 16000)
+    assert self.blown == [True]       # only once
+
+  def test_starts_as_it_finds_it(self):
+    # Already in gear with the clutch up isn't a shift without the clutch
+    self.tick(3, 100)
+    self.tick(3, 100)
+    assert self.damage.levels() == {'engine': 0.0, 'clutch': 0.0, 'gearbox': 0.0}
+
+  def test_only_the_player_driving(self):
+    self.tick(0, 100)
+    for control, onTrack in ((1, True), (3, True), (0, False)):
+      # The AI, a replay, the garage
+      self.tick(0, 100, control=control, onTrack=onTrack)
+      self.tick(1, 100, 7000, 16000, control=control, onTrack=onTrack)
+      self.tick(1, 100, 16000, 16000, control=control, onTrack=onTrack)
+      self.tick(0, 100, control=control, onTrack=onTrack)
+    assert self.damage.levels() == {'engine': 0.0, 'clutch': 0.0, 'gearbox': 0.0}
+    assert not self.blown
+
+  def test_new_vehicle(self):
+    self.tick(0, 100)
+    self.tick(1, 100, 16000, 16000)
+    assert self.damage.engine > 0.0 and self.blown
+    self.tick(0, 100, vehicle='Another car')
+    assert self.damage.levels() == {'engine': 0.0, 'clutch': 0.0, 'gearbox': 0.0}
+    assert not self.damage.blownSent
+
+  def test_update_is_fast(self):
+    snapshots = [_snapshot(gear=i % 3, clutch=(i * 7) % 101,
+                                   engineRPM=5000.0 + i, clutchRPM=4000.0,
+                                   elapsedTime=i * 0.01, engineMaxRPM=8000.0)
+                 for i in range(1000)]
+    start = time.perf_counter()
+    for _i in range(10):
+      for snapshot in snapshots:
+        self.damage.update(snapshot)
+    perTick = (time.perf_counter() - start) / 10000
+    assert perTick < 20e-6, perTick
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
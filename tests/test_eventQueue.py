@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+import eventQueue
+from eventQueue import EventQueue
+from latency import LatencyTracker, DISPATCH
+
+class Test_eventQueue(unittest.TestCase):
+  def setUp(self):
+    self.handled = []
+
+  def handler(self, event, source, timestamp):
+    self.handled.append((event, source, threading.get_ident()))
+
+  def test_one_consumer_in_order(self):
+    queue = EventQueue(self.handler)
+    def producer(source):
+      for event in range(50):
+        queue.put(event, source)
+    threads = [threading.Thread(target=producer, args=(source,))
+               for source in (eventQueue.GEAR, eventQueue.TIMEOUT)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    queue.close()
+    assert len(self.handled) == 100
+    assert len({ident for _e, _s, ident in self.handled}) == 1
+    assert threading.get_ident() not in {ident for _e, _s, ident in self.handled}
+    # each source's events in the order they were put
+    for source in (eventQueue.GEAR, eventQueue.TIMEOUT):
+      assert [e for e, s, _i in self.handled if s == source] == list(range(50))
+    assert queue.bySource[eventQueue.GEAR] == 50
+    assert queue.stats()['handled'] == 100
+    assert queue.wait.count == 100
+
+  def test_bounded(self):
+    go = threading.Event()
+    queue = EventQueue(lambda *args: go.wait(), capacity=4)
+    results = [queue.put(event, eventQueue.CLUTCH) for event in range(10)]
+    # one being handled, four waiting, the rest dropped
+    assert results.count(False) >= 5
+    assert queue.dropped == results.count(False)
+    assert queue.depth.max <= 4
+    go.set()
+    queue.close()
+    assert not queue.put(0, eventQueue.STOP)   # closed
+
+  def test_stop_and_timeout_not_dropped(self):
+    go = threading.Event()
+    started = threading.Event()
+    def handler(event, source, timestamp):
+      started.set()
+      go.wait()
+      self.handled.append((event, source))
+    queue = EventQueue(handler, capacity=2)
+    queue.put(0, eventQueue.GEAR)
+    started.wait()    # 0 being handled, the queue is empty
+    assert queue.put(1, eventQueue.CLUTCH)
+    assert queue.put(2, eventQueue.GEAR)
+    assert not queue.put(3, eventQueue.GEAR)       # full
+    assert queue.put(4, eventQueue.STOP)           # pushes out 1
+    assert queue.put(5, eventQueue.TIMEOUT)        # pushes out 2
+    # both queued events critical, the next one waits for room
+    putter = threading.Thread(target=queue.put, args=(6, eventQueue.STOP))
+    putter.start()
+    putter.join(0.1)
+    assert putter.is_alive()
+    go.set()
+    putter.join()
+    queue.close()
+    assert [e for e, _s in self.handled] == [0, 4, 5, 6]
+    assert queue.dropped == 1
+    assert queue.evicted == 2
+
+  def test_synchronous(self):
+    queue = EventQueue(self.handler, synchronous=True)
+    queue.put(1, eventQueue.GEAR)
+    assert self.handled == [(1, eventQueue.GEAR, threading.get_ident())]
+
+  def test_latency_carried_on(self):
+    tracker = LatencyTracker()
+    queue = EventQueue(lambda *args: tracker.mark(DISPATCH), latency=tracker)
+    tracker.begin()
+    queue.put(1, eventQueue.GEAR)
+    tracker.end()
+    queue.put(2, eventQueue.TIMEOUT)  # not from a tick
+    queue.close()
+    assert tracker.stats()[DISPATCH]['count'] == 1
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from damage import Damage
+from gearRatios import GearRatios, MIN_SAMPLES
+from telemetrySnapshot import TelemetrySnapshot
+
+# RPM per m/S
+RATIOS = {1: 300.0, 2: 200.0, 3: 150.0, -1: 320.0}
+
+def _snapshot(gear, speed, vehicle='Car', clutch=100):
+  snapshot = TelemetrySnapshot(gear=gear, clutch=clutch, speed=speed,
+                               clutchRPM=RATIOS.get(gear, 0.0) * speed,
+                               engineRPM=RATIOS.get(gear, 0.0) * speed,
+                               engineMaxRPM=8000.0, vehicle=vehicle)
+  snapshot.onTrack = True
+  return snapshot
+
+class Test_gearRatios(unittest.TestCase):
+  def setUp(self):
+    fd, self.cacheFile = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    os.remove(self.cacheFile)
+
+  def tearDown(self):
+    if os.path.exists(self.cacheFile):
+      os.remove(self.cacheFile)
+
+  def drive(self, ratios, vehicle='Car'):
+    for gear in RATIOS:
+      for i in range(MIN_SAMPLES * 2):
+        ratios.update(_snapshot(gear, 5.0 + i, vehicle))
+
+  def test_learns_ratios(self):
+    ratios = GearRatios()
+    assert ratios.predictRPM(2, 10.0) is None
+    self.drive(ratios)
+    for gear, ratio in RATIOS.items():
+      assert abs(ratios.ratio(gear) - ratio) < 1e-6
+    assert abs(ratios.predictRPM(1, 20.0) - 6000.0) < 1e-3
+    assert ratios.ratio(0) is None
+    assert ratios.ratio(5) is None
+
+  def test_slow_and_neutral_ignored(self):
+    ratios = GearRatios()
+    for _i in range(MIN_SAMPLES * 2):
+      ratios.update(_snapshot(1, 0.5))
+      ratios.update(_snapshot(0, 20.0))
+    assert ratios.ratios() == {}
+
+  def test_cached_per_vehicle(self):
+    ratios = GearRatios(self.cacheFile)
+    self.drive(ratios, 'Car')
+    ratios.update(_snapshot(0, 0.0, 'Other car'))
+    assert ratios.ratios() == {}
+    ratios.save()
+
+    ratios = GearRatios(self.cacheFile)
+    ratios.update(_snapshot(0, 0.0, 'Car'))
+    assert abs(ratios.ratio(3) - RATIOS[3]) < 1e-6
+    ratios.update(_snapshot(0, 0.0, 'Other car'))
+    assert ratios.ratio(3) is None
+
+  def test_damage_warns_of_over_rev_downshift(self):
+    ratios = GearRatios()
+    self.drive(ratios)
+    warnings = []
+    damage = Damage(bitePoint=90, ratios=ratios,
+                    overRev=lambda gear, rpm: warnings.append((gear, rpm)))
+    # 3rd at 40 m/S is 6000 RPM, 1st would be 12000
+    for gear, clutch in [(3, 100), (3, 0), (0, 0), (1, 0)]:
+      snapshot = _snapshot(gear, 40.0, clutch=clutch)
+      ratios.update(snapshot)
+      damage.update(snapshot)
+    assert damage.overRevWarnings == 1
+    assert warnings[0][0] == 1 and abs(warnings[0][1] - 12000.0) < 1e-3
+    assert damage.engine == 0.0   # not yet, the clutch is still down
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,47 @@
+import os
+import time
+import unittest
+
+import sound
+from graunchSynth import GraunchSynth, resample
+
+WAV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   'Grind_default.wav')
+
+class Test_graunchSynth(unittest.TestCase):
+  def setUp(self):
+    self.wav = sound.loadWav(WAV)
+
+  def test_resample(self):
+    higher = resample(self.wav, 2.0, 1.0)
+    assert abs(higher.nFrames() - self.wav.nFrames() / 2) <= 1
+    same = resample(self.wav, 1.0, 1.0)
+    assert same.frames == self.wav.frames
+    silent = resample(self.wav, 1.0, 0.0)
+    assert silent.frames == bytes(len(self.wav.frames))
+
+  def test_buckets(self):
+    synth = GraunchSynth(self.wav, buckets=8, cacheSize=2, maxDifference=8000.0)
+    assert synth.bucket(0) == 0
+    assert synth.bucket(-1500) == 1
+    assert synth.bucket(3000) == 3
+    assert synth.bucket(100000) == 7
+    synth.close()
+
+  def test_never_resamples_when_asked(self):
+    synth = GraunchSynth(self.wav, buckets=8, cacheSize=2)
+    synth.waitUntilIdle()
+    assert sorted(synth.cache) == [0, 1]
+    start = time.perf_counter()
+    played = synth.sound(100000)    # top bucket, not made yet
+    assert time.perf_counter() - start < 0.005
+    assert played is synth.cache[1]   # the nearest there is
+    synth.waitUntilIdle()
+    assert synth.sound(100000) is synth.cache[7]
+    # The cache stays the size it was given
+    assert len(synth.cache) == 2
+    assert 0 not in synth.cache   # least recently used went
+    synth.close()
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import hwControl
+import keySender
+
+class Test_hwControl(unittest.TestCase):
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp()
+    os.close(fd)
+    self.hw = hwControl.HWControl(self.path)
+
+  def tearDown(self):
+    self.hw.close()
+    os.remove(self.path)
+
+  def test_request(self):
+    self.hw.request('Neutral', hwControl.PRESSED)
+    b = self.hw.buffer
+    assert b.mVersionUpdateBegin == b.mVersionUpdateEnd == 1
+    assert b.mLayoutVersion == hwControl.LAYOUT_VERSION
+    assert b.mControlName == b'Neutral'
+    assert b.mfRetVal == 1.0
+    self.hw.request('Neutral', hwControl.RELEASED)
+    assert b.mVersionUpdateBegin == b.mVersionUpdateEnd == 2
+    assert b.mfRetVal == 0.0
+    assert self.hw.requests == 2
+
+  def test_written_to_the_file(self):
+    self.hw.request('Neutral')
+    other = hwControl.HWControl(self.path)
+    try:
+      assert other.buffer.mVersionUpdateEnd == 1
+      assert other.buffer.mControlName == b'Neutral'
+    finally:
+      other.close()
+
+  def test_name_truncated(self):
+    self.hw.request('x' * 200)
+    assert len(self.hw.buffer.mControlName) == hwControl.MAX_HWCONTROL_NAME_LEN - 1
+
+  def test_keys(self):
+    fallback = keySender.RecordingKeys(clock=lambda: 0)
+    keys = keySender.KeySender(hwControl.HWControlKeys(self.hw, 'DIK_NUMPAD0',
+                                                       'Neutral', fallback),
+                               synchronous=True)
+    keys.pressRelease('DIK_NUMPAD0')
+    keys.pressRelease('DIK_I')
+    assert self.hw.requests == 2
+    assert self.hw.buffer.mfRetVal == hwControl.RELEASED
+    assert fallback.events == [(0, 'press', 'DIK_I'), (0, 'release', 'DIK_I')]
+
+  def test_no_plugin_mapping(self):
+    # Windows: the plugin's mapping is opened, never created
+    class _Kernel32:
+      def __init__(self, handle):
+        self.handle = handle
+        self.closed = []
+      def OpenFileMappingW(self, access, inherit, name):
+        return self.handle
+      def MapViewOfFile(self, handle, access, high, low, size):
+        return 0x1000
+      def UnmapViewOfFile(self, address):
+        self.closed.append(address)
+      def CloseHandle(self, handle):
+        self.closed.append(handle)
+    with self.assertRaises(OSError):
+      hwControl.NamedMapping(hwControl.BUFFER_NAME, 8, _Kernel32(None), lambda: 2)
+    kernel32 = _Kernel32(42)
+    mapping = hwControl.NamedMapping(hwControl.BUFFER_NAME, 8, kernel32, lambda: 0)
+    assert mapping.address == 0x1000
+    mapping.close()
+    assert kernel32.closed == [0x1000, 42]
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
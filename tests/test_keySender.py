@@ -0,0 +1,71 @@
+import threading
+import time
+import unittest
+
+import latency
+from keySender import KeySender, RecordingKeys
+
+class _SlowKeys(RecordingKeys):
+  """ SendInput() that takes a while """
+  def __init__(self):
+    RecordingKeys.__init__(self)
+    self.go = threading.Event()
+  def press(self, key):
+    self.go.wait(1.0)
+    RecordingKeys.press(self, key)
+
+class Test_keySender(unittest.TestCase):
+  def test_coalescing(self):
+    keys = RecordingKeys()
+    sender = KeySender(keys, synchronous=True)
+    sender.release('N')   # state unknown, sent
+    sender.release('N')
+    sender.press('N')
+    sender.press('N')
+    sender.release('N')
+    sender.pressRelease('G')
+    assert [(action, key) for _t, action, key in keys.events] == \
+      [('release', 'N'), ('press', 'N'), ('release', 'N'), ('press', 'G'), ('release', 'G')]
+    assert sender.coalesced == 2
+
+  def test_slow_send_does_not_block(self):
+    keys = _SlowKeys()
+    sender = KeySender(keys)
+    start = time.perf_counter()
+    for _i in range(10):
+      sender.press('N')
+      sender.release('N')
+    assert time.perf_counter() - start < 0.1
+    keys.go.set()
+    assert sender.flush(2.0)
+    actions = [action for _t, action, _key in keys.events]
+    # Every press before its release
+    assert actions == ['press', 'release'] * 10
+    sender.close()
+
+  def test_full_queue_keeps_releases(self):
+    keys = _SlowKeys()
+    sender = KeySender(keys, maxQueue=2)
+    for key in 'ABCD':
+      sender.press(key)
+    for key in 'ABCD':
+      sender.release(key)
+    keys.go.set()
+    sender.close()
+    assert sender.dropped > 0
+    released = [key for _t, action, key in keys.events if action == 'release']
+    assert released == list('ABCD')
+
+  def test_key_sent_latency(self):
+    tracker = latency.LatencyTracker()
+    sender = KeySender(RecordingKeys(), latency=tracker)
+    tracker.begin()
+    sender.press('N')
+    sender.release('N')   # only presses are timed
+    tracker.end()
+    sender.press('G')     # not in a tick
+    sender.close()
+    assert tracker.stats()[latency.KEY_SENT]['count'] == 1
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
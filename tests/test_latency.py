@@ -0,0 +1,61 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from latency import (LatencyHistogram, LatencyTracker, bucketIndex, bucketLowest,
+                     DISPATCH, NEUTRAL_KEY, READ)
+
+class Test_latency(unittest.TestCase):
+  def test_buckets(self):
+    # Every value is in a bucket no more than ~3% wide
+    previous = -1
+    for value in list(range(2000)) + [10 ** 6, 59 * 10 ** 6]:
+      index = bucketIndex(value)
+      assert index >= previous
+      previous = index
+      low = bucketLowest(index)
+      high = bucketLowest(index + 1) - 1
+      assert low <= value <= high
+      assert high - low <= max(1, value * 0.07)
+
+  def test_percentiles(self):
+    h = LatencyHistogram()
+    for value in range(1, 1001):
+      h.record(value)
+    assert h.count == 1000
+    assert h.max == 1000
+    assert abs(h.percentile(50) - 500) <= 500 * 0.04
+    assert abs(h.percentile(99) - 990) <= 990 * 0.04
+    assert h.percentile(100) == 1000
+    assert LatencyHistogram().percentile(99) == 0
+
+  def test_tracker_only_counts_the_tick_thread(self):
+    tracker = LatencyTracker()
+    tracker.begin()
+    tracker.mark(READ)
+    other = threading.Thread(target=tracker.mark, args=(NEUTRAL_KEY,))
+    other.start()
+    other.join()
+    tracker.mark(DISPATCH)
+    tracker.end()
+    tracker.mark(DISPATCH)    # outside a tick
+    stats = tracker.stats()
+    assert stats[READ]['count'] == 1
+    assert stats[DISPATCH]['count'] == 1
+    assert stats[NEUTRAL_KEY]['count'] == 0
+
+  def test_dump(self):
+    tracker = LatencyTracker()
+    tracker.histograms[NEUTRAL_KEY].record(1234)
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    tracker.dump(path)
+    with open(path) as f:
+      text = f.read()
+    os.remove(path)
+    assert 'neutral key' in text
+    assert '1234' in text
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
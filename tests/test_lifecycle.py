@@ -0,0 +1,62 @@
+import unittest
+
+from lifecycle import RF2Watcher
+from timerWheel import VirtualTimerService
+
+class _Process:
+  def __init__(self):
+    self.running = True
+
+  def is_running(self):
+    return self.running
+
+class _World:
+  """ rF2 comes and goes, the watcher's callbacks are logged """
+  def __init__(self):
+    self.timers = VirtualTimerService()
+    self.process = None
+    self.log = []
+    self.watcher = RF2Watcher(self.timers,
+                              onStart=lambda: self.log.append(('start', self.timers.now())),
+                              onStop=lambda: self.log.append(('stop', self.timers.now())),
+                              find=lambda: self.process,
+                              minBackoff=0.5, maxBackoff=4.0, presentInterval=2.0)
+
+class Test_lifecycle(unittest.TestCase):
+  def test_backoff_while_absent(self):
+    world = _World()
+    world.watcher.start()
+    world.timers.advanceTo(20.0)
+    assert world.log == [('stop', 0.0)]
+    # Looks at 0, 0.5, 1.5, 3.5, 7.5, then every 4 seconds
+    assert world.watcher.searches == 8
+    assert world.watcher.backoff == 4.0
+
+  def test_start_and_stop(self):
+    world = _World()
+    world.process = _Process()
+    world.watcher.start()
+    world.timers.advanceTo(10.0)
+    assert world.log == []    # running all along, nothing to resume
+    assert world.watcher.searches == 1 and world.watcher.checks == 5
+    world.process.running = False
+    world.process = None
+    world.timers.advanceTo(13.0)
+    assert world.log == [('stop', 12.0)]   # the next check
+    world.process = _Process()
+    world.timers.advanceTo(20.0)
+    # Looked again at 12.5 and 13.5, found it then
+    assert world.log == [('stop', 12.0), ('start', 13.5)]
+    assert world.watcher.backoff == 0.5
+
+  def test_stop(self):
+    world = _World()
+    world.watcher.start()
+    world.timers.advanceTo(1.0)
+    world.watcher.stop()
+    world.timers.advanceTo(100.0)
+    assert world.watcher.searches == 2   # at 0 and 0.5
+    assert world.timers.pending() == 0
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
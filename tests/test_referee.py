@@ -0,0 +1,138 @@
+import random
+import unittest
+
+import numpy as np
+
+import stateMachine
+from referee import Referee, benchmark
+
+class _Vehicle:
+  def __init__(self, mID):
+    self.mID = mID
+    self.mGear = 0
+    self.mUnfilteredClutch = 0.0
+    self.mDriverName = b'Driver %d\0' % mID
+
+class _ScoringInfo:
+  mNumVehicles = 0
+
+class _Buffer:
+  mVersionUpdateBegin = 0
+  mVersionUpdateEnd = 0
+
+class _Info:
+  """ The parts of SimInfoAPI the referee reads """
+  def __init__(self, nCars):
+    self.Rf2Tele = _Buffer()
+    self.Rf2Tele.mVehicles = [_Vehicle(mID) for mID in range(nCars)]
+    self.Rf2Tele.mNumVehicles = nCars
+    self.Rf2Scor = _Buffer()
+    self.Rf2Scor.mVehicles = self.Rf2Tele.mVehicles
+    self.Rf2Scor.mScoringInfo = _ScoringInfo()
+    self.Rf2Scor.mScoringInfo.mNumVehicles = nCars
+
+class Test_referee(unittest.TestCase):
+  def setUp(self):
+    self.info = _Info(3)
+    self.now = 0.0
+    self.referee = Referee(self.info, maxCars=8, clock=lambda: self.now)
+
+  def tick(self, seconds=0.02):
+    self.now += seconds
+    self.referee.tick()
+
+  def car(self, mID, gear=None, clutch=None):
+    vehicle = self.info.Rf2Tele.mVehicles[mID]
+    if gear is not None:
+      vehicle.mGear = gear
+    if clutch is not None:
+      vehicle.mUnfilteredClutch = clutch  # 1.0 pressed
+    self.tick()
+
+  def row(self, mID):
+    slot = self.referee.slots[mID]
+    return [row for row in self.referee.results() if row['slot'] == slot][0]
+
+  def test_clean_change(self):
+    self.tick()
+    self.car(0, clutch=1.0)
+    self.car(0, gear=1)
+    self.car(0, clutch=0.0)
+    assert self.row(0)['graunches'] == 0
+    assert self.row(0)['abuse'] == 0
+    assert self.row(0)['state'] == 'inGear'
+    assert self.row(0)['driver'] == 'Driver 0'
+
+  def test_graunch_and_timeout(self):
+    self.tick()
+    self.car(1, gear=2)     # no clutch
+    assert self.row(1)['graunches'] == 1
+    assert self.row(1)['abuse'] == 1
+    assert self.row(1)['state'] == 'graunching'
+    self.car(1, gear=0)     # rF2 knocks it out
+    assert self.row(1)['state'] == 'neutralKeySent'
+    self.tick(3.0)
+    assert self.row(1)['state'] == 'neutral'
+    assert not self.referee.graunching.any()
+    # the other cars weren't touched
+    assert self.row(0)['state'] == self.row(2)['state'] == 'neutral'
+
+  def test_cars_come_and_go(self):
+    self.tick()
+    assert len(self.referee.slots) == 3
+    self.car(2, gear=3)
+    self.info.Rf2Tele.mNumVehicles = 2
+    self.tick()
+    assert 2 not in self.referee.slots
+    self.info.Rf2Tele.mVehicles[2] = _Vehicle(7)
+    self.info.Rf2Tele.mNumVehicles = 3
+    self.tick()
+    # a new car starts from nothing
+    assert self.row(7)['graunches'] == 0
+    assert len(self.referee.results()) == 3
+
+  def test_same_as_GearStateMachine(self):
+    # Random events for a grid, each car checked against its own
+    # GearStateMachine
+    nCars = 20
+    rng = random.Random(3)
+    referee = Referee(maxCars=nCars)
+    referee.active[:] = True
+    graunches = [stateMachine.GraunchCounter() for _car in range(nCars)]
+    machines = [stateMachine.GearStateMachine(g) for g in graunches]
+    gears = np.zeros(nCars, np.int8)
+    clutches = np.full(nCars, 100, np.int16)
+    prevGears = [0] * nCars
+    prevDown = [False] * nCars
+    for t in range(2000):
+      for car in range(nCars):
+        if rng.random() < 0.1:
+          gears[car] = rng.randint(0, 3)
+        if rng.random() < 0.1:
+          clutches[car] = rng.choice((0, 100))
+      now = t * 0.02
+      referee.step(gears, clutches, now)
+      for graunch in graunches:
+        graunch.now = now
+      for car, machine in enumerate(machines):
+        if gears[car] != prevGears[car]:
+          machine.dispatch(stateMachine.GEAR_SELECT if gears[car]
+                           else stateMachine.GEAR_DESELECT)
+          prevGears[car] = gears[car]
+        down = bool(clutches[car] < 90)
+        if down != prevDown[car]:
+          machine.dispatch(stateMachine.CLUTCH_DISENGAGE if down
+                           else stateMachine.CLUTCH_ENGAGE)
+          prevDown[car] = down
+        if graunches[car].deadline <= now:
+          machine.dispatch(stateMachine.GRAUNCH_TIMEOUT)
+        assert referee.state[car] == machine.state, (t, car)
+        assert referee.graunching[car] == graunches[car].graunching, (t, car)
+        assert referee.graunches[car] == graunches[car].graunches, (t, car)
+
+  def test_full_grid_at_50Hz(self):
+    mean, _worst = benchmark(128, ticks=500)
+    assert mean < 20000 / 10, mean    # a tenth of a 50 Hz tick
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,32 @@
+import unittest
+
+from replay import Replay
+from tests.recordings import recording
+
+class Test_replay(unittest.TestCase):
+  def test_good_change(self):
+    replay = Replay(recording([(1, 0, 100), (0.5, 0, 0), (0.5, 1, 0), (600, 1, 100)]))
+    try:
+      result = replay.run()
+    finally:
+      replay.close()
+    assert result['graunches'] == 0
+    assert result['final state'] == 'inGear'
+    assert result['replay seconds'] < result['session seconds']
+
+  def test_graunch_timeout(self):
+    # Into gear without the clutch, rF2 knocks it back to neutral and
+    # the player leaves it there
+    replay = Replay(recording([(1, 0, 100), (0.2, 1, 100), (5, 0, 100)]))
+    try:
+      result = replay.run()
+    finally:
+      replay.close()
+    assert result['graunches'] == 1
+    assert result['neutral presses'] > 0
+    assert result['final state'] == 'neutral'
+    # Only the press straight from the tick is timed, not the timers' repeats
+    assert replay.latency.stats()['neutral key']['count'] == 1
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
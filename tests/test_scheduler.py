@@ -0,0 +1,131 @@
+import threading
+import time
+import unittest
+
+import scheduler
+from scheduler import PeriodicThread, FrameSyncThread, clampRate, SKIP, CATCH_UP, \
+  MIN_RATE, MAX_RATE, DEFAULT_RATE
+
+class _Game(threading.Thread):
+  """ Bumps the telemetry version rate times a second, skipping some """
+  def __init__(self, rate, frames, skip=()):
+    threading.Thread.__init__(self)
+    self.rate = rate
+    self.frames = frames
+    self.skip = skip
+    self.version = 0
+
+  def run(self):
+    start = time.perf_counter()
+    for frame in range(1, self.frames + 1):
+      time.sleep(max(0, start + frame / self.rate - time.perf_counter()))
+      if frame not in self.skip:
+        self.version = frame   # versions in between are missed
+
+class Test_scheduler(unittest.TestCase):
+  def test_clampRate(self):
+    assert clampRate(None) == DEFAULT_RATE
+    assert clampRate(1) == MIN_RATE
+    assert clampRate(5000) == MAX_RATE
+    assert clampRate(250) == 250
+
+  def test_period_does_not_drift(self):
+    # The callback taking time mustn't stretch the period
+    thread = PeriodicThread(lambda: time.sleep(0.005), rate=100)
+    thread.start()
+    time.sleep(0.5)
+    thread.stop()
+    thread.join()
+    # sleep(0.01 + 0.005) per tick would only manage 33
+    assert 45 <= thread.stats.ticks + thread.stats.skipped <= 52, str(thread.stats)
+
+  def test_first_tick_straight_away(self):
+    ticked = []
+    thread = PeriodicThread(lambda: ticked.append(time.perf_counter()), rate=MIN_RATE)
+    start = time.perf_counter()
+    thread.start()
+    time.sleep(0.05)
+    thread.stop()
+    thread.join()
+    # Not a whole period (100 mS) late
+    assert ticked and ticked[0] - start < 0.05
+
+  def test_overrun_skip(self):
+    thread = PeriodicThread(lambda: time.sleep(0.025), rate=100, policy=SKIP)
+    thread.start()
+    time.sleep(0.3)
+    thread.stop()
+    thread.join()
+    assert thread.stats.overruns > 0
+    assert thread.stats.skipped > 0
+
+  def test_overrun_catch_up(self):
+    calls = []
+    def callback():
+      calls.append(1)
+      if len(calls) == 1:
+        time.sleep(0.035)
+    thread = PeriodicThread(callback, rate=100, policy=CATCH_UP)
+    thread.start()
+    time.sleep(0.3)
+    thread.stop()
+    thread.join()
+    assert thread.stats.overruns == 1
+    assert thread.stats.skipped == 0
+
+  def test_frame_sync(self):
+    game = _Game(rate=50, frames=25, skip=(10, 11))
+    seen = []
+    thread = FrameSyncThread(lambda: seen.append(game.version), lambda: game.version,
+                             staleTimeout=0.1)
+    thread.start()
+    game.start()
+    game.join()
+    time.sleep(0.05)
+    thread.stop()
+    thread.join()
+    stats = thread.stats
+    # Once a frame, never the same one twice
+    assert seen[0] == 0 and seen[-1] == 25
+    assert len(set(seen[1:])) == len(seen[1:]) == stats.framesSeen
+    assert stats.framesSeen + stats.framesMissed == 25, str(stats)
+    assert stats.framesMissed >= 2
+    assert 30 < stats.summary()['frame rate'] < 70, str(stats)
+
+  def test_frame_sync_stale(self):
+    # No frames: ticks every staleTimeout so Esc etc. are still noticed
+    ticks = []
+    thread = FrameSyncThread(lambda: ticks.append(1), lambda: 0, staleTimeout=0.02)
+    thread.start()
+    time.sleep(0.21)
+    thread.stop()
+    thread.join()
+    assert 8 <= thread.stats.staleTicks <= 11, str(thread.stats)
+    assert thread.stats.framesSeen == 0
+    assert len(ticks) == thread.stats.staleTicks + 1
+    # and doesn't keep polling in between
+    assert thread.stats.wastedPolls < 20 * thread.stats.staleTicks, str(thread.stats)
+
+  def test_fine_timer(self):
+    # timeBeginPeriod() / timeEndPeriod() in pairs, only for fast threads
+    calls = []
+    class _Winmm:
+      def timeBeginPeriod(self, ms):
+        calls.append(('begin', ms))
+      def timeEndPeriod(self, ms):
+        calls.append(('end', ms))
+    winmm = scheduler._winmm
+    scheduler._winmm = _Winmm
+    try:
+      for rate in (MIN_RATE, 500):
+        thread = PeriodicThread(lambda: None, rate=rate)
+        thread.start()
+        time.sleep(0.02)
+        thread.stop()
+        thread.join()
+    finally:
+      scheduler._winmm = winmm
+    assert calls == [('begin', 1), ('end', 1)]
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from blackBox import SAMPLES, packBlock, SAMPLE_COLUMNS
+from shiftAnalysis import findShifts, loadSession, summary
+from tests.recordings import recording
+
+class Test_shiftAnalysis(unittest.TestCase):
+  def setUp(self):
+    # 1st from neutral with the clutch, then 2nd without, at 10 Hz
+    self.samples = recording([(1, 0, 100), (0.5, 0, 0), (0.5, 1, 0), (2, 1, 100),
+                               (0.3, 0, 100), (2, 2, 100)])
+
+  def test_findShifts(self):
+    columns = {name: np.array(column) for name, column in self.samples.items()}
+    shifts = findShifts(columns)
+    assert list(shifts['toGear']) == [1, 2]
+    assert list(shifts['fromGear']) == [0, 1]
+    assert list(shifts['bitePointCrossed']) == [True, False]
+    assert abs(shifts['clutchDownTime'][0] - 1.0) < 1e-6
+    assert np.isnan(shifts['neutralTime'][0])
+    assert abs(shifts['neutralTime'][1] - 0.3) < 1e-6
+    assert summary(shifts)[0]['without clutch'] == 1
+
+  def test_vehicles_kept_apart(self):
+    columns = {name: np.concatenate((column, column))
+               for name, column in ((n, np.array(c)) for n, c in self.samples.items())}
+    n = len(self.samples['gear'])
+    columns['vehicle'] = np.repeat(np.array([7, 3], dtype=np.int32), n)
+    shifts = findShifts(columns)
+    assert len(shifts) == 4
+    assert sorted(summary(shifts)) == [3, 7]
+
+  def test_loadSession(self):
+    fd, path = tempfile.mkstemp(suffix='.gsbb')
+    with os.fdopen(fd, 'wb') as f:
+      block = [(name, self.samples[name]) for name, typecode in SAMPLE_COLUMNS]
+      f.write(packBlock(SAMPLES, block))
+      f.write(packBlock(SAMPLES, block))
+    columns = loadSession(path)
+    os.remove(path)
+    assert len(columns['gear']) == 2 * len(self.samples['gear'])
+    assert len(findShifts(columns)) == 4
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
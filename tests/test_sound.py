@@ -0,0 +1,119 @@
+import io
+import os
+import sys
+import threading
+import time
+import unittest
+import wave
+
+import sound
+
+WAV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   'Grind_default.wav')
+
+class _FakeWinsound:
+  """ PlaySound() from memory blocks like the real one until purged """
+  SND_MEMORY = 4
+  SND_NODEFAULT = 2
+  def __init__(self):
+    self.purged = threading.Event()
+    self.played = []
+  def PlaySound(self, sound_, flags):
+    if sound_ is None:
+      self.purged.set()
+      return
+    self.played.append(time.perf_counter())
+    self.purged.wait(0.2)
+    self.purged.clear()
+
+class _SlowStartWinsound(_FakeWinsound):
+  """ A purge before the sound has started is lost """
+  def __init__(self):
+    _FakeWinsound.__init__(self)
+    self.starting = threading.Event()
+    self.ended = []
+  def PlaySound(self, sound_, flags):
+    if sound_ is None:
+      self.purged.set()
+      return
+    self.starting.set()
+    time.sleep(0.02)
+    self.purged.clear()
+    self.played.append(time.perf_counter())
+    self.purged.wait(1.0)
+    self.purged.clear()
+    self.ended.append(time.perf_counter())
+
+class Test_sound(unittest.TestCase):
+  def test_loadWav(self):
+    s = sound.loadWav(WAV)
+    w = wave.open(WAV, 'rb')
+    assert s.nFrames() == w.getnframes()
+    assert s.rate == w.getframerate()
+    assert s.frames == w.readframes(w.getnframes())
+    w.close()
+    # The image played from memory is the same sound
+    w = wave.open(io.BytesIO(s.wavBytes()), 'rb')
+    assert w.readframes(w.getnframes()) == s.frames
+
+  def test_loadWav_missing_file(self):
+    assert sound.loadWav('no such file.wav') is None
+
+  def test_recording(self):
+    s = sound.loadWav(WAV)
+    r = sound.RecordingSound()
+    r.play(s)
+    r.play(s)   # still looping, not restarted
+    r.stop()
+    r.stop()
+    assert [action for _t, action, _name in r.events] == ['play', 'stop']
+
+  def test_winsound_loops_from_memory(self):
+    fake = _FakeWinsound()
+    sys.modules['winsound'] = fake
+    try:
+      player = sound.WinSound()
+    finally:
+      del sys.modules['winsound']
+    s = sound.loadWav(WAV)
+    start = time.perf_counter()
+    player.play(s)
+    time.sleep(0.05)
+    assert fake.played and fake.played[0] - start < 0.02  # started at once
+    player.stop()
+    time.sleep(0.05)
+    passes = len(fake.played)
+    time.sleep(0.3)
+    assert len(fake.played) == passes   # stopped
+    player.close()
+
+  def test_winsound_stop_before_the_pass_starts(self):
+    fake = _SlowStartWinsound()
+    sys.modules['winsound'] = fake
+    try:
+      player = sound.WinSound()
+    finally:
+      del sys.modules['winsound']
+    player.play(sound.loadWav(WAV))
+    fake.starting.wait(1.0)
+    start = time.perf_counter()
+    player.stop()     # before PlaySound() has started
+    assert len(fake.ended) == 1 and fake.ended[0] - start < 0.2  # not a whole pass
+    player.close()
+
+  def test_null_sound(self):
+    s = sound.newSound(sound.NONE)
+    s.play(sound.loadWav(WAV))
+    s.stop()
+    assert isinstance(s, sound.NullSound)
+
+  def test_unknown_or_missing_backend_is_silent(self):
+    assert isinstance(sound.newSound('no such backend'), sound.NullSound)
+    assert isinstance(sound.newSound(None), sound.NullSound)
+    try:
+      import winsound
+    except ImportError:
+      assert isinstance(sound.newSound(sound.WINSOUND), sound.NullSound)
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,22 @@
+import os
+import unittest
+
+from startupBenchmark import importTimes
+
+class Test_startupBenchmark(unittest.TestCase):
+  def test_importTimes(self):
+    times = importTimes('json', dict(os.environ))
+    names = [name for name, _self, _cumulative in times]
+    assert 'json' in names
+    # most expensive first
+    cumulative = [c for _name, _self, c in times]
+    assert cumulative == sorted(cumulative, reverse=True)
+
+  def test_scheduler_without_asyncio(self):
+    # the runtime names don't pull in asyncio
+    names = [name for name, _self, _c in importTimes('scheduler', dict(os.environ))]
+    assert 'scheduler' in names
+    assert 'asyncio' not in names
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,72 @@
+import unittest
+
+from stateMachine import GearStateMachine, transitionTable, \
+  CLUTCH_DISENGAGE, CLUTCH_ENGAGE, GEAR_SELECT, GEAR_DESELECT, \
+  GRAUNCH_TIMEOUT, STOP, N_STATES, N_EVENTS, GRAUNCH_STOP
+
+class _graunch:
+  def __init__(self):
+    self.log = []
+  def graunchStart(self):
+    self.log.append('start')
+  def graunchStop(self):
+    self.log.append('stop')
+
+class Test_stateMachine(unittest.TestCase):
+  def setUp(self):
+    self.graunch_o = _graunch()
+    self.keys = []
+    self.sm = GearStateMachine(self.graunch_o, debug=1,
+                               pressKey=self.keys.append,
+                               msgBox=lambda text: None)
+
+  def test_table_complete(self):
+    table = transitionTable()
+    assert len(table) == N_STATES * N_EVENTS
+    for state in range(N_STATES):
+      assert table[state * N_EVENTS + STOP][1][0] == (GRAUNCH_STOP,)
+
+  def test_good_change(self):
+    for event in [CLUTCH_DISENGAGE, GEAR_SELECT, CLUTCH_ENGAGE]:
+      self.sm.dispatch(event)
+    assert self.sm.stateName() == 'inGear'
+    assert 'start' not in self.graunch_o.log
+    assert self.keys == ['DIK_D']
+
+  def test_graunch_then_neutral(self):
+    self.sm.dispatch(GEAR_SELECT)   # no clutch
+    assert self.sm.stateName() == 'graunching'
+    assert self.graunch_o.log == ['start']
+    self.sm.dispatch(GEAR_DESELECT) # the neutral key
+    assert self.sm.stateName() == 'neutralKeySent'
+    self.sm.dispatch(GRAUNCH_TIMEOUT)
+    assert self.sm.stateName() == 'neutral'
+    assert self.graunch_o.log[-1] == 'stop'
+
+  def test_graunch_reshift(self):
+    self.sm.dispatch(GEAR_SELECT)
+    self.sm.dispatch(CLUTCH_DISENGAGE)
+    assert self.sm.stateName() == 'graunchingClutchDown'
+    assert self.keys == ['DIK_G']
+
+  def test_graunch_no_reshift(self):
+    sm = GearStateMachine(self.graunch_o, reshift=False, debug=1,
+                          pressKey=self.keys.append)
+    sm.dispatch(GEAR_SELECT)
+    sm.dispatch(CLUTCH_DISENGAGE)
+    assert sm.stateName() == 'clutchDownGearSelected'
+    assert self.keys == ['DIK_R', 'DIK_G']
+
+  def test_double_declutch(self):
+    sm = GearStateMachine(self.graunch_o, doubleDeclutch=True)
+    for event in [CLUTCH_DISENGAGE, GEAR_SELECT, GEAR_DESELECT]:
+      sm.dispatch(event)
+    assert sm.stateName() == 'waitForDoubleDeclutchUp'
+
+  def test_instances_independent(self):
+    other = GearStateMachine(_graunch())
+    self.sm.dispatch(GEAR_SELECT)
+    assert other.stateName() == 'neutral'
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,77 @@
+import unittest
+
+from telemetrySnapshot import SnapshotReader, MAX_RETRIES
+
+class _Vec3:
+  x = 3.0
+  y = 0.0
+  z = -4.0
+
+class _Vehicle:
+  mGear = 2
+  mUnfilteredClutch = 0.25
+  mEngineRPM = 5000.0
+  mClutchRPM = 4800.0
+  mElapsedTime = 12.5
+  mMaxGears = 6
+  mEngineMaxRPM = 8000.0
+  mLocalVel = _Vec3()
+
+class _Scoring:
+  mControl = 0
+
+class _Tele:
+  """ mVersionUpdateBegin moves on each time it's read until torn is 0 """
+  def __init__(self, torn):
+    self.torn = torn
+    self.mVersionUpdateEnd = 7
+  @property
+  def mVersionUpdateBegin(self):
+    if self.torn:
+      self.torn -= 1
+      return self.mVersionUpdateEnd + 1
+    return self.mVersionUpdateEnd
+
+class _Info:
+  def __init__(self, torn=0):
+    self.Rf2Tele = _Tele(torn)
+    self.telemetryReads = 0
+  def playersVehicleTelemetry(self):
+    self.telemetryReads += 1
+    return _Vehicle()
+  def playersVehicleScoring(self):
+    return _Scoring()
+
+class Test_telemetrySnapshot(unittest.TestCase):
+  def test_read(self):
+    info = _Info()
+    snapshot = SnapshotReader(info).read()
+    assert info.telemetryReads == 1
+    assert snapshot.gear == 2
+    assert snapshot.clutch == 75
+    assert snapshot.speed == 5.0
+    assert snapshot.version == 7
+    assert snapshot.consistent
+
+  def test_torn_read_retried(self):
+    info = _Info(torn=1)
+    snapshot = SnapshotReader(info).read()
+    assert info.telemetryReads == 2
+    assert snapshot.consistent
+
+  def test_torn_read_gives_up(self):
+    info = _Info(torn=MAX_RETRIES)
+    reader = SnapshotReader(info)
+    snapshot = reader.read()
+    assert not snapshot.consistent
+    assert reader.tornReads == 1
+
+  def test_read_into(self):
+    reader = SnapshotReader(_Info(torn=MAX_RETRIES))
+    snapshot = reader.read()
+    reader.info = _Info()
+    assert reader.read(snapshot) is snapshot
+    assert snapshot.consistent
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
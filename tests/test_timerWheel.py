@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+
+from timerWheel import TimerService, VirtualTimerService
+
+class Test_timerWheel(unittest.TestCase):
+  def setUp(self):
+    self.timers = TimerService()
+    self.fired = []
+
+  def tearDown(self):
+    self.timers.stop()
+
+  def test_fires_in_order(self):
+    self.timers.schedule(0.06, lambda: self.fired.append('b'))
+    self.timers.schedule(0.02, lambda: self.fired.append('a'))
+    time.sleep(0.15)
+    assert self.fired == ['a', 'b']
+
+  def test_cancel(self):
+    handle = self.timers.schedule(0.02, lambda: self.fired.append('x'))
+    handle.cancel()
+    time.sleep(0.06)
+    assert self.fired == []
+    assert not handle.pending()
+
+  def test_coalesced_in_one_slot(self):
+    for i in range(3):
+      self.timers.schedule(0.02, lambda i=i: self.fired.append(i))
+    # (unless they straddle a slot boundary)
+    assert len(self.timers._heap) <= 2
+    assert self.timers.pending() == 3
+    time.sleep(0.06)
+    assert self.fired == [0, 1, 2]
+    assert self.timers.pending() == 0
+
+  def test_one_thread(self):
+    threads = threading.active_count()
+    for i in range(20):
+      self.timers.schedule(0.001 * i, lambda: None)
+    assert threading.active_count() == threads + 1
+
+class Test_VirtualTimerService(unittest.TestCase):
+  def test_virtual_time(self):
+    timers = VirtualTimerService()
+    fired = []
+    def first():
+      fired.append(('first', timers.now()))
+      timers.schedule(0.02, lambda: fired.append(('second', timers.now())))
+    timers.schedule(3.0, first)
+    timers.schedule(1.0, lambda: fired.append(('cancelled', 0))).cancel()
+    timers.advanceTo(2.0)
+    assert fired == []
+    timers.advanceTo(3.5)   # no waiting
+    assert fired == [('first', 3.0), ('second', 3.02)]
+    assert timers.now() == 3.5
+
+if __name__ == '__main__':
+  unittest.main(exit=False)
@@ -0,0 +1,144 @@
+# One thread for all the timers.
+#
+# threading.Timer starts a new OS thread for every timer; graunching sets
+# three timers every 40 mS.  Here all timers are kept in a heap of time
+# slots served by a single thread.  Timers due in the same slot are
+# coalesced into one wake-up, and every timer can be cancelled.
+
+import heapq
+import math
+import time
+from threading import Thread, Condition, current_thread
+
+RESOLUTION = 0.005  # seconds, the width of a slot
+
+class TimerHandle:
+  """ Returned by TimerService.schedule(), cancel() stops it firing """
+  __slots__ = ('callback', 'cancelled', 'fired')
+
+  def __init__(self, callback):
+    self.callback = callback
+    self.cancelled = False
+    self.fired = False
+
+  def cancel(self):
+    self.cancelled = True
+
+  def pending(self):
+    return not (self.cancelled or self.fired)
+
+class TimerService:
+  """
+  Call a function after a delay.  The thread is started by the first
+  schedule()
+  """
+  def __init__(self, resolution=RESOLUTION):
+    self.resolution = resolution
+    self._cond = Condition()
+    self._heap = []     # slot numbers, each one once
+    self._slots = {}    # slot number: [TimerHandle, ...]
+    self._thread = None
+
+  def now(self):
+    return time.perf_counter()
+
+  def schedule(self, delay, callback):
+    """ Call callback in delay seconds, return a TimerHandle """
+    handle = TimerHandle(callback)
+    slot = math.ceil((self.now() + delay) / self.resolution)
+    with self._cond:
+      bucket = self._slots.get(slot)
+      if bucket is None:
+        self._slots[slot] = [handle]
+        heapq.heappush(self._heap, slot)
+        if self._heap[0] == slot:
+          self._cond.notify()   # new earliest slot
+      else:
+        bucket.append(handle)
+      if self._thread is None:
+        self._thread = Thread(target=self._run, name='TimerService', daemon=True)
+        self._thread.start()
+    return handle
+
+  def pending(self):
+    """ Number of timers that have not fired or been cancelled """
+    with self._cond:
+      return sum(handle.pending()
+                 for bucket in self._slots.values()
+                 for handle in bucket)
+
+  def _run(self):
+    cond = self._cond
+    me = current_thread()
+    with cond:
+      while self._thread is me:  # until stop()
+        if not self._heap:
+          cond.wait()
+          continue
+        slot = self._heap[0]
+        wait = slot * self.resolution - self.now()
+        if wait > 0:
+          cond.wait(wait)
+          continue
+        heapq.heappop(self._heap)
+        handles = self._slots.pop(slot)
+        cond.release()
+        try:
+          for handle in handles:
+            if not handle.cancelled:
+              handle.fired = True
+              try:
+                handle.callback()
+              except Exception as e:
+                print('Timer callback %s failed: %s' % (handle.callback, e))
+        finally:
+          cond.acquire()
+
+  def stop(self):
+    """ Stop the thread, pending timers are dropped """
+    with self._cond:
+      self._heap = []
+      self._slots = {}
+      self._cond.notify()
+      thread = self._thread
+      self._thread = None
+    if thread and thread is not current_thread():
+      thread.join()
+
+class VirtualTimerService:
+  """
+  The same interface as TimerService but on a virtual clock that only
+  moves when advanceTo() is called, firing the timers that fall due.
+  For replaying recordings faster than real time.
+  """
+  def __init__(self):
+    self._now = 0.0
+    self._heap = []     # (due, sequence, TimerHandle)
+    self._sequence = 0  # keeps timers due at the same time in order
+
+  def now(self):
+    return self._now
+
+  def schedule(self, delay, callback):
+    handle = TimerHandle(callback)
+    self._sequence += 1
+    heapq.heappush(self._heap, (self._now + delay, self._sequence, handle))
+    return handle
+
+  def pending(self):
+    return sum(handle.pending() for _due, _s, handle in self._heap)
+
+  def advanceTo(self, t):
+    """ Move the clock on to t, firing timers in time order on the way """
+    heap = self._heap
+    while heap and heap[0][0] <= t:
+      due, _s, handle = heapq.heappop(heap)
+      if not handle.cancelled:
+        self._now = due
+        handle.fired = True
+        handle.callback()
+    if t > self._now:
+      self._now = t
+
+  def stop(self):
+    self._heap = []